@@ -1,3 +1,30 @@
 from django.contrib import admin
+from .models import Crop, Resource, ResourceMovement, Activity, Notification
 
-# Register your models here.
+# __str__ on these models follows the user/crop foreign keys, so every
+# changelist joins them up front instead of issuing one lookup per row.
+
+@admin.register(Crop)
+class CropAdmin(admin.ModelAdmin):
+    list_display = ['name', 'variety', 'user', 'planting_date', 'harvest_date', 'status']
+    list_select_related = ['user']
+
+@admin.register(Resource)
+class ResourceAdmin(admin.ModelAdmin):
+    list_display = ['name', 'quantity', 'unit', 'type', 'usage_status', 'user']
+    list_select_related = ['user']
+
+@admin.register(Activity)
+class ActivityAdmin(admin.ModelAdmin):
+    list_display = ['description', 'date', 'crop', 'user']
+    list_select_related = ['crop__user', 'user']
+
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ['message', 'type', 'is_read', 'created_at', 'crop', 'user']
+    list_select_related = ['crop__user', 'user']
+
+@admin.register(ResourceMovement)
+class ResourceMovementAdmin(admin.ModelAdmin):
+    list_display = ['resource', 'kind', 'delta', 'occurred_on', 'note', 'user']
+    list_select_related = ['resource__user', 'user']
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+
+from .models import Notification
+
+
+def alert_window(today=None, days=None):
+    """Return the (today, threshold) date range that due-date alerts cover."""
+    today = today or datetime.now().date()
+    if days is None:
+        days = getattr(settings, 'NOTIFICATION_LEAD_DAYS', 7)
+    return today, today + timedelta(days=days)
+
+
+def already_sent(alerts):
+    """The ``(user_id, dedupe_key)`` pairs of ``alerts`` that exist already.
+
+    Read notifications count too: an alert the user has seen is not sent
+    again. Both the outbox and the nightly scan go by this rule.
+    """
+    if not alerts:
+        return set()
+    return set(
+        Notification.objects.filter(
+            user_id__in={alert.user_id for alert in alerts},
+            dedupe_key__in=[alert.dedupe_key for alert in alerts],
+        ).values_list('user_id', 'dedupe_key')
+    )
+
+
+def harvest_message(name, variety, harvest_date, today):
+    days_until_harvest = (harvest_date - today).days
+    return f"Your crop {name} ({variety}) is due for harvest in {days_until_harvest} day(s) on {harvest_date}."
+
+
+def activity_message(description, crop_name, date, today):
+    days_until_due = (date - today).days
+    return f"Activity '{description}' for {crop_name} is due in {days_until_due} day(s) on {date}."
+
+
+def harvest_alert(crop_id, user_id, name, variety, harvest_date, today):
+    return Notification(
+        user_id=user_id,
+        crop_id=crop_id,
+        message=harvest_message(name, variety, harvest_date, today),
+        type='ALERT',
+        dedupe_key=Notification.make_dedupe_key('harvest', crop_id, harvest_date),
+    )
+
+
+def activity_alert(activity_id, user_id, description, date, crop_id, crop_name, today):
+    return Notification(
+        user_id=user_id,
+        crop_id=crop_id,
+        message=activity_message(description, crop_name or "No crop", date, today),
+        type='ALERT',
+        dedupe_key=Notification.make_dedupe_key('activity', activity_id, date),
+    )
@@ -0,0 +1,241 @@
+from collections import Counter
+from datetime import date, timedelta
+
+from django.db import IntegrityError
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth, TruncWeek, TruncYear
+
+from . import sharding
+from .models import Crop, Resource, ResourceMovement, Activity, AnalyticsRollup
+
+
+class InvalidAnalytics(Exception):
+    pass
+
+
+def week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+# A rollup key is (metric, period_start, subject_id, name, status)
+
+def _crop_keys(crop):
+    return [
+        ('planted', month_start(crop.planting_date), 0, crop.name, crop.status),
+        ('harvested', month_start(crop.harvest_date), 0, crop.name, crop.status),
+    ]
+
+
+def _activity_keys(activity):
+    # Weeks straddle months, so monthly counts get their own buckets
+    return [
+        ('activities_weekly', week_start(activity.date), activity.crop_id, '', ''),
+        ('activities_monthly', month_start(activity.date), activity.crop_id, '', ''),
+    ]
+
+
+KEYS = {Crop: _crop_keys, Activity: _activity_keys}
+
+
+def keys_for(instance):
+    return KEYS[type(instance)](instance)
+
+
+def stored_keys(model, pk):
+    """Keys of a row as currently stored, read before a save overwrites it."""
+    instance = model.objects.filter(pk=pk).first()
+    return keys_for(instance) if instance else []
+
+
+def apply(user_id, deltas):
+    """Add ``{key: delta}`` to the user's rollups.
+
+    Each key is one ``UPDATE ... SET value = value + delta``. Missing rows
+    are only created for increments, so decrements that run during a
+    user-delete cascade never write. Keys are applied in sorted order so
+    concurrent writers lock rows in the same order.
+    """
+    for key in sorted(deltas):
+        delta = deltas[key]
+        if not delta:
+            continue
+        metric, period_start, subject_id, name, status = key
+        fields = {
+            'user_id': user_id, 'metric': metric, 'period_start': period_start,
+            'subject_id': subject_id, 'name': name, 'status': status,
+        }
+        rows = AnalyticsRollup.objects.filter(**fields)
+        if rows.update(value=F('value') + delta) or delta < 0:
+            continue
+        try:
+            with sharding.atomic():
+                AnalyticsRollup.objects.create(value=delta, **fields)
+        except IntegrityError:
+            # Another writer created the row first
+            rows.update(value=F('value') + delta)
+
+
+def move(user_id, old_keys, new_keys):
+    """Move one row's counts from its old buckets to its new ones."""
+    deltas = Counter(new_keys)
+    deltas.subtract(old_keys)
+    apply(user_id, deltas)
+
+
+def count_created(objects):
+    """Count bulk-inserted crops or activities; other models are ignored."""
+    by_user = {}
+    for obj in objects:
+        if type(obj) in KEYS:
+            by_user.setdefault(obj.user_id, Counter()).update(keys_for(obj))
+    for user_id, deltas in by_user.items():
+        apply(user_id, deltas)
+
+
+def count_movements(user_id, entries):
+    deltas = Counter()
+    for entry in entries:
+        if entry.kind == 'consumption':
+            deltas[('consumed', month_start(entry.occurred_on), entry.resource_id, '', '')] -= entry.delta
+        elif entry.kind == 'restock':
+            deltas[('restocked', month_start(entry.occurred_on), entry.resource_id, '', '')] += entry.delta
+    apply(user_id, deltas)
+
+
+def _aggregate(metric):
+    """The raw-table GROUP BY that ``metric`` pre-computes."""
+    if metric.startswith('activities_'):
+        truncate = TruncWeek if metric == 'activities_weekly' else TruncMonth
+        return Activity.objects.values('user_id', period=truncate('date'), subject=F('crop_id')).annotate(total=Count('id'))
+    if metric in ('planted', 'harvested'):
+        field = 'planting_date' if metric == 'planted' else 'harvest_date'
+        return Crop.objects.values('user_id', 'name', 'status', period=TruncMonth(field)).annotate(total=Count('id'))
+    kind, sign = ('consumption', -1) if metric == 'consumed' else ('restock', 1)
+    return (
+        ResourceMovement.objects.filter(kind=kind)
+        .values('user_id', period=TruncMonth('occurred_on'), subject=F('resource_id'))
+        .annotate(total=Sum('delta') * sign)
+    )
+
+
+def rebuild(user_ids, metrics=None, batch_size=5000):
+    """Recompute the rollups of ``user_ids`` from the raw tables.
+
+    Used by ``rebuild_rollups``. Returns the number of rollup rows written.
+    """
+    metrics = metrics or [metric for metric, _ in AnalyticsRollup.METRIC_CHOICES]
+    rows = []
+    with sharding.atomic():
+        AnalyticsRollup.objects.filter(user_id__in=user_ids, metric__in=metrics).delete()
+        for metric in metrics:
+            for row in _aggregate(metric).filter(user_id__in=user_ids).order_by().iterator():
+                rows.append(AnalyticsRollup(
+                    user_id=row['user_id'], metric=metric, period_start=row['period'],
+                    subject_id=row.get('subject', 0), name=row.get('name', ''),
+                    status=row.get('status', ''), value=row['total'],
+                ))
+        AnalyticsRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+PERIODS = {'week': week_start, 'month': month_start, 'year': lambda day: day.replace(month=1, day=1)}
+TRUNCATE = {'week': F, 'month': TruncMonth, 'year': TruncYear}
+
+
+def _period(params, periods):
+    period = params.get('period', periods[0])
+    if period not in periods:
+        raise InvalidAnalytics(f"period must be one of {', '.join(periods)}")
+    return period
+
+
+def _series(user, metrics, params, group_by, period, stored):
+    """Sum a user's rollups, stored per ``stored`` period, per ``period`` and ``group_by``.
+
+    ``start``/``end`` select the stored periods containing those dates, so
+    the query reads only the rollup rows in range.
+    """
+    rows = AnalyticsRollup.objects.filter(user=user, metric__in=metrics).exclude(value=0)
+    try:
+        if params.get('start'):
+            rows = rows.filter(period_start__gte=PERIODS[stored](date.fromisoformat(params['start'])))
+        if params.get('end'):
+            rows = rows.filter(period_start__lte=date.fromisoformat(params['end']))
+    except ValueError:
+        raise InvalidAnalytics('start and end must be dates in YYYY-MM-DD format')
+    return list(
+        rows.values(*group_by, period=TRUNCATE[period]('period_start'))
+        .annotate(total=Sum('value'))
+        .order_by('period', *group_by)
+    )
+
+
+def activity_series(user, params):
+    """Activities per crop per week, month or year."""
+    period = _period(params, ['week', 'month', 'year'])
+    stored = 'week' if period == 'week' else 'month'
+    rows = _series(user, [f'activities_{stored}ly'], params, ['subject_id'], period, stored)
+    names = dict(
+        Crop.objects.filter(user=user, pk__in={row['subject_id'] for row in rows}).values_list('pk', 'name')
+    )
+    return [
+        {'period': row['period'], 'crop_id': row['subject_id'], 'crop': names.get(row['subject_id']), 'count': int(row['total'])}
+        for row in rows
+    ]
+
+
+def crop_series(user, params):
+    """Crops per month or year of ``?date=planting`` (default) or ``harvest``.
+
+    ``?group_by=`` takes ``name``, ``status`` or both, comma separated.
+    """
+    metric = {'planting': 'planted', 'harvest': 'harvested'}.get(params.get('date', 'planting'))
+    if metric is None:
+        raise InvalidAnalytics('date must be planting or harvest')
+    group_by = [field for field in params.get('group_by', 'name').split(',') if field]
+    if not group_by or not set(group_by) <= {'name', 'status'}:
+        raise InvalidAnalytics('group_by must be name, status or name,status')
+    rows = _series(user, [metric], params, group_by, _period(params, ['month', 'year']), 'month')
+    return [
+        {'period': row['period'], **{field: row[field] for field in group_by}, 'count': int(row['total'])}
+        for row in rows
+    ]
+
+
+def resource_series(user, params):
+    """Consumption and restocks per resource per month or year."""
+    period = _period(params, ['month', 'year'])
+    rows = _series(user, ['consumed', 'restocked'], params, ['subject_id', 'metric'], period, 'month')
+    resources = {
+        pk: (name, unit)
+        for pk, name, unit in Resource.objects.filter(user=user, pk__in={row['subject_id'] for row in rows})
+        .values_list('pk', 'name', 'unit')
+    }
+    results = {}
+    for row in rows:
+        key = (row['period'], row['subject_id'])
+        if key not in results:
+            name, unit = resources.get(row['subject_id'], (None, None))
+            results[key] = {
+                'period': row['period'], 'resource_id': row['subject_id'], 'resource': name,
+                'unit': unit, 'consumed': 0.0, 'restocked': 0.0,
+            }
+        results[key][row['metric']] = row['total']
+    return list(results.values())
+
+
+KINDS = {
+    'activities': activity_series,
+    'crops': crop_series,
+    'resources': resource_series,
+}
+
+
+def series(user, kind, params):
+    if kind not in KINDS:
+        raise InvalidAnalytics(f"Unknown analytics kind '{kind}', expected one of {', '.join(KINDS)}")
+    return KINDS[kind](user, params)
@@ -0,0 +1,185 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.views import exception_handler
+
+from . import lifecycle, response_cache
+from .authentication import CachedTokenAuthentication
+from .conditional import add_validators, validators
+from .models import NotificationCounter, CollectionVersion
+from .routing import allow_replica_reads
+from .views import CropListCreate, ResourceListCreate, ActivityListCreate, NotificationList
+
+# Async versions of the hot read endpoints for ASGI deployments. Auth,
+# version lookups and counters use the async ORM on the event loop; the
+# list query and serializers, which DRF only offers synchronously, run on
+# a bounded pool of ASYNC_DB_WORKERS threads. Each pool thread keeps its
+# own connection, so the pool size also caps the connections these views
+# hold however many requests are waiting.
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DB_WORKERS, thread_name_prefix='api-db')
+    return _executor
+
+
+def _in_worker(func):
+    def run(*args):
+        # Pool threads see no request_started/finished signals, so apply
+        # CONN_MAX_AGE and CONN_HEALTH_CHECKS around each job instead
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return run
+
+
+async def run_blocking(func, *args):
+    """Run ``func`` on the bounded pool, or on the request's thread with ASYNC_DB_WORKERS=0."""
+    if not getattr(settings, 'ASYNC_DB_WORKERS', 0):
+        return await sync_to_async(func)(*args)
+    return await sync_to_async(_in_worker(func), thread_sensitive=False, executor=executor())(*args)
+
+
+async def authenticate(request, query_token=False):
+    """Token auth for the async endpoints.
+
+    Reads ``Authorization: Token <key>``, or ``?token=`` with
+    ``query_token`` because browser EventSource connections cannot set
+    headers. Sets ``request.user`` for the middleware on the way out.
+    """
+    header = request.headers.get('Authorization', '')
+    key = header[6:].strip() if header.startswith('Token ') else None
+    if not key and query_token:
+        key = request.GET.get('token')
+    if not key:
+        return None
+    try:
+        user, _ = await CachedTokenAuthentication().aauthenticate_credentials(key)
+    except AuthenticationFailed:
+        return None
+    request.user = user
+    return user
+
+
+def unauthorized():
+    return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+
+def _json(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def _page(view_class, request, user):
+    """``(status, data)`` of one list page, rendered by the DRF view's own machinery."""
+    view = view_class()
+    view.setup(request)
+    view.format_kwarg = None
+    view.request = view.initialize_request(request)
+    view.request.user = user
+    allow_replica_reads(view.request)
+    try:
+        page = view.paginate_queryset(view.filter_queryset(view.get_queryset()))
+        return 200, view.get_paginated_response(view.get_serializer(page, many=True).data).data
+    except APIException as exc:
+        response = exception_handler(exc, {'view': view, 'request': view.request})
+        return response.status_code, response.data
+
+
+async def _list(request, view_class, before=None):
+    """Async ``ConditionalGetMixin.get`` for a list view.
+
+    ``before(user_id)`` runs once the user is known, like ``initial`` in
+    the DRF view.
+    """
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    if before:
+        await before(user.pk)
+    collection = view_class.version_collection
+    version, modified = await CollectionVersion.acurrent(user.pk, collection)
+    digest, etag, last_modified = validators(request, user.pk, collection, version, modified)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None and response_cache.enabled():
+        data = await response_cache.aget(digest)
+        if data is not None:
+            response = _json(data)
+            response['X-Cache'] = 'HIT'
+    if response is None:
+        status, data = await run_blocking(_page, view_class, request, user)
+        if status != 200:
+            return _json(data, status)
+        response = _json(data)
+        if response_cache.enabled():
+            await response_cache.astore(digest, data)
+            response['X-Cache'] = 'MISS'
+    return add_validators(response, etag, last_modified)
+
+
+@require_safe
+async def crop_list(request):
+    return await _list(request, CropListCreate, lifecycle.aensure_current)
+
+
+@require_safe
+async def resource_list(request):
+    return await _list(request, ResourceListCreate)
+
+
+@require_safe
+async def activity_list(request):
+    return await _list(request, ActivityListCreate)
+
+
+@require_safe
+async def notification_list(request):
+    return await _list(request, NotificationList)
+
+
+@require_safe
+async def user_info(request):
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    return JsonResponse({'username': user.username, 'email': user.email})
+
+
+@require_safe
+async def notification_unread_count(request):
+    user = await authenticate(request)
+    if user is None:
+        return unauthorized()
+    return JsonResponse({'unread': await NotificationCounter.aunread_for(user.pk)})
+
+
+def read_view(sync_view, async_view):
+    """The view to route: ``sync_view`` unless ASYNC_READ_VIEWS is on.
+
+    With it on, GET and HEAD go to ``async_view`` and every other method
+    still reaches the DRF view, on the request's thread.
+    """
+    if not getattr(settings, 'ASYNC_READ_VIEWS', False):
+        return sync_view
+    fallback = sync_to_async(sync_view)
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return await async_view(request, *args, **kwargs)
+        return await fallback(request, *args, **kwargs)
+    return view
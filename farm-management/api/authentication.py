@@ -0,0 +1,93 @@
+import hashlib
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from . import sharding
+
+CACHE_ALIAS = 'auth'
+# What requests read from request.user. The password hash and the other
+# columns stay in the database, since the cache may be a shared backend.
+# In model order, as from_db expects.
+FIELDS = ('id', 'is_superuser', 'username', 'email', 'is_staff', 'is_active')
+
+
+def _cache_key(key):
+    # Hash the token so raw credentials never become keys in a shared cache
+    return 'token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def _entry(user):
+    return [getattr(user, field) for field in FIELDS]
+
+
+def _user(entry):
+    # The other fields are deferred: read on access, and left alone by save()
+    return None if entry is None else User.from_db(DEFAULT_DB_ALIAS, FIELDS, entry)
+
+
+def cached_user(key):
+    return _user(caches[CACHE_ALIAS].get(_cache_key(key)))
+
+
+def remember(key, user):
+    caches[CACHE_ALIAS].set(_cache_key(key), _entry(user))
+
+
+async def acached_user(key):
+    return _user(await caches[CACHE_ALIAS].aget(_cache_key(key)))
+
+
+async def aremember(key, user):
+    await caches[CACHE_ALIAS].aset(_cache_key(key), _entry(user))
+
+
+def forget(key):
+    caches[CACHE_ALIAS].delete(_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` that skips the token/user query on repeat calls.
+
+    The ``FIELDS`` of resolved active users are kept in the ``auth`` cache
+    for ``AUTH_TOKEN_CACHE_TIMEOUT`` seconds. Deleting a token or saving its
+    user (deactivation, password change, profile edits) evicts the entry
+    through signals. Writes that bypass signals, such as
+    ``User.objects.update()``, are only picked up when the entry expires.
+    With several worker processes use a shared cache backend so that an
+    eviction reaches every worker. Once the user is known, the rest of the
+    request is routed to their shard (see ``api.sharding``).
+    """
+
+    def authenticate_credentials(self, key):
+        user = cached_user(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            remember(key, user)
+        else:
+            token = self.get_model()(key=key, user_id=user.pk)
+            token.user = user
+        sharding.activate(user.pk)
+        return user, token
+
+    async def aauthenticate_credentials(self, key):
+        """Async ``authenticate_credentials`` for async views, on the async ORM."""
+        user = await acached_user(key)
+        if user is None:
+            try:
+                token = await self.get_model().objects.select_related('user').aget(key=key)
+            except self.get_model().DoesNotExist:
+                raise AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise AuthenticationFailed(_('User inactive or deleted.'))
+            await aremember(key, token.user)
+            user = token.user
+        else:
+            token = self.get_model()(key=key, user_id=user.pk)
+            token.user = user
+        await sharding.aactivate(user.pk)
+        return user, token
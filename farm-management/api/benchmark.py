@@ -0,0 +1,245 @@
+import asyncio
+import io
+import json
+import math
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Min
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from . import sharding
+from .models import Crop, Resource, Activity, Notification
+
+# Routes in api/urls.py the suite cannot drive, with the reason recorded
+# in the results file.
+SKIPPED = {
+    'notification-stream': 'holds the connection open for NOTIFICATION_STREAM_SECONDS',
+    'cache-stats': 'admin only',
+    'metrics': 'admin only',
+}
+
+
+def _upload(fixture, i):
+    data = io.BytesIO(f'name,quantity,type,unit\nBench seed {i},{i % 50},Seeds,kgs\n'.encode())
+    data.name = 'resources.csv'
+    return reverse('import', args=['resources']), {'data': {'file': data}, 'format': 'multipart'}
+
+
+# name -> (method, request builder). Builders take the user's fixture and
+# the request number and return (path, extra client kwargs).
+ENDPOINTS = {
+    'user-info': ('get', lambda f, i: (reverse('user-info'), {})),
+    'dashboard': ('get', lambda f, i: (reverse('dashboard'), {})),
+    'register': ('post', lambda f, i: (reverse('register'), {'data': {
+        'username': f'bench-{uuid.uuid4().hex[:16]}', 'password': 'bench-pass', 'confirm_password': 'bench-pass',
+    }})),
+    'login': ('post', lambda f, i: (reverse('login'), {'data': {'username': f['username'], 'password': f['password']}})),
+    'crop-list': ('get', lambda f, i: (reverse('crop-list-create'), {})),
+    'crop-create': ('post', lambda f, i: (reverse('crop-list-create'), {'data': {
+        'name': 'Maize', 'variety': 'H614', 'planting_date': '2025-03-01', 'harvest_date': '2025-07-01',
+    }})),
+    'crop-detail': ('get', lambda f, i: (reverse('crop-detail', args=[f['crop']]), {})),
+    'crop-bulk': ('patch', lambda f, i: (reverse('crop-bulk'), {'data': [{'id': f['crop'], 'status': 'Growing'}]})),
+    'resource-list': ('get', lambda f, i: (reverse('resource-list-create'), {})),
+    'resource-detail': ('get', lambda f, i: (reverse('resource-detail', args=[f['resource']]), {})),
+    'resource-bulk': ('patch', lambda f, i: (reverse('resource-bulk'), {'data': [{'id': f['resource'], 'quantity': i % 100}]})),
+    'resource-movements': ('post', lambda f, i: (reverse('resource-movements'), {'data': [
+        {'resource': f['resource'], 'kind': 'restock', 'quantity': 2},
+        {'resource': f['resource'], 'kind': 'consumption', 'quantity': 1},
+    ]})),
+    'resource-balances': ('get', lambda f, i: (reverse('resource-balances') + '?as_of=2025-01-01', {})),
+    'activity-list': ('get', lambda f, i: (reverse('activity-list-create'), {})),
+    'activity-detail': ('get', lambda f, i: (reverse('activity-detail', args=[f['activity']]), {})),
+    'activity-bulk': ('patch', lambda f, i: (reverse('activity-bulk'), {'data': [{'id': f['activity'], 'description': 'Weeding'}]})),
+    'notification-list': ('get', lambda f, i: (reverse('notification-list'), {})),
+    'notification-poll': ('get', lambda f, i: (reverse('notification-poll') + '?timeout=0', {})),
+    'notification-mark-read': ('post', lambda f, i: (reverse('notification-mark-read', args=[f['notification']]), {})),
+    'notification-bulk-mark-read': ('post', lambda f, i: (reverse('notification-bulk-mark-read'), {'data': {'ids': [f['notification']]}})),
+    'notification-unread-count': ('get', lambda f, i: (reverse('notification-unread-count'), {})),
+    'analytics': ('get', lambda f, i: (reverse('analytics', args=['activities']) + '?period=month', {})),
+    'search': ('get', lambda f, i: (reverse('search') + '?q=weed', {})),
+    'import': ('post', _upload),
+    'export': ('get', lambda f, i: (reverse('export', args=['crops']), {})),
+    'sync': ('get', lambda f, i: (reverse('sync') + '?page_size=100', {})),
+}
+
+
+def load_fixtures(users, password, prefix='farmer'):
+    """Pick ``users`` seeded users that own at least one of everything."""
+    fixtures = []
+    tokens = (
+        Token.objects.filter(user__username__startswith=prefix, user__is_active=True)
+        .select_related('user').order_by('user_id')
+    )
+    for token in tokens.iterator():
+        with sharding.for_user(token.user_id):
+            ids = {
+                'crop': Crop.objects.filter(user_id=token.user_id).aggregate(id=Min('id'))['id'],
+                'resource': Resource.objects.filter(user_id=token.user_id).aggregate(id=Min('id'))['id'],
+                'activity': Activity.objects.filter(user_id=token.user_id).aggregate(id=Min('id'))['id'],
+                'notification': Notification.objects.filter(user_id=token.user_id).aggregate(id=Min('id'))['id'],
+            }
+        if None in ids.values():
+            continue
+        fixtures.append({'token': token.key, 'username': token.user.username, 'password': password, **ids})
+        if len(fixtures) == users:
+            break
+    return fixtures
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    return sorted_values[max(math.ceil(fraction * len(sorted_values)) - 1, 0)]
+
+
+def _host():
+    hosts = [host for host in settings.ALLOWED_HOSTS if host not in ('*', '') and not host.startswith('.')]
+    return hosts[0] if hosts else 'localhost'
+
+
+def _worker(method, build, fixtures, numbers, host):
+    client = APIClient(HTTP_HOST=host)
+    samples = []
+    try:
+        for i in numbers:
+            fixture = fixtures[i % len(fixtures)]
+            client.credentials(HTTP_AUTHORIZATION=f"Token {fixture['token']}")
+            path, kwargs = build(fixture, i)
+            if method != 'get':
+                kwargs.setdefault('format', 'json')
+            with CaptureQueriesContext(connection) as ctx:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, **kwargs)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                elapsed = time.perf_counter() - started
+            samples.append((elapsed, len(ctx.captured_queries), response.status_code))
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+    return samples
+
+
+def _body(kwargs):
+    """The request body and content type APIClient would send for ``kwargs``."""
+    if 'data' not in kwargs:
+        return b'', None
+    if kwargs.get('format') == 'multipart':
+        return encode_multipart(BOUNDARY, kwargs['data']), MULTIPART_CONTENT
+    return json.dumps(kwargs['data'], cls=DjangoJSONEncoder).encode(), 'application/json'
+
+
+async def _asgi_request(app, method, path, headers, body):
+    """Send one request through the ASGI application and return its status code."""
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': method.upper(), 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(name.encode('latin1'), value.encode('latin1')) for name, value in headers.items()],
+        'client': ('127.0.0.1', 0), 'server': ('127.0.0.1', 80),
+    }
+    pending = [{'type': 'http.request', 'body': body, 'more_body': False}]
+    response = {}
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        # The client stays connected until the handler stops listening
+        await asyncio.Future()
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await app(scope, receive, send)
+    return response['status']
+
+
+async def _asgi_worker(app, method, build, fixtures, numbers, host):
+    samples = []
+    for i in numbers:
+        fixture = fixtures[i % len(fixtures)]
+        path, kwargs = build(fixture, i)
+        body, content_type = _body(kwargs)
+        headers = {'host': host, 'authorization': f"Token {fixture['token']}"}
+        if content_type:
+            headers.update({'content-type': content_type, 'content-length': str(len(body))})
+        started = time.perf_counter()
+        status = await _asgi_request(app, method, path, headers, body)
+        # Queries run on other threads' connections and are not counted
+        samples.append((time.perf_counter() - started, None, status))
+    return samples
+
+
+def _run_asgi(method, build, fixtures, chunks, host):
+    app = ASGIHandler()
+
+    async def clients():
+        results = await asyncio.gather(*[_asgi_worker(app, method, build, fixtures, chunk, host) for chunk in chunks])
+        return [sample for chunk in results for sample in chunk]
+    return asyncio.run(clients())
+
+
+def run_endpoint(name, fixtures, requests, concurrency, interface='wsgi'):
+    method, build = ENDPOINTS[name]
+    host = _host()
+    numbers = list(range(requests))
+    chunks = [numbers[worker::concurrency] for worker in range(concurrency)]
+    started = time.perf_counter()
+    if interface == 'asgi':
+        samples = _run_asgi(method, build, fixtures, chunks, host)
+    elif concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = pool.map(lambda chunk: _worker(method, build, fixtures, chunk, host), chunks)
+            samples = [sample for chunk in results for sample in chunk]
+    else:
+        samples = _worker(method, build, fixtures, numbers, host)
+    wall = time.perf_counter() - started
+
+    latencies = sorted(elapsed * 1000 for elapsed, _, _ in samples)
+    statuses = {}
+    for _, _, code in samples:
+        statuses[str(code)] = statuses.get(str(code), 0) + 1
+    return {
+        'method': method.upper(),
+        'requests': len(samples),
+        'errors': sum(1 for _, _, code in samples if code >= 400),
+        'statuses': statuses,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'throughput_rps': round(len(samples) / wall, 2) if wall else None,
+        'queries_per_request': (
+            None if interface == 'asgi' else round(sum(queries for _, queries, _ in samples) / len(samples), 2)
+        ),
+    }
+
+
+def run_benchmark(fixtures, requests, concurrency, endpoints=None, progress=None, interface='wsgi'):
+    """Drive each endpoint ``requests`` times from ``concurrency`` clients.
+
+    ``wsgi`` clients are threads calling the test client; ``asgi`` clients
+    are tasks on one event loop sending requests through ``ASGIHandler``.
+    """
+    results = {}
+    for name in endpoints or ENDPOINTS:
+        results[name] = run_endpoint(name, fixtures, requests, concurrency, interface)
+        if progress:
+            progress(name, results[name])
+    return results
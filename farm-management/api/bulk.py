@@ -0,0 +1,200 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import router
+from django.db.models.deletion import Collector
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import analytics, lifecycle, sharding
+from .dashboard import invalidate_dashboard
+from .models import Crop, Notification, NotificationCounter, CollectionVersion, SyncTombstone
+from .outbox import enqueue_many
+from .signals import batched_deletes
+
+
+def too_many_items(items):
+    limit = getattr(settings, 'API_MAX_BULK_ITEMS', 1000)
+    if len(items) > limit:
+        return Response(
+            {'error': f'At most {limit} items can be sent in one request'},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return None
+
+
+class BulkSideEffectsMixin:
+    """Batched replacement for the per-row post_save and post_delete work.
+
+    Views writing a model that raises alerts set ``alert_kind`` and
+    ``alert_date_field``. Every write bumps the collection version, moves
+    the written rows' counts in the user's analytics rollups and
+    invalidates the dashboard; crop writes also have their statuses
+    rechecked on the next read.
+    """
+    alert_kind = None
+    alert_date_field = None
+
+    def after_bulk_write(self, objects, before=()):
+        """``before``: the rollup keys of updated rows as they were before the write."""
+        if self.alert_kind:
+            enqueue_many(self.alert_kind, self.alert_date_field, objects)
+        if objects:
+            CollectionVersion.bump(self.request.user.pk, type(objects[0]))
+            if type(objects[0]) in analytics.KEYS:
+                deltas = Counter()
+                for obj in objects:
+                    deltas.update(analytics.keys_for(obj))
+                deltas.subtract(before)
+                analytics.apply(self.request.user.pk, deltas)
+            if type(objects[0]) is Crop:
+                lifecycle.forget(self.request.user.pk)
+        invalidate_dashboard(self.request.user.pk)
+
+    def after_bulk_delete(self, deleted):
+        """The post_delete receivers' work for ``{model: {pk: row}}``, done once per batch.
+
+        ``deleted`` includes the rows removed by cascades, e.g. a crop's
+        activities and notifications.
+        """
+        user_id = self.request.user.pk
+        rollups = Counter()
+        for model, rows in deleted.items():
+            if model._meta.model_name not in SyncTombstone.COLLECTIONS or not rows:
+                continue
+            if model is Notification:
+                NotificationCounter.adjust(user_id, -sum(not row.is_read for row in rows.values()))
+            if model in analytics.KEYS:
+                for row in rows.values():
+                    rollups.subtract(analytics.keys_for(row))
+            CollectionVersion.bump(user_id, model)
+            SyncTombstone.record(model, user_id, sorted(rows))
+        analytics.apply(user_id, rollups)
+        invalidate_dashboard(user_id)
+
+
+class BulkCreateMixin(BulkSideEffectsMixin):
+    """Let a list endpoint's POST take a JSON array as well as one object.
+
+    Every item goes through the view's serializer; if any item fails, the
+    response is a 400 with an ``errors`` list aligned with the input and
+    nothing is written. Otherwise all rows are inserted with one
+    ``bulk_create`` inside a transaction.
+    """
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        too_many = too_many_items(request.data)
+        if too_many:
+            return too_many
+
+        serializer = self.get_serializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response({'errors': serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        model = serializer.child.Meta.model
+        objects = [model(user=request.user, **item) for item in serializer.validated_data]
+        with sharding.atomic():
+            model.objects.bulk_create(objects)
+            self.after_bulk_write(objects)
+        return Response(self.get_serializer(objects, many=True).data, status=status.HTTP_201_CREATED)
+
+
+class BulkUpdateDestroyView(BulkSideEffectsMixin, APIView):
+    """PATCH a list of ``{"id": ..., <fields>}`` objects or DELETE ``{"ids": [...]}``.
+
+    Subclasses set ``model`` and ``serializer_class``; only the requesting
+    user's rows can be changed, like in the single-object detail views.
+    """
+    model = None
+    serializer_class = None
+
+    def get_queryset(self):
+        return self.model.objects.filter(user=self.request.user)
+
+    def save_updates(self, instances, changes):
+        """Write the patched ``instances``; ``changes`` holds each one's validated fields.
+
+        Rows changing the same fields are written together, so no row gets
+        a field its item did not send written back.
+        """
+        # bulk_update skips auto_now, which the sync endpoint relies on
+        now = timezone.now()
+        groups = {}
+        for instance, change in zip(instances, changes):
+            instance.updated_at = now
+            groups.setdefault(tuple(sorted(change)), []).append(instance)
+        for fields, group in groups.items():
+            if fields:
+                self.model.objects.bulk_update(group, [*fields, 'updated_at'])
+
+    def patch(self, request):
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'error': 'Expected a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+        too_many = too_many_items(items)
+        if too_many:
+            return too_many
+
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        instances = self.get_queryset().in_bulk([pk for pk in ids if isinstance(pk, int)])
+        errors, changes = [], []
+        for item in items:
+            instance = instances.get(item.get('id')) if isinstance(item, dict) else None
+            if instance is None:
+                errors.append({'id': ['Not found.']})
+                continue
+            serializer = self.serializer_class(
+                instance, data=item, partial=True, context={'request': request, 'view': self},
+            )
+            if not serializer.is_valid():
+                errors.append(serializer.errors)
+                continue
+            errors.append({})
+            changes.append((instance.pk, serializer.validated_data))
+
+        if any(errors):
+            return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+        with sharding.atomic():
+            # Patch the rows as they are now, locked, rather than as read for validation
+            current = self.get_queryset().select_for_update(of=('self',)).in_bulk([pk for pk, _ in changes])
+            if len(current) < len({pk for pk, _ in changes}):
+                errors = [{} if pk in current else {'id': ['Not found.']} for pk, _ in changes]
+                return Response({'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+            updated = [current[pk] for pk, _ in changes]
+            before = []
+            if self.model in analytics.KEYS:
+                before = [key for instance in updated for key in analytics.keys_for(instance)]
+            for instance, (_, change) in zip(updated, changes):
+                for attr, value in change.items():
+                    setattr(instance, attr, value)
+            self.save_updates(updated, [change for _, change in changes])
+            self.after_bulk_write(updated, before)
+        context = {'request': request, 'view': self}
+        return Response(self.serializer_class(updated, many=True, context=context).data)
+
+    def delete(self, request):
+        ids = request.data.get('ids') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response({'error': 'Expected {"ids": [...]}'}, status=status.HTTP_400_BAD_REQUEST)
+        too_many = too_many_items(ids)
+        if too_many:
+            return too_many
+
+        queryset = self.get_queryset().filter(id__in=ids)
+        with sharding.atomic(), batched_deletes():
+            collector = Collector(using=router.db_for_write(self.model), origin=queryset)
+            collector.collect(queryset)
+            # The delete clears the instances' primary keys
+            deleted = {model: {obj.pk: obj for obj in objects} for model, objects in collector.data.items()}
+            collector.delete()
+            self.after_bulk_delete(deleted)
+        found = set(deleted.get(self.model, ()))
+        return Response({
+            'deleted': sorted(found),
+            'not_found': [pk for pk in ids if pk not in found],
+        })
@@ -0,0 +1,63 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from . import response_cache
+from .models import CollectionVersion
+
+
+def validators(request, user_id, collection, version, modified):
+    """``(digest, etag, last_modified)`` of a collection response."""
+    validator = ':'.join([
+        str(user_id), collection, str(version), modified.isoformat(),
+        request.get_full_path(), request.headers.get('Accept', ''),
+    ])
+    digest = hashlib.sha1(validator.encode()).hexdigest()
+    return digest, quote_etag(digest), int(modified.timestamp())
+
+
+def add_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Per-user data: browsers may keep it but must revalidate every time
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalGetMixin:
+    """Answer ``If-None-Match`` / ``If-Modified-Since`` from the collection version.
+
+    The validators come from one indexed lookup of the user's
+    ``CollectionVersion`` row, taken before the view reads any data, so an
+    unchanged reload returns 304 without querying or serializing the
+    collection. The ETag also covers the query string and ``Accept`` header
+    because they change the response body.
+
+    The same digest keys the serialized body in the ``responses`` cache, so
+    a client without a cached copy still skips the queries and
+    serialization. Any write bumps the version and with it the key, which
+    makes invalidation exact, cascades included; stale entries just age out.
+    """
+    version_collection = None
+
+    def get(self, request, *args, **kwargs):
+        version, modified = CollectionVersion.current(request.user.pk, self.version_collection)
+        digest, etag, last_modified = validators(request, request.user.pk, self.version_collection, version, modified)
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None and response_cache.enabled():
+            data = response_cache.get(digest)
+            if data is not None:
+                response = Response(data)
+                response['X-Cache'] = 'HIT'
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            if response_cache.enabled():
+                response_cache.store(digest, response.data)
+                response['X-Cache'] = 'MISS'
+        return add_validators(response, etag, last_modified)
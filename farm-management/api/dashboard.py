@@ -0,0 +1,109 @@
+import time
+from datetime import datetime, timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from . import sharding
+from .models import Crop, Resource, Activity, NotificationCounter
+from .serializers import ActivitySerializer
+
+UPCOMING_HARVEST_LIMIT = 20
+RECENT_ACTIVITY_LIMIT = 10
+
+
+def _version_key(user_id):
+    return f'dashboard-version:{user_id}'
+
+
+def dashboard_cache_key(user_id, days):
+    """Cache key for one user's summary, scoped to today and the harvest window.
+
+    The per-user version stamp lets a single write invalidate every cached
+    window without having to know which ``days`` values were requested.
+    """
+    version = cache.get_or_set(_version_key(user_id), time.time_ns(), None)
+    today = datetime.now().date()
+    return f'dashboard:{user_id}:{version}:{today.isoformat()}:{days}'
+
+
+def _bump_version(user_id):
+    cache.set(_version_key(user_id), time.time_ns(), None)
+
+
+def invalidate_dashboard(user_id):
+    """Start a new version for the user's summaries once the write commits.
+
+    Bumping inside the writer's transaction would let a concurrent GET
+    rebuild the new version from the data before the commit and cache it.
+    Outside a transaction the version moves at once.
+    """
+    transaction.on_commit(partial(_bump_version, user_id), using=sharding.current())
+
+
+def build_dashboard(user, days):
+    """Summarize a user's farm with aggregate queries instead of full row lists."""
+    today = datetime.now().date()
+
+    status_counts = {
+        f'count_{value}': Count('id', filter=Q(status=value))
+        for value, _ in Crop.STATUS_CHOICES
+    }
+    crop_summary = Crop.objects.filter(user=user).aggregate(total=Count('id'), **status_counts)
+
+    upcoming_harvests = list(
+        Crop.objects.filter(
+            user=user,
+            harvest_date__gte=today,
+            harvest_date__lte=today + timedelta(days=days),
+        )
+        .order_by('harvest_date', 'id')
+        .values('id', 'name', 'variety', 'status', 'harvest_date')[:UPCOMING_HARVEST_LIMIT]
+    )
+
+    resource_totals = list(
+        Resource.objects.filter(user=user)
+        .values('type', 'unit', 'usage_status')
+        .annotate(count=Count('id'), quantity=Sum('quantity'))
+        .order_by('type', 'unit', 'usage_status')
+    )
+    by_usage_status = {value: 0 for value, _ in Resource.USAGE_STATUS_CHOICES}
+    for row in resource_totals:
+        by_usage_status[row['usage_status']] = by_usage_status.get(row['usage_status'], 0) + row['count']
+
+    recent_activities = (
+        Activity.objects.filter(user=user)
+        .select_related('crop')
+        .order_by('-date', '-id')[:RECENT_ACTIVITY_LIMIT]
+    )
+
+    return {
+        'username': user.username,
+        'email': user.email,
+        'crops': {
+            'total': crop_summary['total'],
+            'by_status': {
+                value: crop_summary[f'count_{value}'] for value, _ in Crop.STATUS_CHOICES
+            },
+        },
+        'upcoming_harvests': upcoming_harvests,
+        'resources': {
+            'total': sum(row['count'] for row in resource_totals),
+            'by_usage_status': by_usage_status,
+            'totals': resource_totals,
+        },
+        'recent_activities': list(ActivitySerializer(recent_activities, many=True).data),
+        'unread_notifications': NotificationCounter.unread_for(user.pk),
+    }
+
+
+def get_dashboard(user, days):
+    key = dashboard_cache_key(user.pk, days)
+    data = cache.get(key)
+    if data is None:
+        data = build_dashboard(user, days)
+        cache.set(key, data, getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300))
+    return data
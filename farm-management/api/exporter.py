@@ -0,0 +1,124 @@
+import csv
+import json
+from datetime import date, datetime
+
+from . import sharding
+from .models import Crop, Resource, Activity, Notification
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+CHUNK_SIZE = 2000
+
+# Per collection: exported columns (header name -> ORM path), the date the
+# start/end range applies to, and the field ?status= filters on.
+EXPORTS = {
+    'crops': {
+        'model': Crop,
+        'columns': {
+            'id': 'id', 'name': 'name', 'variety': 'variety', 'planting_date': 'planting_date',
+            'harvest_date': 'harvest_date', 'status': 'status',
+        },
+        'date_field': 'planting_date',
+        'status_field': 'status',
+    },
+    'activities': {
+        'model': Activity,
+        'columns': {
+            'id': 'id', 'description': 'description', 'date': 'date',
+            'crop_id': 'crop_id', 'crop': 'crop__name',
+        },
+        'date_field': 'date',
+        'status_field': None,
+    },
+    'resources': {
+        'model': Resource,
+        'columns': {
+            'id': 'id', 'name': 'name', 'quantity': 'quantity', 'type': 'type',
+            'unit': 'unit', 'usage_status': 'usage_status',
+        },
+        'date_field': None,
+        'status_field': 'usage_status',
+    },
+    'notifications': {
+        'model': Notification,
+        'columns': {
+            'id': 'id', 'message': 'message', 'type': 'type', 'is_read': 'is_read',
+            'created_at': 'created_at', 'crop_id': 'crop_id',
+        },
+        'date_field': 'created_at__date',
+        'status_field': 'is_read',
+    },
+}
+
+
+class InvalidExport(Exception):
+    pass
+
+
+def _parse_date(value, name):
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise InvalidExport(f'{name} must be a date in YYYY-MM-DD format')
+
+
+def export_rows(user, kind, params):
+    """Return ``(header, row iterator)`` for one of the user's collections.
+
+    Rows come from a server-side cursor in ``CHUNK_SIZE`` batches so the
+    full result set is never held in memory.
+    """
+    if kind not in EXPORTS:
+        raise InvalidExport(f"Unknown export '{kind}', expected one of {', '.join(EXPORTS)}")
+    config = EXPORTS[kind]
+    # Streamed after the request's routing state is gone, so pin the shard now
+    queryset = config['model'].objects.using(sharding.current()).filter(user=user)
+
+    start, end = _parse_date(params.get('start'), 'start'), _parse_date(params.get('end'), 'end')
+    if (start or end) and not config['date_field']:
+        raise InvalidExport(f'{kind} cannot be filtered by date')
+    if start:
+        queryset = queryset.filter(**{f"{config['date_field']}__gte": start})
+    if end:
+        queryset = queryset.filter(**{f"{config['date_field']}__lte": end})
+
+    status = params.get('status')
+    if status:
+        if not config['status_field']:
+            raise InvalidExport(f'{kind} cannot be filtered by status')
+        if config['status_field'] == 'is_read':
+            if status not in ('read', 'unread'):
+                raise InvalidExport("status must be 'read' or 'unread'")
+            status = status == 'read'
+        queryset = queryset.filter(**{config['status_field']: status})
+
+    header = list(config['columns'])
+    rows = queryset.order_by('id').values_list(*config['columns'].values()).iterator(chunk_size=CHUNK_SIZE)
+    return header, rows
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def _cell(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+
+def render(header, rows, fmt):
+    """Yield the encoded export line by line."""
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow([_cell(value) for value in row])
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(header, map(_cell, row)))) + '\n'
@@ -0,0 +1,241 @@
+import csv
+import io
+import json
+from datetime import date
+
+from django.utils import timezone
+
+from . import routing, sharding
+from .analytics import count_created
+from .dashboard import invalidate_dashboard
+from .models import Crop, Resource, Activity, CollectionVersion
+from .outbox import enqueue_many
+
+FORMATS = ('csv', 'ndjson')
+DEFAULT_CHUNK_SIZE = 5000
+# Error details kept in memory for the response; the count is always exact
+MAX_REPORTED_ERRORS = 1000
+
+
+class InvalidImport(Exception):
+    pass
+
+
+def detect_format(filename, requested=None):
+    fmt = (requested or filename.rsplit('.', 1)[-1]).lower()
+    if fmt in ('json', 'jsonl'):
+        fmt = 'ndjson'
+    if fmt not in FORMATS:
+        raise InvalidImport(f"Unsupported format '{fmt}', expected one of {', '.join(FORMATS)}")
+    return fmt
+
+
+def iter_records(lines, fmt):
+    """Yield ``(line number, record dict or None)`` from an iterable of text lines."""
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield number, record if isinstance(record, dict) else None
+
+
+def _text(record, field, errors, max_length=None):
+    value = record.get(field)
+    value = str(value).strip() if value is not None else ''
+    if not value:
+        errors[field] = 'This field is required.'
+    elif max_length and len(value) > max_length:
+        errors[field] = f'Ensure this field has no more than {max_length} characters.'
+    return value
+
+
+def _choice(record, field, choices, default, errors):
+    value = record.get(field) or default
+    if value not in [choice[0] for choice in choices]:
+        errors[field] = f'Invalid {field.replace("_", " ")}.'
+    return value
+
+
+class ResourceRows:
+    model = Resource
+    columns = ['user_id', 'name', 'quantity', 'type', 'unit', 'usage_status']
+    alert_kind = None
+
+    def __init__(self, user):
+        self.user = user
+
+    def clean(self, record):
+        errors = {}
+        row = {
+            'user_id': self.user.pk,
+            'name': _text(record, 'name', errors, max_length=100),
+            'type': _text(record, 'type', errors, max_length=50),
+            'unit': _choice(record, 'unit', Resource.UNIT_CHOICES, 'units', errors),
+        }
+        try:
+            row['quantity'] = float(record.get('quantity'))
+            if row['quantity'] < 0:
+                errors['quantity'] = 'Quantity cannot be negative.'
+        except (TypeError, ValueError):
+            errors['quantity'] = 'A valid number is required.'
+        else:
+            row['usage_status'] = Resource.opening_status(row['quantity'])
+        return row, errors
+
+
+class ActivityRows:
+    model = Activity
+    columns = ['user_id', 'description', 'date', 'crop_id']
+    # Passed to enqueue_many, as the bulk views do
+    alert_kind = 'activity'
+    alert_date_field = 'date'
+
+    def __init__(self, user):
+        self.user = user
+        # Crop names are resolved against one in-memory table per import.
+        # A name used by more than one crop maps to None and must be given
+        # as crop_id instead.
+        crops = list(Crop.objects.filter(user=user).values_list('id', 'name'))
+        self.owned = {crop_id for crop_id, _ in crops}
+        self.crop_ids = {}
+        for crop_id, name in crops:
+            self.crop_ids[name] = None if name in self.crop_ids else crop_id
+
+    def clean(self, record):
+        errors = {}
+        row = {
+            'user_id': self.user.pk,
+            'description': _text(record, 'description', errors),
+        }
+        try:
+            row['date'] = date.fromisoformat(str(record.get('date')).strip())
+        except ValueError:
+            errors['date'] = 'Date has wrong format. Use YYYY-MM-DD.'
+
+        crop_id, crop_name = record.get('crop_id'), record.get('crop')
+        if crop_id not in (None, ''):
+            try:
+                row['crop_id'] = int(crop_id)
+            except (TypeError, ValueError):
+                row['crop_id'] = None
+            if row['crop_id'] not in self.owned:
+                errors['crop_id'] = 'Invalid crop.'
+        elif crop_name:
+            row['crop_id'] = self.crop_ids.get(str(crop_name).strip())
+            if row['crop_id'] is None:
+                errors['crop'] = f"Unknown or ambiguous crop '{crop_name}'."
+        else:
+            errors['crop'] = 'A crop name or crop_id is required.'
+        return row, errors
+
+
+KINDS = {
+    'resources': ResourceRows,
+    'activities': ActivityRows,
+}
+
+
+def _copy(model, columns, rows):
+    """Load a chunk with PostgreSQL COPY, which skips per-row INSERT parsing."""
+    # COPY bypasses auto_now, so the sync timestamp is written explicitly
+    updated_at = timezone.now().isoformat()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns] + [updated_at])
+    buffer.seek(0)
+
+    quote = sharding.connection().ops.quote_name
+    sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        quote(model._meta.db_table), ', '.join(quote(column) for column in columns + ['updated_at']),
+    )
+    # The driver's copy bypasses the execute wrappers that notice writes
+    routing.mark_written()
+    with sharding.connection().cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            raw.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+def _reserve_pks(model, count):
+    """Draw ``count`` ids from the table's sequence for rows written by COPY."""
+    with sharding.connection().cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+            [model._meta.db_table, count],
+        )
+        return [pk for pk, in cursor.fetchall()]
+
+
+def _write(target, rows):
+    model, columns = target.model, target.columns
+    objects = [model(**row) for row in rows]
+    with sharding.atomic():
+        if sharding.connection().vendor == 'postgresql':
+            # COPY returns no ids, so they are taken up front for the outbox
+            for obj, row, pk in zip(objects, rows, _reserve_pks(model, len(rows))):
+                obj.pk = row['id'] = pk
+            _copy(model, ['id'] + columns, rows)
+        else:
+            model.objects.bulk_create(objects)
+        CollectionVersion.bump(rows[0]['user_id'], model)
+        count_created(objects)
+        if target.alert_kind:
+            enqueue_many(target.alert_kind, target.alert_date_field, objects)
+
+
+def run_import(user, kind, lines, fmt, chunk_size=DEFAULT_CHUNK_SIZE, on_error=None):
+    """Import ``lines`` for ``user`` and return ``(imported, failed, errors)``.
+
+    Rows are read one at a time, checked against the same rules as the API
+    serializers and written in ``chunk_size`` batches, each in its own
+    transaction, so memory stays flat however large the input is. Bad rows
+    are counted and skipped rather than aborting the import.
+
+    ``errors`` holds at most ``MAX_REPORTED_ERRORS`` entries of
+    ``{'line': n, 'errors': {...}}``; pass ``on_error`` to receive every one
+    of them as it happens instead (e.g. to write a full report to disk).
+    """
+    if kind not in KINDS:
+        raise InvalidImport(f"Unknown import kind '{kind}', expected one of {', '.join(KINDS)}")
+    target = KINDS[kind](user)
+    imported = failed = 0
+    errors, chunk = [], []
+
+    for line, record in iter_records(lines, fmt):
+        if record is None:
+            row, row_errors = None, {'non_field_errors': 'Line is not a JSON object.'}
+        else:
+            row, row_errors = target.clean(record)
+        if row_errors:
+            failed += 1
+            error = {'line': line, 'errors': row_errors}
+            if on_error:
+                on_error(error)
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(error)
+            continue
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            _write(target, chunk)
+            imported += len(chunk)
+            chunk = []
+
+    if chunk:
+        _write(target, chunk)
+        imported += len(chunk)
+    if imported:
+        invalidate_dashboard(user.pk)
+    return imported, failed, errors
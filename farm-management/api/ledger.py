@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+from django.db.models import Case, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import sharding
+from .analytics import count_movements
+from .dashboard import invalidate_dashboard
+from .models import Resource, ResourceMovement, CollectionVersion
+
+
+class InsufficientStock(Exception):
+    def __init__(self, resource_id):
+        super().__init__(f'Not enough stock in resource {resource_id}')
+        self.resource_id = resource_id
+
+
+def _status(delta, kind):
+    """usage_status for a balance of ``quantity + delta``, evaluated in SQL.
+
+    Empty stock is depleted; otherwise the latest movement decides:
+    consumption means in use, a restock makes it available and an
+    adjustment keeps the current status.
+    """
+    if kind == 'consumption':
+        default = Value('in_use')
+    elif kind == 'restock':
+        default = Value('available')
+    else:
+        default = Case(When(usage_status='depleted', then=Value('available')), default=F('usage_status'))
+    return Case(When(quantity__lte=-delta, then=Value('depleted')), default=default)
+
+
+def _apply(user, deltas, kinds):
+    # Resources are updated in id order so concurrent batches touching the
+    # same rows always lock them in the same order and cannot deadlock.
+    for resource_id in sorted(deltas):
+        delta = deltas[resource_id]
+        rows = Resource.objects.filter(pk=resource_id, user=user)
+        if delta < 0:
+            rows = rows.filter(quantity__gte=-delta)
+        if not rows.update(
+            quantity=F('quantity') + delta, usage_status=_status(delta, kinds[resource_id]), updated_at=timezone.now(),
+        ):
+            raise InsufficientStock(resource_id)
+
+
+def _written(user, resource_ids):
+    CollectionVersion.bump(user.pk, Resource)
+    invalidate_dashboard(user.pk)
+    return {
+        pk: (quantity, usage_status)
+        for pk, quantity, usage_status in Resource.objects.filter(pk__in=resource_ids)
+        .values_list('pk', 'quantity', 'usage_status')
+    }
+
+
+def record_movements(user, movements):
+    """Append a batch of movements and move each balance by their net total.
+
+    ``movements`` are validated dicts with ``resource``, ``kind``,
+    ``quantity`` (always positive) and optional ``occurred_on`` and
+    ``note``. Balances move with one ``UPDATE ... SET quantity = quantity +
+    delta`` per resource, so concurrent batches never lose each other's
+    changes and no row is read before it is written. A batch that would take a balance
+    below zero is rejected as a whole with ``InsufficientStock``.
+
+    Returns ``(entries, {resource id: (quantity, usage_status)})``.
+    """
+    entries, deltas, kinds = [], defaultdict(float), {}
+    for movement in movements:
+        resource = movement['resource']
+        delta = -movement['quantity'] if movement['kind'] == 'consumption' else movement['quantity']
+        entries.append(ResourceMovement(
+            user=user, resource=resource, kind=movement['kind'], delta=delta,
+            occurred_on=movement.get('occurred_on') or timezone.localdate(), note=movement.get('note', ''),
+        ))
+        deltas[resource.pk] += delta
+        kinds[resource.pk] = movement['kind']
+
+    with sharding.atomic():
+        ResourceMovement.objects.bulk_create(entries)
+        _apply(user, deltas, kinds)
+        count_movements(user.pk, entries)
+        balances = _written(user, deltas)
+    return entries, balances
+
+
+def set_quantities(user, quantities, note='Stock take'):
+    """Record stock-take counts as adjustment movements.
+
+    A stock take states an absolute quantity, so unlike ``record_movements``
+    this locks each row to read the balance it replaces.
+    """
+    with sharding.atomic():
+        current = dict(
+            Resource.objects.select_for_update().filter(pk__in=quantities, user=user).order_by('pk')
+            .values_list('pk', 'quantity')
+        )
+        deltas = {pk: quantities[pk] - quantity for pk, quantity in current.items() if quantities[pk] != quantity}
+        ResourceMovement.objects.bulk_create([
+            ResourceMovement(user=user, resource_id=pk, kind='adjustment', delta=delta, note=note)
+            for pk, delta in deltas.items()
+        ])
+        _apply(user, deltas, dict.fromkeys(deltas, 'adjustment'))
+        return _written(user, deltas) if deltas else {}
+
+
+def balances_as_of(queryset, day):
+    """Annotate resources with ``balance``, their quantity at the end of ``day``.
+
+    Computed as the current balance minus the movements dated after ``day``,
+    which the (resource, occurred_on) index finds without scanning older
+    history. Quantities set before the ledger existed, or when a resource
+    was created, count as opening stock.
+    """
+    later = Coalesce(Sum('movements__delta', filter=Q(movements__occurred_on__gt=day)), Value(0.0))
+    return queryset.annotate(balance=F('quantity') - later)
@@ -0,0 +1,158 @@
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.permissions import SAFE_METHODS
+
+from . import analytics, sharding
+from .dashboard import invalidate_dashboard
+from .models import Crop, Notification, NotificationCounter, CollectionVersion
+from .pubsub import publish
+
+# Crops move forward through their statuses as their dates pass. Each
+# transition is applied to a batch of crops at a time with one UPDATE, and
+# the rollups, counters, versions and notifications follow per batch.
+
+# status: the new status; sources: statuses it replaces; field/offset: the
+# transition applies once ``field + offset days`` is today or earlier
+Transition = namedtuple('Transition', 'status sources field offset')
+
+FIELDS = ['pk', 'user_id', 'name', 'variety', 'planting_date', 'harvest_date', 'status']
+
+
+def transitions():
+    """The configured transitions, latest status first.
+
+    A crop whose harvest is already due goes straight to Harvesting rather
+    than through Growing.
+    """
+    return [
+        Transition('Harvesting', ('Planting', 'Growing'), 'harvest_date', -getattr(settings, 'CROP_HARVESTING_LEAD_DAYS', 0)),
+        Transition('Growing', ('Planting',), 'planting_date', getattr(settings, 'CROP_GROWING_AFTER_DAYS', 14)),
+    ]
+
+
+def due(transition, today):
+    return Crop.objects.using(sharding.current()).filter(
+        status__in=transition.sources,
+        **{f'{transition.field}__lte': today - timedelta(days=transition.offset)},
+    )
+
+
+def status_message(crop, status):
+    return f"Your crop {crop.name} ({crop.variety}) is now {status}."
+
+
+def advance_batch(transition, today, batch_size, user_ids=None):
+    """Move up to ``batch_size`` due crops to ``transition.status``.
+
+    Crops another transaction has locked, e.g. while a client edits them,
+    are skipped until the next run. Returns ``(crops moved, notifications
+    created)``.
+    """
+    queryset = due(transition, today)
+    if user_ids is not None:
+        queryset = queryset.filter(user_id__in=user_ids)
+    with sharding.atomic():
+        crops = [
+            Crop(**dict(zip(FIELDS, row)))
+            for row in queryset.order_by('pk').select_for_update(skip_locked=True).values_list(*FIELDS)[:batch_size]
+        ]
+        if not crops:
+            return 0, 0
+        Crop.objects.using(sharding.current()).filter(pk__in=[crop.pk for crop in crops]).update(
+            status=transition.status, updated_at=timezone.now(),
+        )
+
+        deltas = {}
+        for crop in crops:
+            counter = deltas.setdefault(crop.user_id, Counter())
+            counter.subtract(analytics.keys_for(crop))
+            crop.status = transition.status
+            counter.update(analytics.keys_for(crop))
+        for user_id in sorted(deltas):
+            analytics.apply(user_id, deltas[user_id])
+
+        notifications = Notification.objects.bulk_create([
+            Notification(
+                user_id=crop.user_id,
+                crop_id=crop.pk,
+                message=status_message(crop, transition.status),
+                dedupe_key=Notification.make_dedupe_key(
+                    f'status-{transition.status.lower()}', crop.pk, getattr(crop, transition.field),
+                ),
+            )
+            for crop in crops
+        ])
+        NotificationCounter.add_created(notifications)
+        for user_id in sorted(deltas):
+            CollectionVersion.bump(user_id, Crop)
+            CollectionVersion.bump(user_id, Notification)
+            invalidate_dashboard(user_id)
+        transaction.on_commit(partial(publish, list(deltas)), using=sharding.current())
+    return len(crops), len(notifications)
+
+
+def advance(today=None, user_ids=None, batch_size=None):
+    """Apply every transition on the current shard until nothing is due.
+
+    Returns a ``Counter`` of crops moved per new status, plus the number
+    of notifications created under ``'notifications'``.
+    """
+    today = today or datetime.now().date()
+    batch_size = batch_size or getattr(settings, 'CROP_STATUS_BATCH_SIZE', 2000)
+    moved = Counter()
+    for transition in transitions():
+        while True:
+            crops, notifications = advance_batch(transition, today, batch_size, user_ids)
+            moved[transition.status] += crops
+            moved['notifications'] += notifications
+            if crops < batch_size:
+                break
+    return moved
+
+
+def _checked_key(user_id):
+    return f'crop-status-checked:{user_id}:{datetime.now().date().isoformat()}'
+
+
+def forget(user_id):
+    """Recheck the user's crops on their next read, e.g. after their dates changed."""
+    cache.delete(_checked_key(user_id))
+
+
+def ensure_current(user_id):
+    """Bring one user's crop statuses up to date, at most once a day.
+
+    Saves through the API call ``forget``, so edited dates are picked up on
+    the next read. Returns the number of crops moved.
+    """
+    if not getattr(settings, 'CROP_STATUS_ON_READ', True) or cache.get(_checked_key(user_id)):
+        return 0
+    try:
+        moved = advance(user_ids=[user_id])
+    except sharding.ShardUnavailable:
+        # Mid-move: read the statuses as stored and check again next time
+        return 0
+    cache.set(_checked_key(user_id), True, 24 * 60 * 60)
+    return sum(moved[transition.status] for transition in transitions())
+
+
+async def aensure_current(user_id):
+    if not getattr(settings, 'CROP_STATUS_ON_READ', True) or await cache.aget(_checked_key(user_id)):
+        return 0
+    return await sync_to_async(ensure_current)(user_id)
+
+
+class CurrentStatusMixin:
+    """Bring the user's crop statuses up to date before a safe request reads them."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            ensure_current(request.user.pk)
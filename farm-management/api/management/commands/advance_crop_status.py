@@ -0,0 +1,43 @@
+import time
+from collections import Counter
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+from api.lifecycle import advance, transitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Move crops to Growing and Harvesting as their planting and harvest "
+        "dates pass, in batches of bulk updates, and notify their owners. "
+        "Safe to run repeatedly, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Crops moved per transaction (defaults to CROP_STATUS_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--today', type=date.fromisoformat, default=None,
+            help='Advance as if it were this date (YYYY-MM-DD).',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        started = time.monotonic()
+
+        moved = Counter()
+        for counts in sharding.fan_out(advance, options['today'], None, options['batch_size']).values():
+            moved.update(counts)
+
+        elapsed = time.monotonic() - started
+        total = sum(moved[transition.status] for transition in transitions())
+        summary = ', '.join(f"{moved[transition.status]} to {transition.status}" for transition in transitions())
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {total} crops ({summary}); created {moved['notifications']} notifications "
+            f"in {elapsed:.2f}s ({total / elapsed if elapsed else total:.0f} rows/s)"
+        ))
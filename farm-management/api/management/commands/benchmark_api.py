@@ -0,0 +1,98 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.benchmark import ENDPOINTS, SKIPPED, load_fixtures, run_benchmark
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive every API endpoint with concurrent in-process clients against '
+        'the configured database and write p50/p95/p99 latency, throughput '
+        'and queries per request to a JSON file. Seed data with seed_farm first. '
+        'Run once with --interface wsgi and once with --interface asgi, passing '
+        'the first file as --baseline, to compare the two.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients.')
+        parser.add_argument(
+            '--interface', choices=['wsgi', 'asgi'], default='wsgi',
+            help='Serve requests through the WSGI test client from threads, or through ASGIHandler from asyncio tasks.',
+        )
+        parser.add_argument('--users', type=int, default=50, help='Seeded users to spread requests over.')
+        parser.add_argument('--prefix', default='farmer', help='Username prefix used by seed_farm.')
+        parser.add_argument('--password', default='farm-pass', help='Password given to seed_farm.')
+        parser.add_argument('--endpoints', default=None, help=f"Comma-separated subset of: {', '.join(ENDPOINTS)}")
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the results.')
+        parser.add_argument('--baseline', default=None, help='Earlier results file to print throughput ratios against.')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1 or options['users'] < 1:
+            raise CommandError('--requests, --concurrency and --users must be positive')
+        endpoints = options['endpoints'].split(',') if options['endpoints'] else list(ENDPOINTS)
+        unknown = [name for name in endpoints if name not in ENDPOINTS]
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(unknown)}")
+
+        baseline = {}
+        if options['baseline']:
+            try:
+                with open(options['baseline'], encoding='utf-8') as f:
+                    baseline = json.load(f)['endpoints']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Cannot read baseline {options['baseline']}: {exc}")
+
+        fixtures = load_fixtures(options['users'], options['password'], options['prefix'])
+        if not fixtures:
+            raise CommandError(f"No '{options['prefix']}' users with data found; run seed_farm first")
+
+        def progress(name, result):
+            queries = result['queries_per_request']
+            line = (
+                f"{name:<28} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+                f"p99 {result['p99_ms']:>8.2f}ms  {result['throughput_rps']:>8.1f} req/s  "
+                f"{'n/a' if queries is None else f'{queries:.1f}':>5} q/req  {result['errors']} errors"
+            )
+            before = baseline.get(name, {}).get('throughput_rps')
+            if before and result['throughput_rps']:
+                line += f"  x{result['throughput_rps'] / before:.2f} vs baseline"
+            self.stdout.write(line)
+
+        results = run_benchmark(
+            fixtures, options['requests'], options['concurrency'], endpoints, progress, options['interface'],
+        )
+        report = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'commit': _git_commit(),
+            'database': connection.vendor,
+            'cache_backend': getattr(settings, 'CACHE_BACKEND', None),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'requests_per_endpoint': options['requests'],
+            'concurrency': options['concurrency'],
+            'interface': options['interface'],
+            'async_read_views': getattr(settings, 'ASYNC_READ_VIEWS', False),
+            'users': len(fixtures),
+            'endpoints': results,
+            'skipped': {name: reason for name, reason in SKIPPED.items() if not options['endpoints']},
+        }
+        with open(options['output'], 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote results for {len(results)} endpoints to {options['output']}"))
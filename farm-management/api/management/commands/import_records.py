@@ -0,0 +1,49 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+from api.importer import DEFAULT_CHUNK_SIZE, KINDS, InvalidImport, detect_format, run_import
+
+
+class Command(BaseCommand):
+    help = "Stream a CSV or NDJSON file of resources or activities into a user's farm."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(KINDS))
+        parser.add_argument('path', help='File to import.')
+        parser.add_argument('--user', required=True, help='Username that will own the imported rows.')
+        parser.add_argument('--format', default=None, help='csv or ndjson (defaults to the file extension).')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows per transaction.')
+        parser.add_argument('--errors', default=None, help='Write one NDJSON line per rejected row to this file.')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        report = open(options['errors'], 'w', encoding='utf-8') if options['errors'] else None
+        on_error = (lambda error: report.write(json.dumps(error) + '\n')) if report else None
+        started = time.monotonic()
+        try:
+            fmt = detect_format(options['path'], options['format'])
+            with open(options['path'], encoding='utf-8-sig', newline='') as lines, sharding.for_user(user.pk):
+                imported, failed, _ = run_import(
+                    user, options['kind'], lines, fmt, options['chunk_size'], on_error,
+                )
+        except (InvalidImport, OSError, UnicodeDecodeError) as e:
+            raise CommandError(str(e))
+        finally:
+            if report:
+                report.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} {options['kind']} ({failed} rejected) in {elapsed:.2f}s "
+            f"({(imported + failed) / elapsed if elapsed else imported + failed:.0f} rows/s)"
+        ))
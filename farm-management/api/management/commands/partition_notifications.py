@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api import sharding
+from api.retention import ensure_partitions, partition_table, partitioned
+
+
+class Command(BaseCommand):
+    help = (
+        "PostgreSQL only. With --convert, turn the notification table into "
+        "monthly range partitions by created_at once; afterwards run it from "
+        "cron to create upcoming months' partitions, so purge_notifications "
+        "can drop expired months whole."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Convert the existing table. Locks it while every row is copied.',
+        )
+        parser.add_argument(
+            '--months-ahead', type=int, default=3,
+            help='Months after the current one to create partitions for.',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Notification partitioning needs PostgreSQL')
+        if options['months_ahead'] < 0:
+            raise CommandError('--months-ahead cannot be negative')
+
+        # Every shard has its own notification table
+        for alias, message in sharding.fan_out(self.partition_shard, options).items():
+            self.stdout.write(self.style.SUCCESS(f'{alias}: {message}' if sharding.enabled() else message))
+
+    def partition_shard(self, options):
+        if options['convert']:
+            if not partitioned():
+                created = partition_table(options['months_ahead'])
+                return f'Partitioned notifications into {len(created)} monthly partitions'
+        elif not partitioned():
+            raise CommandError('Notifications are not partitioned; run with --convert first')
+        created = ensure_partitions(options['months_ahead'])
+        return f"Partitions up to {created[-1]} exist"
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+from api.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Turn pending notification outbox rows into notifications."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Outbox rows per worker chunk (defaults to OUTBOX_BATCH_SIZE).',
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Worker threads draining the outbox (defaults to OUTBOX_WORKERS).',
+        )
+        parser.add_argument(
+            '--max-attempts', type=int, default=None,
+            help='Failed rows are retried with backoff up to this many times (defaults to OUTBOX_MAX_ATTEMPTS).',
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep polling for new rows instead of exiting once the outbox is empty.',
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2.0,
+            help='Seconds to sleep between polls with --loop.',
+        )
+
+    def handle(self, *args, **options):
+        for name in ('batch_size', 'workers', 'max_attempts'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+
+        while True:
+            started = time.monotonic()
+            stats = self.merge(sharding.fan_out(drain, options['batch_size'], options['workers'], options['max_attempts']).values())
+            if stats['processed'] or stats['failed'] or not options['loop']:
+                self.stdout.write(
+                    f"Processed {stats['processed']} outbox rows ({stats['failed']} failed), "
+                    f"created {stats['created']} notifications in {time.monotonic() - started:.2f}s; "
+                    f"lag avg {stats['avg_lag']:.1f}s max {stats['max_lag']:.1f}s"
+                )
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def merge(self, results):
+        """Combine the per-shard ``drain`` stats."""
+        results = list(results)
+        stats = {name: sum(result[name] for result in results) for name in ('processed', 'failed', 'created')}
+        stats['max_lag'] = max(result['max_lag'] for result in results)
+        stats['avg_lag'] = (
+            sum(result['avg_lag'] * result['processed'] for result in results) / stats['processed']
+            if stats['processed'] else 0.0
+        )
+        return stats
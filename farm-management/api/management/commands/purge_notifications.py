@@ -0,0 +1,60 @@
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import outbox, sharding
+from api.retention import purge_notifications, purge_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Move notifications past their retention period to the archive table "
+        "(or delete them) in small batches, and delete sync tombstones older than "
+        "SYNC_TOMBSTONE_DAYS and finished outbox rows older than OUTBOX_RETENTION_DAYS. "
+        "Safe to run repeatedly, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--read-days', type=int, default=None,
+            help='Keep read notifications this many days (defaults to NOTIFICATION_RETENTION_READ_DAYS).',
+        )
+        parser.add_argument(
+            '--unread-days', type=int, default=None,
+            help='Keep unread notifications this many days (defaults to NOTIFICATION_RETENTION_UNREAD_DAYS).',
+        )
+        parser.add_argument(
+            '--delete', action='store_true',
+            help='Delete expired notifications instead of archiving them, whatever NOTIFICATION_ARCHIVE says.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Rows removed per transaction (defaults to NOTIFICATION_PURGE_BATCH_SIZE).',
+        )
+
+    def handle(self, *args, **options):
+        for name in ('read_days', 'unread_days', 'batch_size'):
+            if options[name] is not None and options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive")
+        started = time.monotonic()
+
+        def progress(removed):
+            self.stdout.write(f'{removed} notifications removed', ending='\r')
+
+        purge = partial(
+            purge_notifications,
+            read_days=options['read_days'],
+            unread_days=options['unread_days'],
+            archive=False if options['delete'] else None,
+            batch_size=options['batch_size'],
+            # Shards are purged in parallel, so only a single one reports progress
+            progress=progress if options['verbosity'] > 1 and not sharding.enabled() else None,
+        )
+        removed = sum(sharding.fan_out(purge).values())
+        tombstones = sum(sharding.fan_out(partial(purge_tombstones, batch_size=options['batch_size'])).values())
+        finished = sum(sharding.fan_out(partial(outbox.purge, batch_size=options['batch_size'])).values())
+        self.stdout.write(self.style.SUCCESS(
+            f"{'Deleted' if options['delete'] else 'Purged'} {removed} expired notifications, "
+            f"{tombstones} sync tombstones and {finished} outbox rows in {time.monotonic() - started:.2f}s"
+        ))
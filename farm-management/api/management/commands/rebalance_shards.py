@@ -0,0 +1,82 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users' farm data between database shards while the site keeps "
+        "serving. Without --user, evens out the number of users per shard, "
+        "e.g. after adding one to DB_SHARDS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', default=None, help='Move this username (repeatable); needs --to.')
+        parser.add_argument('--to', default=None, help='Shard alias to move the --user users to.')
+        parser.add_argument('--dry-run', action='store_true', help='Print the planned moves without making them.')
+        parser.add_argument(
+            '--grace', type=float, default=None,
+            help='Seconds to wait for cached shard maps to expire (defaults to SHARD_MAP_CACHE_SECONDS).',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows copied per insert.')
+        parser.add_argument(
+            '--users-per-move', type=int, default=50,
+            help='Users moved together, sharing one wait for cached shard maps; their writes are refused meanwhile.',
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError('Only one shard is configured; set DB_SHARDS first')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        if options['users_per_move'] < 1:
+            raise CommandError('--users-per-move must be positive')
+        if options['grace'] is not None and options['grace'] < 0:
+            raise CommandError('--grace cannot be negative')
+        if bool(options['user']) != bool(options['to']):
+            raise CommandError('--user and --to go together')
+        if options['to'] and options['to'] not in sharding.shards():
+            raise CommandError(f"Unknown shard '{options['to']}', expected one of {', '.join(sharding.shards())}")
+
+        if options['user']:
+            users = dict(User.objects.filter(username__in=options['user']).values_list('username', 'pk'))
+            missing = sorted(set(options['user']) - set(users))
+            if missing:
+                raise CommandError(f"Users do not exist: {', '.join(missing)}")
+            current = sharding.users_by_shard(list(users.values()))
+            moves = [
+                (user_id, source, options['to'])
+                for source, user_ids in current.items() if source != options['to'] for user_id in user_ids
+            ]
+        else:
+            moves = sharding.plan_rebalance()
+
+        if options['dry_run']:
+            for user_id, source, target in moves:
+                self.stdout.write(f'Would move user {user_id} from {source} to {target}')
+            self.stdout.write(self.style.SUCCESS(f'{len(moves)} moves planned'))
+            return
+
+        started = time.monotonic()
+        moved = rows = 0
+        step = options['users_per_move']
+        for start in range(0, len(moves), step):
+            batch = moves[start:start + step]
+            results = sharding.move_users(
+                [(user_id, target) for user_id, source, target in batch], options['grace'], options['batch_size'],
+            )
+            for user_id, source, target in batch:
+                copied = results.get(user_id, 0)
+                if isinstance(copied, sharding.ShardMoveConflict):
+                    self.stderr.write(str(copied))
+                    continue
+                moved += 1
+                rows += copied
+                self.stdout.write(f'Moved user {user_id} from {source} to {target} ({copied} rows)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} of {len(moves)} users ({rows} rows) in {time.monotonic() - started:.2f}s"
+        ))
@@ -0,0 +1,99 @@
+import time
+from datetime import date
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+from api.alerts import alert_window, already_sent, harvest_alert, activity_alert
+from api.dashboard import invalidate_dashboard
+from api.models import Crop, Activity, Notification, NotificationCounter, CollectionVersion
+from api.pubsub import publish
+
+
+class Command(BaseCommand):
+    help = (
+        "Raise harvest and activity alerts for every crop and activity whose date "
+        "falls inside the alert window. Safe to run repeatedly, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Alert window in days (defaults to NOTIFICATION_LEAD_DAYS).',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=2000,
+            help='Rows read, deduplicated and inserted per transaction.',
+        )
+        parser.add_argument(
+            '--today', type=date.fromisoformat, default=None,
+            help='Scan as if it were this date (YYYY-MM-DD).',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        today, threshold = alert_window(options['today'], options['days'])
+        started = time.monotonic()
+
+        # Each shard holds its own users' crops and activities
+        results = sharding.fan_out(self.scan_shard, today, threshold, options['batch_size']).values()
+        crop_rows, crop_created, activity_rows, activity_created = (sum(column) for column in zip(*results))
+
+        elapsed = time.monotonic() - started
+        rows = crop_rows + activity_rows
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {crop_rows} crops and {activity_rows} activities due {today}..{threshold}; "
+            f"created {crop_created + activity_created} notifications in {elapsed:.2f}s "
+            f"({rows / elapsed if elapsed else rows:.0f} rows/s)"
+        ))
+
+    def scan_shard(self, today, threshold, batch_size):
+        """``(crops scanned, created, activities scanned, created)`` on the current shard."""
+        crops = (
+            Crop.objects.filter(harvest_date__gte=today, harvest_date__lte=threshold)
+            .order_by()
+            .values_list('id', 'user_id', 'name', 'variety', 'harvest_date')
+        )
+        crop_rows, crop_created = self.scan(crops, batch_size, lambda row: harvest_alert(*row, today=today))
+
+        activities = (
+            Activity.objects.filter(date__gte=today, date__lte=threshold)
+            .order_by()
+            .values_list('id', 'user_id', 'description', 'date', 'crop_id', 'crop__name')
+        )
+        activity_rows, activity_created = self.scan(
+            activities, batch_size, lambda row: activity_alert(*row, today=today),
+        )
+        return crop_rows, crop_created, activity_rows, activity_created
+
+    def scan(self, queryset, batch_size, build):
+        """Create the missing notifications for ``queryset`` one chunk at a time.
+
+        A chunk is turned into candidate notifications, the ones whose dedupe
+        key already exists for that user (read or not, see ``already_sent``)
+        are dropped with a single lookup, and the rest are inserted in one ``bulk_create``.
+        Returns ``(rows scanned, notifications created)``.
+        """
+        rows = created = 0
+        iterator = queryset.iterator(chunk_size=batch_size)
+        while True:
+            chunk = list(islice(iterator, batch_size))
+            if not chunk:
+                break
+            rows += len(chunk)
+            candidates = [build(row) for row in chunk]
+            existing = already_sent(candidates)
+            missing = [n for n in candidates if (n.user_id, n.dedupe_key) not in existing]
+            if missing:
+                with sharding.atomic():
+                    Notification.objects.bulk_create(missing, batch_size=batch_size)
+                    NotificationCounter.add_created(missing)
+                    for user_id in {n.user_id for n in missing}:
+                        CollectionVersion.bump(user_id, Notification)
+                for user_id in {n.user_id for n in missing}:
+                    invalidate_dashboard(user_id)
+                publish(n.user_id for n in missing)
+                created += len(missing)
+        return rows, created
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seed import seed_farm
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic users with crops, activities, resources and '
+        'notifications for load testing. Every user gets an API token and '
+        'the given password.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of users to create.')
+        parser.add_argument('--crops', type=int, default=10, help='Crops per user.')
+        parser.add_argument('--activities', type=int, default=10, help='Activities per crop.')
+        parser.add_argument('--resources', type=int, default=20, help='Resources per user.')
+        parser.add_argument('--notifications', type=int, default=50, help='Notifications per user.')
+        parser.add_argument('--password', default='farm-pass', help='Password for every generated user.')
+        parser.add_argument('--prefix', default='farmer', help='Username prefix; numbering continues after existing users.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT.')
+        parser.add_argument('--users-per-transaction', type=int, default=100, help='Users written per transaction.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible data.')
+
+    def handle(self, *args, **options):
+        counts = ['users', 'crops', 'activities', 'resources', 'notifications']
+        if any(options[name] < 0 for name in counts):
+            raise CommandError('Counts cannot be negative')
+        if options['batch_size'] < 1 or options['users_per_transaction'] < 1:
+            raise CommandError('--batch-size and --users-per-transaction must be positive')
+
+        started = time.monotonic()
+
+        def progress(totals):
+            self.stdout.write(f"{totals['users']}/{options['users']} users", ending='\r')
+
+        totals = seed_farm(
+            users=options['users'],
+            crops=options['crops'],
+            activities=options['activities'],
+            resources=options['resources'],
+            notifications=options['notifications'],
+            password=options['password'],
+            prefix=options['prefix'],
+            batch_size=options['batch_size'],
+            users_per_transaction=options['users_per_transaction'],
+            seed=options['seed'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        elapsed = time.monotonic() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            'Created ' + ', '.join(f'{totals.get(name, 0)} {name}' for name in counts)
+            + f' in {elapsed:.2f}s ({rows / elapsed if elapsed else rows:.0f} rows/s)'
+        ))
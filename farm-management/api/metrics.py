@@ -0,0 +1,223 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from . import response_cache
+
+logger = logging.getLogger('api.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# SQL statements kept per request for the slow-request log
+MAX_RECORDED_QUERIES = 50
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Per-process request metrics keyed by ``(url name, method)``.
+
+    Every worker process keeps its own numbers; Prometheus sums the series
+    scraped from each of them.
+    """
+
+    METRICS = [
+        ('farm_http_request_duration_seconds', 'Request latency', LATENCY_BUCKETS),
+        ('farm_db_queries_per_request', 'Database queries per request', QUERY_BUCKETS),
+        ('farm_db_query_duration_seconds', 'Time spent in database queries per request', LATENCY_BUCKETS),
+        ('farm_json_render_duration_seconds', 'Time spent encoding serialized response data as JSON', LATENCY_BUCKETS),
+        ('farm_http_response_bytes', 'Response body size', BYTES_BUCKETS),
+    ]
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {name: {} for name, _, _ in self.METRICS}
+            self._requests = {}
+
+    def observe(self, view, method, status, values):
+        with self._lock:
+            key = (view, method)
+            self._requests[key + (status,)] = self._requests.get(key + (status,), 0) + 1
+            for name, _, buckets in self.METRICS:
+                if values.get(name) is not None:
+                    self._histograms[name].setdefault(key, Histogram(buckets)).observe(values[name])
+
+    def render(self):
+        """Everything recorded so far in the Prometheus text exposition format."""
+        lines = [
+            '# HELP farm_http_requests_total Requests handled',
+            '# TYPE farm_http_requests_total counter',
+        ]
+        with self._lock:
+            for (view, method, status), count in sorted(self._requests.items()):
+                lines.append(f'farm_http_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+            for name, help_text, buckets in self.METRICS:
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for (view, method), histogram in sorted(self._histograms[name].items()):
+                    labels = f'view="{view}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+        cache = response_cache.stats.snapshot()
+        lines += [
+            '# HELP farm_response_cache_requests_total Response cache lookups',
+            '# TYPE farm_response_cache_requests_total counter',
+            f'farm_response_cache_requests_total{{result="hit"}} {cache["hits"]}',
+            f'farm_response_cache_requests_total{{result="miss"}} {cache["misses"]}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` that counts and times every query."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = []
+        # Async views can query from several worker threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.count += 1
+                self.duration += elapsed
+                if len(self.queries) < MAX_RECORDED_QUERIES:
+                    self.queries.append((elapsed, sql))
+
+
+# The current request's recorder. A context variable rather than wrappers
+# entered around the view: under ASGI sync views and the async ORM run on
+# other threads, with their own connections, but in a copy of the context.
+_recorder = contextvars.ContextVar('query_recorder', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def watch(connection):
+    # Installed on every connection as it opens, like routing.record_writes
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_queries)
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that records how long encoding each body took.
+
+    The serializer has already turned the objects into data by then, so
+    serializer time is part of the request's, not this, duration.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            request = (renderer_context or {}).get('request')
+            if request is not None:
+                request._request.render_seconds = time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Record latency, queries, JSON render time and body size per URL name.
+
+    Queries are counted on every database, from whichever thread runs
+    them, under WSGI and ASGI alike. Requests slower than
+    ``SLOW_REQUEST_MS`` are logged with their slowest SQL statements.
+    Queries run while a streaming body is consumed happen after this
+    middleware returns and are not counted.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        token = _recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _recorder.reset(token)
+        self.record(request, response, time.perf_counter() - started, recorder)
+        return response
+
+    def record(self, request, response, elapsed, recorder):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        if view == 'metrics':
+            return
+        registry.observe(view, request.method, response.status_code, {
+            'farm_http_request_duration_seconds': elapsed,
+            'farm_db_queries_per_request': recorder.count,
+            'farm_db_query_duration_seconds': recorder.duration,
+            'farm_json_render_duration_seconds': getattr(request, 'render_seconds', None),
+            'farm_http_response_bytes': None if response.streaming else len(response.content),
+        })
+
+        if elapsed * 1000 >= getattr(settings, 'SLOW_REQUEST_MS', 500):
+            slowest = sorted(recorder.queries, reverse=True)[:5]
+            logger.warning('slow request', extra={
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 1),
+                'queries': recorder.count,
+                'query_ms': round(recorder.duration * 1000, 1),
+                'slowest_sql': [{'ms': round(ms * 1000, 1), 'sql': sql} for ms, sql in slowest],
+            })
@@ -0,0 +1,62 @@
+import hashlib
+import re
+from datetime import date
+
+from django.db import migrations
+
+HARVEST_RE = re.compile(r"^Your crop .* is due for harvest in \d+ day\(s\) on (\d{4}-\d{2}-\d{2})\.$")
+ACTIVITY_RE = re.compile(r"^Activity '(.*)' for .* is due in \d+ day\(s\) on (\d{4}-\d{2}-\d{2})\.$", re.S)
+BATCH_SIZE = 1000
+
+
+def dedupe_key(kind, source_id, due_date):
+    # Frozen copy of Notification.make_dedupe_key
+    raw = f"{kind}:{source_id}:{due_date.isoformat() if due_date else ''}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def backfill(apps, schema_editor):
+    Notification = apps.get_model('api', 'Notification')
+    Activity = apps.get_model('api', 'Activity')
+    activity_ids = {}
+    batch = []
+
+    for notification in Notification.objects.filter(dedupe_key='').iterator(chunk_size=BATCH_SIZE):
+        key = None
+        harvest = HARVEST_RE.match(notification.message)
+        activity = ACTIVITY_RE.match(notification.message)
+        if harvest and notification.crop_id:
+            key = dedupe_key('harvest', notification.crop_id, date.fromisoformat(harvest.group(1)))
+        elif activity and notification.crop_id:
+            description, due = activity.group(1), date.fromisoformat(activity.group(2))
+            lookup = (notification.user_id, notification.crop_id, description, due)
+            if lookup not in activity_ids:
+                activity_ids[lookup] = Activity.objects.filter(
+                    user_id=notification.user_id,
+                    crop_id=notification.crop_id,
+                    description=description,
+                    date=due,
+                ).values_list('id', flat=True).first()
+            if activity_ids[lookup]:
+                key = dedupe_key('activity', activity_ids[lookup], due)
+        # Anything we cannot attribute gets a key of its own so it never
+        # suppresses a new alert.
+        notification.dedupe_key = key or dedupe_key('legacy', notification.pk, None)
+        batch.append(notification)
+        if len(batch) >= BATCH_SIZE:
+            Notification.objects.bulk_update(batch, ['dedupe_key'])
+            batch = []
+
+    if batch:
+        Notification.objects.bulk_update(batch, ['dedupe_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_notification_dedupe_key_and_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
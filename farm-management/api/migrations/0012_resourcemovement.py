@@ -0,0 +1,33 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_collectionversion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResourceMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('consumption', 'Consumption'), ('restock', 'Restock'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('delta', models.FloatField()),
+                ('occurred_on', models.DateField(default=django.utils.timezone.localdate)),
+                ('note', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('resource', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='api.resource')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resource_movements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['resource', 'occurred_on'], name='movement_resource_date_idx'), models.Index(fields=['user', '-occurred_on'], name='movement_user_date_idx')],
+            },
+        ),
+    ]
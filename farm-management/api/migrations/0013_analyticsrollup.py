@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 12:39
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_resourcemovement'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('activities_weekly', 'Activities per crop per week'), ('activities_monthly', 'Activities per crop per month'), ('planted', 'Crops planted per month'), ('harvested', 'Crops due for harvest per month'), ('consumed', 'Resource consumption per month'), ('restocked', 'Resource restocks per month')], max_length=20)),
+                ('period_start', models.DateField()),
+                ('subject_id', models.BigIntegerField(default=0)),
+                ('name', models.CharField(blank=True, default='', max_length=100)),
+                ('status', models.CharField(blank=True, default='', max_length=20)),
+                ('value', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'metric', 'period_start', 'subject_id', 'name', 'status'), name='analytics_rollup_unique')],
+            },
+        ),
+    ]
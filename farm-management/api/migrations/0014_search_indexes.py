@@ -0,0 +1,78 @@
+from django.db import migrations
+
+# The search index lives outside the Django models: a generated tsvector
+# column with a GIN index per table on PostgreSQL, and an FTS5 table per
+# model kept in sync by triggers on SQLite. Both are maintained by the
+# database itself, so bulk_create, COPY imports and raw SQL stay indexed.
+# See api/search.py for the queries that use them.
+
+TABLES = {
+    'api_crop': "coalesce(name, '') || ' ' || coalesce(variety, '')",
+    'api_activity': "coalesce(description, '')",
+    'api_notification': "coalesce(message, '')",
+}
+
+
+def postgresql(table, body):
+    return [
+        f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('english'::regconfig, {body})) STORED",
+        f"CREATE INDEX {table}_search_idx ON {table} USING GIN (search_vector)",
+    ], [
+        f"DROP INDEX IF EXISTS {table}_search_idx",
+        f"ALTER TABLE {table} DROP COLUMN IF EXISTS search_vector",
+    ]
+
+
+def sqlite(table, body):
+    fts = f'{table}_search'
+    new_body = body.replace('coalesce(', 'coalesce(new.')
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5(body, tokenize='porter unicode61')",
+        f"INSERT INTO {fts}(rowid, body) SELECT id, {body} FROM {table}",
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, body) VALUES (new.id, {new_body}); END",
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE ON {table} BEGIN "
+        f"UPDATE {fts} SET body = {new_body} WHERE rowid = old.id; END",
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; END",
+    ], [
+        f"DROP TRIGGER IF EXISTS {fts}_insert",
+        f"DROP TRIGGER IF EXISTS {fts}_update",
+        f"DROP TRIGGER IF EXISTS {fts}_delete",
+        f"DROP TABLE IF EXISTS {fts}",
+    ]
+
+
+def statements(connection, reverse=False):
+    build = {'postgresql': postgresql, 'sqlite': sqlite}.get(connection.vendor)
+    if build is None:
+        # Other databases fall back to unindexed substring matching
+        return []
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+            if not cursor.fetchone()[0]:
+                return []
+    return [sql for table, body in TABLES.items() for sql in build(table, body)[1 if reverse else 0]]
+
+
+def create(apps, schema_editor):
+    for sql in statements(schema_editor.connection):
+        schema_editor.execute(sql)
+
+
+def drop(apps, schema_editor):
+    for sql in statements(schema_editor.connection, reverse=True):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_analyticsrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(create, drop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:05
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+sync = import_module('api.migrations.0017_sync')
+
+
+def number_notifications(apps, schema_editor):
+    # Existing rows are numbered in (created_at, id) order per user, the
+    # closest record there is of the order they were committed in
+    connection = schema_editor.connection
+    notification = connection.ops.quote_name(apps.get_model('api', 'Notification')._meta.db_table)
+    counter = connection.ops.quote_name(apps.get_model('api', 'NotificationCounter')._meta.db_table)
+    schema_editor.execute(
+        f'UPDATE {notification} SET seq = numbered.seq FROM ('
+        f'SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at, id) AS seq FROM {notification}'
+        f') AS numbered WHERE {notification}.id = numbered.id'
+    )
+    schema_editor.execute(
+        f'UPDATE {counter} SET last_seq = COALESCE('
+        f'(SELECT MAX(seq) FROM {notification} WHERE {notification}.user_id = {counter}.user_id), 0)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='notificationcounter',
+            name='last_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(sync.restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(number_notifications, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'seq'], name='notif_user_seq_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.db import models
+import hashlib
+from collections import Counter
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
+from django.utils import timezone
 
 class Crop(models.Model):
     STATUS_CHOICES = [
@@ -13,6 +16,13 @@ class Crop(models.Model):
     planting_date = models.DateField()
     harvest_date = models.DateField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Planting')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'harvest_date'], name='crop_user_harvest_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='crop_user_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.variety}) - {self.user.username}"
@@ -36,19 +46,75 @@ class Resource(models.Model):
     type = models.CharField(max_length=50)
     unit = models.CharField(max_length=20, choices=UNIT_CHOICES, null=True, blank=True, default='units')
     usage_status = models.CharField(max_length=20, choices=USAGE_STATUS_CHOICES, default='available')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'usage_status'], name='resource_user_status_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='resource_user_updated_idx'),
+        ]
+
+    @staticmethod
+    def opening_status(quantity):
+        """usage_status of a new resource; the ledger keeps it current afterwards."""
+        return 'available' if quantity > 0 else 'depleted'
 
     def __str__(self):
         return f"{self.name} ({self.quantity} {self.unit or 'units'}, {self.usage_status}) - {self.user.username}"
 
+class ResourceMovement(models.Model):
+    """Append-only stock ledger entry for a resource.
+
+    ``delta`` is signed: negative for consumption, positive for restocks,
+    either for stock-take adjustments. ``Resource.quantity`` is the running
+    balance, moved by the same F() expression that inserts the entry.
+    """
+    KIND_CHOICES = [
+        ('consumption', 'Consumption'),
+        ('restock', 'Restock'),
+        ('adjustment', 'Adjustment'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='resource_movements')
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    delta = models.FloatField()
+    occurred_on = models.DateField(default=timezone.localdate)
+    note = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['resource', 'occurred_on'], name='movement_resource_date_idx'),
+            models.Index(fields=['user', '-occurred_on'], name='movement_user_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.delta:+g} {self.resource_id} on {self.occurred_on}"
+
 class Activity(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
     description = models.TextField()
     date = models.DateField()
     crop = models.ForeignKey(Crop, on_delete=models.CASCADE, related_name='activities')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='activity_user_date_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='activity_user_updated_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.crop.name} - {self.user.username}"
 
+class NotificationQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        self._for_write = True
+        with transaction.atomic(using=self.db):
+            Notification.number(objs, self.db)
+            return super().bulk_create(objs, *args, **kwargs)
+
 class Notification(models.Model):
     TYPE_CHOICES = [
         ('INFO', 'Information'),
@@ -61,6 +127,331 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     crop = models.ForeignKey(Crop, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications')
+    dedupe_key = models.CharField(max_length=40, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+    # Position in the user's notifications in commit order; the cursor of
+    # the stream, long-poll and ?since= (see NotificationCounter.take_seqs)
+    seq = models.BigIntegerField(default=0)
+
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'seq'], name='notif_user_seq_idx'),
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notif_user_read_created_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='notif_user_updated_idx'),
+            models.Index(fields=['user', 'dedupe_key'], name='notif_user_dedupe_idx'),
+            # Finds expired rows for purge_notifications
+            models.Index(fields=['is_read', 'created_at'], name='notif_read_created_idx'),
+        ]
+
+    @staticmethod
+    def make_dedupe_key(kind, source_id, due_date):
+        """Fixed-width key identifying one alert about one object and due date."""
+        raw = f"{kind}:{source_id}:{due_date.isoformat() if due_date else ''}"
+        return hashlib.sha1(raw.encode()).hexdigest()
+
+    @staticmethod
+    def number(notifications, using):
+        """Give new ``notifications`` the next ``seq`` of their users.
+
+        Rows that already have one, e.g. copied from another shard, keep it.
+        Users are locked in id order so concurrent writers cannot deadlock.
+        """
+        by_user = {}
+        for notification in notifications:
+            if not notification.seq:
+                by_user.setdefault(notification.user_id, []).append(notification)
+        for user_id in sorted(by_user):
+            for notification, seq in zip(by_user[user_id], NotificationCounter.take_seqs(user_id, len(by_user[user_id]), using)):
+                notification.seq = seq
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding or self.seq:
+            return super().save(*args, **kwargs)
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            self.number([self], using)
+            super().save(*args, **kwargs)
 
     def __str__(self):
-        return f"{self.message} - {self.user.username} ({'Read' if self.is_read else 'Unread'})"
\ No newline at end of file
+        return f"{self.message} - {self.user.username} ({'Read' if self.is_read else 'Unread'})"
+
+class ArchivedNotification(models.Model):
+    """Cold copy of a notification removed by ``purge_notifications``.
+
+    ``notification_id`` and ``crop_id`` are plain ids: the original row is
+    gone and the crop may be deleted later.
+    """
+    notification_id = models.BigIntegerField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_notifications')
+    message = models.TextField()
+    type = models.CharField(max_length=20, choices=Notification.TYPE_CHOICES)
+    is_read = models.BooleanField()
+    created_at = models.DateTimeField()
+    crop_id = models.BigIntegerField(null=True, blank=True)
+    dedupe_key = models.CharField(max_length=40, blank=True, default='')
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='archived_notif_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.message} - {self.user_id} (archived)"
+
+class NotificationOutbox(models.Model):
+    """Pending alert work recorded alongside Crop/Activity writes.
+
+    Rows are appended by the post_save receivers and drained by the
+    ``process_outbox`` command, which turns them into ``Notification`` rows.
+    """
+    KIND_CHOICES = [
+        ('harvest', 'Harvest'),
+        ('activity', 'Activity'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notification_outbox')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['available_at', 'id'],
+                name='outbox_pending_idx',
+                condition=models.Q(processed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} ({'processed' if self.processed_at else 'pending'})"
+
+class NotificationCounter(models.Model):
+    """Per-user unread notification count, kept in step with every write.
+
+    Writers adjust it with an F() expression in the same transaction as the
+    notification change, so concurrent updates never lose increments and
+    reading the badge count is a single primary-key lookup.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread = models.IntegerField(default=0)
+    last_seq = models.BigIntegerField(default=0)
+
+    @classmethod
+    def adjust(cls, user_id, delta):
+        # A missing row is created from a real COUNT on the next read, so
+        # there is nothing to adjust yet.
+        if delta:
+            cls.objects.filter(user_id=user_id).update(unread=models.F('unread') + delta)
+
+    @classmethod
+    def add_created(cls, notifications):
+        """Account for notifications inserted with bulk_create (no post_save)."""
+        for user_id, created in Counter(n.user_id for n in notifications if not n.is_read).items():
+            cls.adjust(user_id, created)
+
+    @classmethod
+    def take_seqs(cls, user_id, count, using=None):
+        """The next ``count`` numbers of the user's notification sequence.
+
+        Must run in the transaction inserting the notifications. The UPDATE
+        locks the counter row until that transaction ends, so the next writer
+        only gets its numbers once these rows are committed: a user's
+        notifications become visible in ``seq`` order, which ids do not
+        promise across concurrent writers or shard moves.
+        """
+        counters = cls.objects.using(using).filter(user_id=user_id)
+        if not counters.update(last_seq=models.F('last_seq') + count):
+            cls.objects.using(using).get_or_create(user_id=user_id, defaults=cls._rebuilt(user_id, using))
+            counters.update(last_seq=models.F('last_seq') + count)
+        last = counters.values_list('last_seq', flat=True).get()
+        return range(last - count + 1, last + 1)
+
+    @staticmethod
+    def _rebuilt(user_id, using=None):
+        notifications = Notification.objects.using(using).filter(user_id=user_id)
+        return {
+            'unread': notifications.filter(is_read=False).count(),
+            'last_seq': notifications.aggregate(last=models.Max('seq'))['last'] or 0,
+        }
+
+    @classmethod
+    def unread_for(cls, user_id):
+        unread = cls.objects.filter(user_id=user_id).values_list('unread', flat=True).first()
+        if unread is None:
+            counter, _ = cls.objects.get_or_create(user_id=user_id, defaults=cls._rebuilt(user_id))
+            unread = counter.unread
+        return unread
+
+    @classmethod
+    async def aunread_for(cls, user_id):
+        unread = await cls.objects.filter(user_id=user_id).values_list('unread', flat=True).afirst()
+        if unread is None:
+            notifications = Notification.objects.filter(user_id=user_id)
+            counter, _ = await cls.objects.aget_or_create(user_id=user_id, defaults={
+                'unread': await notifications.filter(is_read=False).acount(),
+                'last_seq': (await notifications.aaggregate(last=models.Max('seq')))['last'] or 0,
+            })
+            unread = counter.unread
+        return unread
+
+    def __str__(self):
+        return f"{self.user_id}: {self.unread} unread"
+
+class CollectionVersion(models.Model):
+    """Per-user version stamp for each API collection, used for conditional GET.
+
+    Bumped in the same transaction as every write to a row the collection
+    serializes, so an unchanged ``(version, modified)`` pair means an
+    unchanged response.
+    """
+    COLLECTIONS = ['crops', 'resources', 'activities', 'notifications']
+    # Activities and notifications embed their crop, so crop writes change them too
+    AFFECTED = {
+        'crop': ['crops', 'activities', 'notifications'],
+        'resource': ['resources'],
+        'activity': ['activities'],
+        'notification': ['notifications'],
+    }
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='collection_versions')
+    collection = models.CharField(max_length=20)
+    version = models.PositiveBigIntegerField(default=1)
+    modified = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'collection'], name='collection_version_unique'),
+        ]
+
+    @classmethod
+    def bump(cls, user_id, model):
+        # Never creates rows: a bump can run during a user-delete cascade,
+        # and a missing row is created on the next read anyway.
+        cls.objects.filter(user_id=user_id, collection__in=cls.AFFECTED[model._meta.model_name]).update(
+            version=models.F('version') + 1, modified=timezone.now(),
+        )
+
+    @classmethod
+    def create_for(cls, user_id):
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, collection=collection) for collection in cls.COLLECTIONS],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def current(cls, user_id, collection):
+        """Return ``(version, modified)`` for one of the user's collections."""
+        row = cls.objects.filter(user_id=user_id, collection=collection).values_list('version', 'modified').first()
+        if row is None:
+            stamp, _ = cls.objects.get_or_create(user_id=user_id, collection=collection)
+            row = stamp.version, stamp.modified
+        return row
+
+    @classmethod
+    async def acurrent(cls, user_id, collection):
+        row = await cls.objects.filter(user_id=user_id, collection=collection).values_list('version', 'modified').afirst()
+        if row is None:
+            stamp, _ = await cls.objects.aget_or_create(user_id=user_id, collection=collection)
+            row = stamp.version, stamp.modified
+        return row
+
+    def __str__(self):
+        return f"{self.user_id} {self.collection} v{self.version}"
+
+class AnalyticsRollup(models.Model):
+    """Pre-aggregated counts behind the analytics endpoints.
+
+    One row per user, metric, period and group: activities per crop per
+    week and per month, crops planted or due for harvest per month by name and status,
+    and resource consumption and restocks per month. Kept current by
+    ``api.analytics`` on every write and rebuilt by ``rebuild_rollups``.
+    ``subject_id`` is a crop or resource id, not a foreign key, so rows
+    outlive the deletes that decrement them; rows that reach zero are
+    dropped by the next rebuild.
+    """
+    METRIC_CHOICES = [
+        ('activities_weekly', 'Activities per crop per week'),
+        ('activities_monthly', 'Activities per crop per month'),
+        ('planted', 'Crops planted per month'),
+        ('harvested', 'Crops due for harvest per month'),
+        ('consumed', 'Resource consumption per month'),
+        ('restocked', 'Resource restocks per month'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='analytics_rollups')
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    period_start = models.DateField()
+    subject_id = models.BigIntegerField(default=0)
+    name = models.CharField(max_length=100, blank=True, default='')
+    status = models.CharField(max_length=20, blank=True, default='')
+    value = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'metric', 'period_start', 'subject_id', 'name', 'status'],
+                name='analytics_rollup_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.metric} {self.period_start}: {self.value}"
+
+class UserShard(models.Model):
+    """The database alias holding a user's farm data; see ``api.sharding``.
+
+    Stored on the default database next to the users and tokens. Users
+    without a row live on the default database. ``moving`` is set while
+    ``rebalance_shards`` copies the user elsewhere, and turns their writes
+    away until the copy is done.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='shard')
+    alias = models.CharField(max_length=50, db_index=True)
+    moving = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"{self.user_id} on {self.alias}{' (moving)' if self.moving else ''}"
+
+class SyncTombstone(models.Model):
+    """A deleted crop, resource, activity or notification, for ``/api/sync/``.
+
+    Written when the row is deleted, including by cascades and the
+    notification retention purge, and kept for ``SYNC_TOMBSTONE_DAYS`` so
+    offline clients can drop their copy on the next sync.
+    """
+    COLLECTIONS = {
+        'crop': 'crops',
+        'resource': 'resources',
+        'activity': 'activities',
+        'notification': 'notifications',
+    }
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_tombstones')
+    collection = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id'], name='tombstone_user_deleted_idx'),
+            # Finds expired rows for purge_notifications
+            models.Index(fields=['deleted_at'], name='tombstone_deleted_idx'),
+        ]
+
+    @classmethod
+    def record(cls, model, user_id, object_ids):
+        cls.objects.bulk_create([
+            cls(user_id=user_id, collection=cls.COLLECTIONS[model._meta.model_name], object_id=object_id)
+            for object_id in object_ids
+        ])
+
+    def __str__(self):
+        return f"{self.collection} {self.object_id} deleted {self.deleted_at}"
+
@@ -0,0 +1,203 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import sharding
+from .alerts import alert_window, already_sent, harvest_alert, activity_alert
+from .dashboard import invalidate_dashboard
+from .models import Crop, Activity, Notification, NotificationCounter, NotificationOutbox, CollectionVersion
+from .pubsub import publish
+
+# How long a claimed row stays invisible to other workers before it is retried
+LEASE_SECONDS = 300
+MAX_BACKOFF_SECONDS = 3600
+
+
+def enqueue(kind, object_id, user_id):
+    NotificationOutbox.objects.create(kind=kind, object_id=object_id, user_id=user_id)
+
+
+def enqueue_many(kind, date_field, objects):
+    """Bulk counterpart of ``enqueue`` for rows written without post_save."""
+    today, threshold = alert_window()
+    NotificationOutbox.objects.bulk_create([
+        NotificationOutbox(kind=kind, object_id=obj.pk, user_id=obj.user_id)
+        for obj in objects
+        if getattr(obj, date_field) and today <= getattr(obj, date_field) <= threshold
+    ])
+
+
+def claim(limit, max_attempts):
+    """Lease up to ``limit`` due outbox rows to the caller.
+
+    On PostgreSQL concurrent workers skip each other's locked rows; the
+    lease (``available_at`` pushed into the future) keeps a claimed row from
+    being picked up again until it is processed or the lease runs out.
+    """
+    now = timezone.now()
+    with sharding.atomic():
+        pending = (
+            NotificationOutbox.objects.filter(
+                processed_at__isnull=True,
+                available_at__lte=now,
+                attempts__lt=max_attempts,
+            )
+            .order_by('available_at', 'id')
+            .select_for_update(skip_locked=sharding.connection().features.has_select_for_update_skip_locked)
+        )
+        events = list(pending[:limit])
+        if events:
+            NotificationOutbox.objects.filter(id__in=[event.id for event in events]).update(
+                available_at=now + timedelta(seconds=LEASE_SECONDS),
+            )
+    return events
+
+
+def process(events, today=None):
+    """Turn one claimed chunk into notifications and mark it processed.
+
+    Everything happens in one transaction: the source rows are loaded in
+    bulk, alerts outside the window or already sent (see ``already_sent``)
+    are dropped, and the rest are inserted together.
+    Returns the number of notifications created.
+    """
+    today, threshold = alert_window(today)
+    crop_ids = {event.object_id for event in events if event.kind == 'harvest'}
+    activity_ids = {event.object_id for event in events if event.kind == 'activity'}
+
+    candidates = {}
+    crops = Crop.objects.filter(
+        id__in=crop_ids, harvest_date__gte=today, harvest_date__lte=threshold,
+    ).values_list('id', 'user_id', 'name', 'variety', 'harvest_date')
+    for row in crops:
+        alert = harvest_alert(*row, today=today)
+        candidates[(alert.user_id, alert.dedupe_key)] = alert
+    activities = Activity.objects.filter(
+        id__in=activity_ids, date__gte=today, date__lte=threshold,
+    ).values_list('id', 'user_id', 'description', 'date', 'crop_id', 'crop__name')
+    for row in activities:
+        alert = activity_alert(*row, today=today)
+        candidates[(alert.user_id, alert.dedupe_key)] = alert
+
+    with sharding.atomic():
+        existing = already_sent(list(candidates.values()))
+        missing = [alert for key, alert in candidates.items() if key not in existing]
+        Notification.objects.bulk_create(missing)
+        NotificationCounter.add_created(missing)
+        for user_id in {alert.user_id for alert in missing}:
+            CollectionVersion.bump(user_id, Notification)
+        NotificationOutbox.objects.filter(id__in=[event.id for event in events]).update(
+            processed_at=timezone.now(),
+            attempts=F('attempts') + 1,
+            last_error='',
+        )
+
+    for user_id in {alert.user_id for alert in missing}:
+        invalidate_dashboard(user_id)
+    publish(alert.user_id for alert in missing)
+    return len(missing)
+
+
+def fail(events, error):
+    """Record a failed attempt and back off exponentially before the retry."""
+    now = timezone.now()
+    for event in events:
+        attempts = event.attempts + 1
+        delay = min(2 ** attempts, MAX_BACKOFF_SECONDS)
+        NotificationOutbox.objects.filter(id=event.id).update(
+            attempts=attempts,
+            last_error=str(error),
+            available_at=now + timedelta(seconds=delay),
+        )
+
+
+def purge(now=None, days=None, max_attempts=None, batch_size=None):
+    """Delete finished outbox rows older than ``OUTBOX_RETENTION_DAYS``.
+
+    Finished means processed, or out of attempts; those count from their
+    last retry so their ``last_error`` stays around for a while. Deletes
+    ``batch_size`` rows per transaction and returns the number removed.
+    """
+    if days is None:
+        days = getattr(settings, 'OUTBOX_RETENTION_DAYS', 7)
+    before = (now or timezone.now()) - timedelta(days=days)
+    max_attempts = max_attempts or getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 500)
+    finished = NotificationOutbox.objects.filter(
+        Q(processed_at__lt=before) | Q(processed_at__isnull=True, attempts__gte=max_attempts, available_at__lt=before)
+    )
+    removed = 0
+    while True:
+        with sharding.atomic():
+            ids = list(finished.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if ids:
+                NotificationOutbox.objects.filter(pk__in=ids).delete()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            return removed
+
+
+def _process_chunk(events, alias, close_connection):
+    # Worker threads start without the caller's shard
+    with sharding.use_shard(alias):
+        try:
+            created = process(events)
+            return created, 0
+        except Exception as exc:
+            fail(events, exc)
+            return 0, len(events)
+        finally:
+            if close_connection:
+                # Worker threads own their connection; don't leak it to the pool.
+                sharding.connection().close()
+
+
+def drain(batch_size=None, workers=None, max_attempts=None):
+    """Process due outbox rows until none are left.
+
+    Each round claims ``batch_size * workers`` rows and hands one chunk to
+    each worker thread. With a single worker everything runs inline on the
+    caller's connection. Returns a stats dict with row counts and the
+    oldest and average enqueue-to-processed lag in seconds.
+    """
+    batch_size = batch_size or getattr(settings, 'OUTBOX_BATCH_SIZE', 500)
+    workers = workers or getattr(settings, 'OUTBOX_WORKERS', 4)
+    max_attempts = max_attempts or getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    stats = {'processed': 0, 'failed': 0, 'created': 0, 'max_lag': 0.0, 'avg_lag': 0.0}
+    total_lag = 0.0
+    alias = sharding.current()
+
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        while True:
+            events = claim(batch_size * workers, max_attempts)
+            if not events:
+                break
+            chunks = [events[i:i + batch_size] for i in range(0, len(events), batch_size)]
+            if executor:
+                results = list(executor.map(lambda chunk: _process_chunk(chunk, alias, True), chunks))
+            else:
+                results = [_process_chunk(chunk, alias, False) for chunk in chunks]
+
+            now = timezone.now()
+            for chunk, (created, failed) in zip(chunks, results):
+                stats['created'] += created
+                stats['failed'] += failed
+                if failed:
+                    continue
+                stats['processed'] += len(chunk)
+                for event in chunk:
+                    lag = (now - event.created_at).total_seconds()
+                    total_lag += lag
+                    stats['max_lag'] = max(stats['max_lag'], lag)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if stats['processed']:
+        stats['avg_lag'] = total_lag / stats['processed']
+    return stats
+
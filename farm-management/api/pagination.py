@@ -0,0 +1,35 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class BoundedCursorPagination(CursorPagination):
+    """Keyset pagination with a client-selectable, server-capped page size.
+
+    Clients may pass ``?page_size=`` to ask for more or fewer rows per page,
+    but never more than ``API_MAX_PAGE_SIZE``. The first ordering field is
+    used as the cursor position and the trailing ``id`` keeps the order
+    stable when several rows share the same value.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+    ordering = ('-id',)
+
+
+class CropCursorPagination(BoundedCursorPagination):
+    ordering = ('-planting_date', 'id')
+
+
+class ResourceCursorPagination(BoundedCursorPagination):
+    ordering = ('name', 'id')
+
+
+class ResourceMovementCursorPagination(BoundedCursorPagination):
+    ordering = ('-occurred_on', '-id')
+
+
+class ActivityCursorPagination(BoundedCursorPagination):
+    ordering = ('-date', 'id')
+
+
+class NotificationCursorPagination(BoundedCursorPagination):
+    ordering = ('-created_at', 'id')
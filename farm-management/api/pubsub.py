@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+
+class InProcessBackend:
+    """Wake up streams waiting in this process when a user gets notifications.
+
+    Only useful when notifications are created by the same process that
+    serves the streams; other deployments should use a shared backend such
+    as ``RedisBackend``. Streams poll the database on a timeout either way,
+    so a missed wake-up only delays delivery.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters = defaultdict(set)
+
+    def publish(self, user_id):
+        with self._lock:
+            waiters = list(self._waiters.get(user_id, ()))
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+    async def wait(self, user_id, timeout):
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._lock:
+            self._waiters[user_id].add(waiter)
+        try:
+            await asyncio.wait_for(waiter[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                self._waiters[user_id].discard(waiter)
+                if not self._waiters[user_id]:
+                    del self._waiters[user_id]
+
+
+class RedisBackend:
+    """Fan wake-ups out to every worker process through Redis pub/sub."""
+
+    def __init__(self):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured('RedisBackend requires the redis package')
+        url = getattr(settings, 'NOTIFICATION_PUBSUB_REDIS_URL', 'redis://localhost:6379/0')
+        self._client = redis.Redis.from_url(url)
+        self._async_client = redis.asyncio.Redis.from_url(url)
+
+    def _channel(self, user_id):
+        return f'notifications:{user_id}'
+
+    def publish(self, user_id):
+        self._client.publish(self._channel(user_id), b'1')
+
+    async def wait(self, user_id, timeout):
+        pubsub = self._async_client.pubsub()
+        await pubsub.subscribe(self._channel(user_id))
+        try:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while loop.time() < deadline:
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=deadline - loop.time(),
+                )
+                if message:
+                    return
+        finally:
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'NOTIFICATION_PUBSUB_BACKEND', 'api.pubsub.InProcessBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def publish(user_ids):
+    """Tell any open streams for ``user_ids`` that new notifications exist."""
+    backend = get_backend()
+    for user_id in set(user_ids):
+        backend.publish(user_id)
@@ -0,0 +1,66 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+CACHE_ALIAS = 'responses'
+
+
+class Stats:
+    """Hit/miss counters for this process, read by the cache stats endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / total, 4) if total else None,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+
+
+stats = Stats()
+
+
+def enabled():
+    return getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 300) > 0
+
+
+def cache_key(digest):
+    return f'response:{digest}'
+
+
+def get(digest):
+    """Return the cached response data for ``digest``, or None on a miss."""
+    data = caches[CACHE_ALIAS].get(cache_key(digest))
+    stats.record(data is not None)
+    return data
+
+
+def store(digest, data):
+    caches[CACHE_ALIAS].set(cache_key(digest), data)
+
+
+async def aget(digest):
+    data = await caches[CACHE_ALIAS].aget(cache_key(digest))
+    stats.record(data is not None)
+    return data
+
+
+async def astore(digest, data):
+    await caches[CACHE_ALIAS].aset(cache_key(digest), data)
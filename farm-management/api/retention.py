@@ -0,0 +1,302 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from . import sharding
+from .analytics import month_start
+from .dashboard import invalidate_dashboard
+from .models import Notification, ArchivedNotification, NotificationCounter, CollectionVersion, SyncTombstone
+
+ARCHIVED_FIELDS = ['message', 'type', 'is_read', 'created_at', 'crop_id', 'dedupe_key']
+TABLE = Notification._meta.db_table
+
+
+def _quote(name):
+    return sharding.connection().ops.quote_name(name)
+
+
+def cutoffs(now=None, read_days=None, unread_days=None):
+    """``(read_before, unread_before)``: read and unread rows older than these expire."""
+    now = now or timezone.now()
+    if read_days is None:
+        read_days = getattr(settings, 'NOTIFICATION_RETENTION_READ_DAYS', 90)
+    if unread_days is None:
+        unread_days = getattr(settings, 'NOTIFICATION_RETENTION_UNREAD_DAYS', 365)
+    return now - timedelta(days=read_days), now - timedelta(days=unread_days)
+
+
+def expired(read_before, unread_before):
+    return Notification.objects.filter(
+        Q(is_read=True, created_at__lt=read_before) | Q(is_read=False, created_at__lt=unread_before)
+    )
+
+
+def _removed(unread, user_ids):
+    """Side effects of notifications leaving the hot table, once per user."""
+    for user_id, count in unread.items():
+        NotificationCounter.adjust(user_id, -count)
+    for user_id in user_ids:
+        CollectionVersion.bump(user_id, Notification)
+    for user_id in user_ids:
+        invalidate_dashboard(user_id)
+
+
+def purge_batch(read_before, unread_before, archive, batch_size):
+    """Archive (or just delete) up to ``batch_size`` expired notifications.
+
+    One short transaction per batch; rows another transaction has locked,
+    e.g. while marking them read, are skipped until the next run. Returns
+    the number of rows removed.
+    """
+    with sharding.atomic():
+        rows = list(
+            expired(read_before, unread_before).order_by('pk').select_for_update(skip_locked=True)
+            .values('pk', 'user_id', *ARCHIVED_FIELDS)[:batch_size]
+        )
+        if not rows:
+            return 0
+        if archive:
+            ArchivedNotification.objects.bulk_create([
+                ArchivedNotification(
+                    notification_id=row['pk'], user_id=row['user_id'],
+                    **{field: row[field] for field in ARCHIVED_FIELDS},
+                )
+                for row in rows
+            ])
+        # A queryset delete would send post_delete for every row; the batch
+        # applies the same counter and version changes once per user instead.
+        ids = [row['pk'] for row in rows]
+        with sharding.connection().cursor() as cursor:
+            cursor.execute(f"DELETE FROM {_quote(TABLE)} WHERE id IN ({', '.join(['%s'] * len(ids))})", ids)
+        _removed(
+            Counter(row['user_id'] for row in rows if not row['is_read']),
+            {row['user_id'] for row in rows},
+        )
+        by_user = {}
+        for row in rows:
+            by_user.setdefault(row['user_id'], []).append(row['pk'])
+        for user_id, notification_ids in by_user.items():
+            SyncTombstone.record(Notification, user_id, notification_ids)
+    return len(rows)
+
+
+def purge_notifications(now=None, read_days=None, unread_days=None, archive=None, batch_size=None, progress=None):
+    """Apply the retention policy and return the number of notifications removed.
+
+    On a partitioned table, months older than both cutoffs are dropped as
+    whole partitions first; the remaining expired rows go in batches.
+    """
+    read_before, unread_before = cutoffs(now, read_days, unread_days)
+    if archive is None:
+        archive = getattr(settings, 'NOTIFICATION_ARCHIVE', True)
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_PURGE_BATCH_SIZE', 1000)
+
+    removed = drop_expired_partitions(min(read_before, unread_before), archive) if partitioned() else 0
+    while True:
+        count = purge_batch(read_before, unread_before, archive, batch_size)
+        removed += count
+        if progress:
+            progress(removed)
+        if count < batch_size:
+            return removed
+
+
+def purge_tombstones(now=None, days=None, batch_size=None):
+    """Delete sync tombstones older than ``SYNC_TOMBSTONE_DAYS`` in batches.
+
+    Clients whose sync token is older than that get a 410 and start over
+    with a full sync. Returns the number of tombstones deleted.
+    """
+    if days is None:
+        days = getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30)
+    before = (now or timezone.now()) - timedelta(days=days)
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_PURGE_BATCH_SIZE', 1000)
+    removed = 0
+    while True:
+        with sharding.atomic():
+            ids = list(
+                SyncTombstone.objects.filter(deleted_at__lt=before)
+                .order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if ids:
+                SyncTombstone.objects.filter(pk__in=ids).delete()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            return removed
+
+
+# Monthly range partitioning of notifications by created_at (PostgreSQL only).
+# Partitions are named <table>_pYYYYMM and cover one UTC calendar month.
+
+def partitioned():
+    if sharding.connection().vendor != 'postgresql':
+        return False
+    with sharding.connection().cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def _bound(month):
+    # Generated here from dates, never from input, so safe to inline
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+
+def _partition(month):
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def _create_partitions(cursor, first, last):
+    created = []
+    month = month_start(first)
+    while month <= last:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {_quote(_partition(month))} PARTITION OF {_quote(TABLE)} "
+            f"FOR VALUES FROM ({_bound(month)}) TO ({_bound(_next_month(month))})"
+        )
+        created.append(_partition(month))
+        month = _next_month(month)
+    return created
+
+
+def _horizon(today, months_ahead):
+    last = month_start(today)
+    for _ in range(months_ahead):
+        last = _next_month(last)
+    return last
+
+
+def ensure_partitions(months_ahead=3, today=None):
+    """Create the partitions for this month and ``months_ahead`` more.
+
+    There is no default partition, so rows for a month without one are
+    rejected: run this from cron well before each month starts.
+    """
+    today = today or timezone.now().astimezone(dt_timezone.utc).date()
+    with sharding.atomic(), sharding.connection().cursor() as cursor:
+        return _create_partitions(cursor, today, _horizon(today, months_ahead))
+
+
+def partition_table(months_ahead=3):
+    """Convert the notification table to monthly range partitions.
+
+    Copies every row in one transaction holding an exclusive lock on the
+    table, so run it in a maintenance window. The primary key becomes
+    ``(id, created_at)``, as PostgreSQL requires, and ids keep coming from
+    a sequence continuing after the current maximum.
+    """
+    if sharding.connection().vendor != 'postgresql':
+        raise RuntimeError('Partitioning needs PostgreSQL')
+    if partitioned():
+        return []
+    legacy = f'{TABLE}_unpartitioned'
+    sequence = f'{TABLE}_id_seq'
+    with sharding.atomic(), sharding.connection().cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {_quote(TABLE)} IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes "
+            "WHERE schemaname = current_schema() AND tablename = %s AND indexname <> %s",
+            [TABLE, f'{TABLE}_pkey'],
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+            [TABLE],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s AND is_generated = 'NEVER' "
+            "ORDER BY ordinal_position",
+            [TABLE],
+        )
+        columns = ', '.join(_quote(row[0]) for row in cursor.fetchall())
+        cursor.execute(f"SELECT min(created_at), coalesce(max(id), 0) FROM {_quote(TABLE)}")
+        oldest, max_id = cursor.fetchone()
+
+        cursor.execute(f"ALTER TABLE {_quote(TABLE)} RENAME TO {_quote(legacy)}")
+        cursor.execute(
+            f"CREATE TABLE {_quote(TABLE)} (LIKE {_quote(legacy)} INCLUDING DEFAULTS INCLUDING GENERATED) "
+            f"PARTITION BY RANGE (created_at)"
+        )
+
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        first = oldest.astimezone(dt_timezone.utc).date() if oldest else today
+        created = _create_partitions(cursor, first, _horizon(today, months_ahead))
+
+        cursor.execute(f"INSERT INTO {_quote(TABLE)} ({columns}) SELECT {columns} FROM {_quote(legacy)}")
+        cursor.execute(f"DROP TABLE {_quote(legacy)}")
+        # Dropping the old table freed its key and index names and dropped
+        # its identity sequence
+        cursor.execute(f"ALTER TABLE {_quote(TABLE)} ADD PRIMARY KEY (id, created_at)")
+        cursor.execute(f"CREATE SEQUENCE {_quote(sequence)} START {max_id + 1}")
+        cursor.execute(f"ALTER TABLE {_quote(TABLE)} ALTER COLUMN id SET DEFAULT nextval('{sequence}')")
+        cursor.execute(f"ALTER SEQUENCE {_quote(sequence)} OWNED BY {_quote(TABLE)}.id")
+        # Recreated on the parent, which builds them on every partition
+        for indexdef in indexes:
+            cursor.execute(indexdef)
+        for name, definition in foreign_keys:
+            cursor.execute(f"ALTER TABLE {_quote(TABLE)} ADD CONSTRAINT {_quote(name)} {definition}")
+    return created
+
+
+def _month_of(name):
+    return datetime.strptime(name[len(TABLE) + 2:], '%Y%m').date()
+
+
+def drop_expired_partitions(before, archive):
+    """Remove whole monthly partitions that ended before ``before``.
+
+    Each one is detached concurrently, so queries on the parent keep
+    running, then archived, counted and dropped in one transaction. A
+    table left detached by an interrupted run is finished on the next.
+    Returns the number of notifications removed.
+    """
+    pattern = f'{TABLE}_p______'
+    cutoff = before.astimezone(dt_timezone.utc).date()
+    with sharding.connection().cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, c.relispartition FROM pg_class c "
+            "WHERE c.relname LIKE %s AND c.relkind = 'r' ORDER BY c.relname",
+            [pattern],
+        )
+        tables = [
+            (name, attached) for name, attached in cursor.fetchall()
+            if name[-6:].isdigit() and _next_month(_month_of(name)) <= cutoff
+        ]
+        for name, attached in tables:
+            if attached:
+                cursor.execute(f"ALTER TABLE {_quote(TABLE)} DETACH PARTITION {_quote(name)} CONCURRENTLY")
+
+    removed = 0
+    for name, _ in tables:
+        with sharding.atomic(), sharding.connection().cursor() as cursor:
+            if archive:
+                fields = ', '.join(ARCHIVED_FIELDS)
+                cursor.execute(
+                    f"INSERT INTO {_quote(ArchivedNotification._meta.db_table)} "
+                    f"(notification_id, user_id, {fields}, archived_at) "
+                    f"SELECT id, user_id, {fields}, now() FROM {_quote(name)}"
+                )
+            cursor.execute(
+                f"INSERT INTO {_quote(SyncTombstone._meta.db_table)} (user_id, collection, object_id, deleted_at) "
+                f"SELECT user_id, %s, id, now() FROM {_quote(name)}",
+                [SyncTombstone.COLLECTIONS['notification']],
+            )
+            cursor.execute(f"SELECT user_id, count(*) FILTER (WHERE NOT is_read), count(*) FROM {_quote(name)} GROUP BY user_id")
+            counts = cursor.fetchall()
+            _removed(
+                Counter({user_id: unread for user_id, unread, _ in counts if unread}),
+                {user_id for user_id, _, _ in counts},
+            )
+            cursor.execute(f"DROP TABLE {_quote(name)}")
+            removed += sum(total for _, _, total in counts)
+    return removed
@@ -0,0 +1,159 @@
+import contextvars
+import random
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+_state = contextvars.ContextVar('db_routing', default=None)
+
+
+class RoutingState:
+    """Per-request routing flags, shared by every thread serving the request."""
+
+    def __init__(self, shard=None):
+        self.replica_reads = False
+        self.wrote = False
+        # Set by api.sharding once the request's user is known
+        self.shard = shard
+        self.read_only = False
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def _pin_key(user_id):
+    return f'db-primary-pin:{user_id}'
+
+
+# Statements that change data. A WITH query writes when one of its parts
+# does; SELECT ... FOR UPDATE may be taken for one too, which only pins
+# the user to the primary a little more often.
+_WRITES = re.compile(r'\s*(INSERT|UPDATE|DELETE|MERGE|COPY|TRUNCATE)\b', re.IGNORECASE)
+_WITH = re.compile(r'\s*WITH\b', re.IGNORECASE)
+_DML = re.compile(r'\b(INSERT|UPDATE|DELETE|MERGE)\b', re.IGNORECASE)
+
+
+def is_write(sql):
+    return bool(_WRITES.match(sql) or (_WITH.match(sql) and _DML.search(sql)))
+
+
+def mark_written():
+    """Note a write sent past the connection's wrappers, e.g. a raw COPY."""
+    state = _state.get()
+    if state is not None:
+        state.wrote = True
+
+
+def record_writes(execute, sql, params, many, context):
+    """``execute_wrapper`` on every connection that notices writing statements.
+
+    The router's ``db_for_write`` is also consulted when a related object
+    is merely assigned, so only the SQL actually sent tells that a request
+    wrote.
+    """
+    state = _state.get()
+    if state is not None and not state.wrote and is_write(sql):
+        state.wrote = True
+    return execute(sql, params, many, context)
+
+
+def watch(connection):
+    # Inserted first: connection.execute_wrapper() blocks that are open when
+    # the connection is created pop the last wrapper when they exit.
+    if record_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_writes)
+
+
+def pinned(user_id):
+    """Whether ``user_id`` wrote recently enough that replicas may lag behind."""
+    return cache.get(_pin_key(user_id)) is not None
+
+
+def allow_replica_reads(request):
+    """Let the rest of an authenticated safe request read from a replica."""
+    state = _state.get()
+    if state and request.method in SAFE_METHODS and replicas() and not pinned(request.user.pk):
+        state.replica_reads = True
+
+
+class PrimaryReplicaRouter:
+    """Send reads to a replica only where a view allowed it.
+
+    Everything outside a request, every write, and every read in a request
+    after its first write goes to the primary, so a request always sees its
+    own changes. Migrations only run on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state and state.replica_reads and not state.wrote and replicas():
+            return random.choice(replicas())
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replicas()
+
+
+class DatabaseRoutingMiddleware:
+    """Track writes per request and pin writers to the primary for a while.
+
+    After a request that wrote, the user's reads stay on the primary for
+    ``REPLICA_PIN_SECONDS`` so the next page load sees the change even if
+    the replicas have not caught up yet.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            return self.get_response(request)
+        finally:
+            _state.reset(token)
+            self.pin(request, state)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = _state.set(state)
+        try:
+            return await self.get_response(request)
+        finally:
+            _state.reset(token)
+            self.pin(request, state)
+
+    def pin(self, request, state):
+        user = getattr(request, 'user', None)
+        if state.wrote and replicas() and user is not None and user.is_authenticated:
+            cache.set(_pin_key(user.pk), True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+class ReplicaReadMixin:
+    """Let a view's GET/HEAD/OPTIONS requests read from a replica.
+
+    Applied once authentication has run on the primary, and skipped for
+    users pinned to the primary by a recent write.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        allow_replica_reads(request)
@@ -0,0 +1,108 @@
+import re
+from collections import namedtuple
+
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Crop, Activity, Notification
+
+WORDS = re.compile(r'\w+')
+MAX_TERMS = 8
+
+
+class InvalidSearch(Exception):
+    pass
+
+
+# fields: searched columns, used by the unindexed fallback only
+# date/crop/status: lookups behind the start/end, crop and status filters
+Target = namedtuple('Target', 'model fields date crop status')
+
+TARGETS = {
+    'crops': Target(Crop, ['name', 'variety'], 'planting_date', 'pk', 'status'),
+    'activities': Target(Activity, ['description'], 'date', 'crop_id', 'crop__status'),
+    'notifications': Target(Notification, ['message'], 'created_at__date', 'crop_id', 'crop__status'),
+}
+
+_backends = {}
+
+
+def _backend():
+    """Which index migration 0014 built on the database the search reads, if any."""
+    connection = connections[router.db_for_read(Crop)]
+    if connection.alias not in _backends:
+        if connection.vendor == 'postgresql':
+            _backends[connection.alias] = 'postgresql'
+        elif connection.vendor == 'sqlite' and 'api_crop_search' in connection.introspection.table_names():
+            _backends[connection.alias] = 'sqlite'
+        else:
+            _backends[connection.alias] = None
+    return _backends[connection.alias]
+
+
+def terms(query):
+    found = WORDS.findall((query or '').lower())[:MAX_TERMS]
+    if not found:
+        raise InvalidSearch('q must contain at least one word')
+    return found
+
+
+def _match(target, words):
+    """``(condition, rank)`` expressions matching every word as a prefix."""
+    table = target.model._meta.db_table
+    backend = _backend()
+    if backend == 'postgresql':
+        # Words are \w+ only, so they cannot inject tsquery operators
+        tsquery = ' & '.join(f'{word}:*' for word in words)
+        return (
+            RawSQL(f"\"{table}\".\"search_vector\" @@ to_tsquery('english', %s)", [tsquery], output_field=BooleanField()),
+            RawSQL(f"ts_rank(\"{table}\".\"search_vector\", to_tsquery('english', %s))", [tsquery], output_field=FloatField()),
+        )
+    if backend == 'sqlite':
+        fts = f'{table}_search'
+        match = ' '.join(f'"{word}"*' for word in words)
+        return (
+            Q(pk__in=RawSQL(f'SELECT rowid FROM {fts} WHERE {fts} MATCH %s', [match])),
+            # bm25() is lower for better matches
+            RawSQL(
+                f'SELECT -bm25({fts}) FROM {fts} WHERE {fts} MATCH %s AND rowid = "{table}"."id"',
+                [match], output_field=FloatField(),
+            ),
+        )
+    condition = Q()
+    for word in words:
+        condition &= Q(*[Q(**{f'{field}__icontains': word}) for field in target.fields], _connector=Q.OR)
+    return condition, Value(0.0, output_field=FloatField())
+
+
+def search(user, query, kinds, filters, offset, limit):
+    """Rank the user's crops, activities and notifications matching ``query``.
+
+    Every word must match, as a prefix, after English stemming. Each kind
+    is searched through its index with the filters applied in the same
+    query, and the best ``offset + limit + 1`` hits of each are merged by
+    rank. ``filters`` may hold ``start``/``end`` dates, a crop ``status``
+    and a ``crop`` id. Returns up to ``limit + 1`` ``(kind, rank, object)``
+    tuples so callers can tell whether another page exists.
+    """
+    words = terms(query)
+    hits = []
+    for kind in kinds:
+        target = TARGETS[kind]
+        condition, rank = _match(target, words)
+        queryset = target.model.objects.filter(user=user).filter(condition)
+        if filters.get('start'):
+            queryset = queryset.filter(**{f'{target.date}__gte': filters['start']})
+        if filters.get('end'):
+            queryset = queryset.filter(**{f'{target.date}__lte': filters['end']})
+        if filters.get('status'):
+            queryset = queryset.filter(**{target.status: filters['status']})
+        if filters.get('crop'):
+            queryset = queryset.filter(**{target.crop: filters['crop']})
+        if target.model is not Crop:
+            queryset = queryset.select_related('crop')
+        queryset = queryset.annotate(rank=rank).order_by('-rank', '-pk')
+        hits += [(kind, obj.rank, obj) for obj in queryset[:offset + limit + 1]]
+    hits.sort(key=lambda hit: (-hit[1], hit[0], -hit[2].pk))
+    return hits[offset:offset + limit + 1]
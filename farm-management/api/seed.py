@@ -0,0 +1,176 @@
+import random
+from collections import Counter
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from . import sharding
+from .analytics import rebuild as rebuild_rollups
+from .models import Crop, Resource, Activity, Notification, NotificationCounter, CollectionVersion
+
+CROPS = [
+    ('Maize', ['H614', 'H513', 'DK8031', 'Pioneer 3253']),
+    ('Beans', ['Rosecoco', 'Mwitemania', 'Nyayo', 'KK15']),
+    ('Wheat', ['Kenya Fahari', 'Robin', 'Eagle 10']),
+    ('Tomatoes', ['Anna F1', 'Kilele F1', 'Rio Grande']),
+    ('Potatoes', ['Shangi', 'Dutch Robjin', 'Markies']),
+    ('Kale', ['Sukuma Wiki', 'Collards']),
+    ('Sorghum', ['Gadam', 'Seredo']),
+    ('Cabbage', ['Gloria F1', 'Copenhagen']),
+]
+# Typical days from planting to harvest
+SEASON_DAYS = (60, 150)
+ACTIVITIES = [
+    'Land preparation', 'Planting', 'Weeding', 'Top dressing', 'Spraying',
+    'Irrigation', 'Scouting for pests', 'Harvesting',
+]
+RESOURCES = [
+    ('Urea', 'Fertilizer', 'kgs'),
+    ('DAP', 'Fertilizer', 'kgs'),
+    ('CAN', 'Fertilizer', 'kgs'),
+    ('Diesel', 'Fuel', 'litres'),
+    ('Glyphosate', 'Herbicide', 'litres'),
+    ('Knapsack sprayer', 'Equipment', 'units'),
+    ('Tractor', 'Equipment', 'units'),
+    ('Certified seed', 'Seeds', 'kgs'),
+    ('Manure', 'Fertilizer', 'tons'),
+]
+NOTIFICATIONS = [
+    ('INFO', 'Harvest for {crop} is coming up'),
+    ('WARNING', 'Pest pressure reported near your {crop}'),
+    ('ALERT', 'Activity for {crop} is overdue'),
+]
+
+
+def _crops(user_id, count, rng, today):
+    for _ in range(count):
+        name, varieties = rng.choice(CROPS)
+        planting_date = today + timedelta(days=rng.randint(-240, 60))
+        harvest_date = planting_date + timedelta(days=rng.randint(*SEASON_DAYS))
+        if planting_date > today:
+            status = 'Planting'
+        elif harvest_date - today <= timedelta(days=14):
+            status = 'Harvesting'
+        else:
+            status = 'Growing'
+        yield Crop(
+            user_id=user_id, name=name, variety=rng.choice(varieties),
+            planting_date=planting_date, harvest_date=harvest_date, status=status,
+        )
+
+
+def _activities(crop, count, rng):
+    span = max((crop.harvest_date - crop.planting_date).days, 1)
+    for _ in range(count):
+        yield Activity(
+            user_id=crop.user_id, crop_id=crop.pk, description=rng.choice(ACTIVITIES),
+            date=crop.planting_date + timedelta(days=rng.randint(0, span)),
+        )
+
+
+def _resources(user_id, count, rng):
+    for _ in range(count):
+        name, kind, unit = rng.choice(RESOURCES)
+        yield Resource(
+            user_id=user_id, name=name, type=kind, unit=unit,
+            quantity=round(rng.uniform(0, 500), 1),
+            usage_status=rng.choices(['available', 'in_use', 'depleted'], weights=[6, 3, 1])[0],
+        )
+
+
+def _notifications(user_id, crops, count, rng):
+    # Numbered here: the counter rows that hand out seqs come later
+    for seq in range(1, count + 1):
+        crop = rng.choice(crops) if crops else None
+        kind, message = rng.choice(NOTIFICATIONS)
+        yield Notification(
+            user_id=user_id, crop_id=crop.pk if crop else None, type=kind,
+            message=message.format(crop=crop.name if crop else 'your farm'),
+            is_read=rng.random() < 0.7, seq=seq,
+        )
+
+
+def seed_farm(users, crops, activities, resources, notifications, password,
+              prefix='farmer', batch_size=5000, users_per_transaction=100, seed=None,
+              today=None, progress=None):
+    """Insert ``users`` synthetic farms and return the number of rows per model.
+
+    Counts other than ``users`` are per user, except ``activities`` which is
+    per crop. Users are written ``users_per_transaction`` at a time with
+    ``bulk_create``, so memory stays bounded at millions of rows. Every user
+    gets an API token, a shard, and the unread counter, collection version
+    and analytics rollup rows that signals would normally create.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    # Hashing is deliberately slow; every seeded user shares one hash
+    password_hash = make_password(password)
+    start = User.objects.filter(username__startswith=prefix).count()
+    totals = Counter()
+
+    for offset in range(0, users, users_per_transaction):
+        with transaction.atomic():
+            batch = User.objects.bulk_create(
+                [
+                    User(username=f'{prefix}{start + i:07d}', email=f'{prefix}{start + i:07d}@example.com', password=password_hash)
+                    for i in range(offset, min(offset + users_per_transaction, users))
+                ],
+                batch_size=batch_size,
+            )
+            Token.objects.bulk_create(
+                [Token(key=Token.generate_key(), user_id=user.pk) for user in batch], batch_size=batch_size,
+            )
+            for alias, user_ids in sharding.assign(batch).items():
+                with sharding.use_shard(alias), sharding.atomic():
+                    _seed_shard(user_ids, crops, activities, resources, notifications, rng, today, batch_size, totals)
+        totals['users'] += len(batch)
+        if progress:
+            progress(totals)
+    return dict(totals)
+
+
+def _seed_shard(user_ids, crops, activities, resources, notifications, rng, today, batch_size, totals):
+    """Write the farms of ``user_ids``, all on the current shard."""
+    created_crops = Crop.objects.bulk_create(
+        [crop for user_id in user_ids for crop in _crops(user_id, crops, rng, today)], batch_size=batch_size,
+    )
+    totals['crops'] += len(created_crops)
+    by_user = {}
+    for crop in created_crops:
+        by_user.setdefault(crop.user_id, []).append(crop)
+
+    rows = Activity.objects.bulk_create(
+        [activity for crop in created_crops for activity in _activities(crop, activities, rng)],
+        batch_size=batch_size,
+    )
+    totals['activities'] += len(rows)
+    rows = Resource.objects.bulk_create(
+        [resource for user_id in user_ids for resource in _resources(user_id, resources, rng)],
+        batch_size=batch_size,
+    )
+    totals['resources'] += len(rows)
+    rows = Notification.objects.bulk_create(
+        [
+            notification for user_id in user_ids
+            for notification in _notifications(user_id, by_user.get(user_id, []), notifications, rng)
+        ],
+        batch_size=batch_size,
+    )
+    totals['notifications'] += len(rows)
+
+    unread = Counter(n.user_id for n in rows if not n.is_read)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id, unread=unread[user_id], last_seq=notifications) for user_id in user_ids],
+        batch_size=batch_size,
+    )
+    CollectionVersion.objects.bulk_create(
+        [
+            CollectionVersion(user_id=user_id, collection=collection)
+            for user_id in user_ids for collection in CollectionVersion.COLLECTIONS
+        ],
+        batch_size=batch_size,
+    )
+    rebuild_rollups(user_ids, batch_size=batch_size)
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Crop, Resource, Activity, Notification
+from .models import Crop, Resource, Activity, Notification, ResourceMovement
 from django.contrib.auth.models import User
 
 class CropSerializer(serializers.ModelSerializer):
@@ -10,9 +10,14 @@ class CropSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'name', 'variety', 'planting_date', 'harvest_date', 'status']
 
     def validate(self, data):
-        if not data.get('name') or not data.get('variety'):
+        # Partial updates only carry the changed fields; check the rest
+        # against the instance being updated.
+        def current(field):
+            return data.get(field, getattr(self.instance, field, None))
+
+        if not current('name') or not current('variety'):
             raise serializers.ValidationError("Name and variety are required.")
-        if data.get('planting_date') >= data.get('harvest_date'):
+        if current('planting_date') >= current('harvest_date'):
             raise serializers.ValidationError("Harvest date must be after planting date.")
         return data
 
@@ -26,6 +31,8 @@ class ResourceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Resource
         fields = ['id', 'user', 'name', 'quantity', 'type', 'unit', 'usage_status']
+        # Derived from the quantity and the ledger movements, never set by clients
+        read_only_fields = ['usage_status']
 
     def validate_quantity(self, value):
         if value < 0:
@@ -37,15 +44,44 @@ class ResourceSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Invalid unit.")
         return value
 
-    def validate_usage_status(self, value):
-        if value not in [choice[0] for choice in Resource.USAGE_STATUS_CHOICES]:
-            raise serializers.ValidationError("Invalid usage status.")
-        return value
+    def validate(self, data):
+        if self.instance is None and 'quantity' in data:
+            data['usage_status'] = Resource.opening_status(data['quantity'])
+        return data
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+class ResourceMovementSerializer(serializers.ModelSerializer):
+    user = serializers.PrimaryKeyRelatedField(read_only=True)
+    resource = serializers.PrimaryKeyRelatedField(queryset=Resource.objects.none())
+    quantity = serializers.FloatField(write_only=True)
+
+    class Meta:
+        model = ResourceMovement
+        fields = ['id', 'user', 'resource', 'kind', 'quantity', 'delta', 'occurred_on', 'note', 'created_at']
+        read_only_fields = ['delta', 'created_at']
+        extra_kwargs = {'occurred_on': {'required': False}}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.context.get('request'):
+            user = self.context['request'].user
+            self.fields['resource'].queryset = Resource.objects.filter(user=user)
+
+    def validate_quantity(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("Quantity must be positive.")
+        return value
+
+class ResourceBalanceSerializer(serializers.ModelSerializer):
+    balance = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Resource
+        fields = ['id', 'name', 'type', 'unit', 'quantity', 'balance']
+
 class ActivitySerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     crop = CropSerializer(read_only=True)
@@ -64,7 +100,7 @@ class ActivitySerializer(serializers.ModelSerializer):
             self.fields['crop_id'].queryset = Crop.objects.filter(user=user)
 
     def validate(self, data):
-        if not data.get('description'):
+        if not data.get('description', getattr(self.instance, 'description', None)):
             raise serializers.ValidationError("Description is required.")
         return data
 
@@ -78,7 +114,8 @@ class NotificationSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Notification
-        fields = ['id', 'user', 'message', 'type', 'is_read', 'created_at', 'crop']
+        fields = ['id', 'seq', 'user', 'message', 'type', 'is_read', 'created_at', 'crop']
+        read_only_fields = ['seq']
 
     def create(self, validated_data):
         validated_data['user'] = self.context['request'].user
@@ -0,0 +1,406 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+from rest_framework.exceptions import APIException
+
+from .models import (
+    Crop, Resource, ResourceMovement, Activity, Notification, ArchivedNotification, NotificationOutbox,
+    NotificationCounter, CollectionVersion, AnalyticsRollup, SyncTombstone, UserShard,
+)
+from .routing import RoutingState, _state
+
+# Every user's farm data lives on one shard: the default database or one
+# of the DB_SHARDS aliases. Users, tokens and the UserShard map stay on the
+# default database, and each shard keeps a copy of the user rows its data
+# points at. Ids are drawn from a separate SHARD_ID_SPAN range per shard,
+# so rows keep their ids when a user moves. A moved user's new rows can get
+# lower ids than their old ones, so nothing orders a user's rows by id;
+# notification cursors use Notification.seq instead.
+
+# Per-user models in foreign key order: parents before children
+MODELS = [
+    Crop, Resource, ResourceMovement, Activity, Notification, ArchivedNotification, NotificationOutbox,
+    NotificationCounter, CollectionVersion, AnalyticsRollup, SyncTombstone,
+]
+
+
+class InvalidShard(Exception):
+    pass
+
+
+class ShardMoveConflict(Exception):
+    pass
+
+
+class ShardUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Your farm data is being moved; try again shortly.'
+    default_code = 'shard_moving'
+
+
+def shards():
+    return getattr(settings, 'DATABASE_SHARDS', None) or [DEFAULT_DB_ALIAS]
+
+
+def enabled():
+    return len(shards()) > 1
+
+
+def sharded(model):
+    return model in MODELS
+
+
+def _map_key(user_id):
+    return f'db-shard:{user_id}'
+
+
+def _map_timeout():
+    return getattr(settings, 'SHARD_MAP_CACHE_SECONDS', 30)
+
+
+def lookup(user_id):
+    """``(alias, moving)`` for a user, cached for SHARD_MAP_CACHE_SECONDS."""
+    entry = cache.get(_map_key(user_id))
+    if entry is None:
+        row = UserShard.objects.filter(user_id=user_id).values_list('alias', 'moving').first()
+        entry = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+        cache.set(_map_key(user_id), entry, _map_timeout())
+    return entry
+
+
+async def alookup(user_id):
+    entry = await cache.aget(_map_key(user_id))
+    if entry is None:
+        row = await UserShard.objects.filter(user_id=user_id).values_list('alias', 'moving').afirst()
+        entry = tuple(row) if row else (DEFAULT_DB_ALIAS, False)
+        await cache.aset(_map_key(user_id), entry, _map_timeout())
+    return entry
+
+
+def _activate(entry):
+    state = _state.get()
+    if state is not None:
+        state.shard, state.read_only = entry
+
+
+def activate(user_id):
+    """Route the rest of the request to the user's shard."""
+    if enabled():
+        _activate(lookup(user_id))
+
+
+async def aactivate(user_id):
+    if enabled():
+        _activate(await alookup(user_id))
+
+
+def current():
+    state = _state.get()
+    return state.shard if state is not None and state.shard else DEFAULT_DB_ALIAS
+
+
+def atomic():
+    """``transaction.atomic`` on the database the current user's rows live on."""
+    return transaction.atomic(using=current())
+
+
+def connection():
+    return connections[current()]
+
+
+@contextmanager
+def use_shard(alias):
+    """Route per-user models to ``alias`` inside the block."""
+    token = _state.set(RoutingState(shard=alias))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def for_user(user_id):
+    return use_shard(lookup(user_id)[0])
+
+
+def fan_out(func, *args, aliases=None):
+    """Run ``func(*args)`` once per shard, in parallel, and return ``{alias: result}``.
+
+    Each call sees its shard through the router, so cross-shard admin and
+    reporting code is written as if there were one database.
+    """
+    aliases = list(aliases or shards())
+    if len(aliases) == 1:
+        with use_shard(aliases[0]):
+            return {aliases[0]: func(*args)}
+
+    def run(alias):
+        try:
+            with use_shard(alias):
+                return func(*args)
+        finally:
+            # Pool threads own their connections
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(aliases), thread_name_prefix='shard') as pool:
+        return dict(zip(aliases, pool.map(run, aliases)))
+
+
+def _user_fields(user):
+    return {field.attname: getattr(user, field.attname) for field in User._meta.concrete_fields}
+
+
+def copy_users(users, alias):
+    """Create or refresh the shard's copies of ``users``, without signals."""
+    if alias == DEFAULT_DB_ALIAS or not users:
+        return
+    manager = User.objects.using(alias)
+    existing = set(manager.filter(pk__in=[user.pk for user in users]).values_list('pk', flat=True))
+    for user in users:
+        if user.pk in existing:
+            manager.filter(pk=user.pk).update(**_user_fields(user))
+    manager.bulk_create([User(**_user_fields(user)) for user in users if user.pk not in existing])
+
+
+def assign(users):
+    """Place new users on shards and return ``{alias: [user ids]}``.
+
+    Users are spread round-robin by id; ``rebalance_shards`` evens out the
+    counts later if shards are added.
+    """
+    if not enabled():
+        return {DEFAULT_DB_ALIAS: [user.pk for user in users]}
+    placed = {}
+    for user in users:
+        placed.setdefault(shards()[user.pk % len(shards())], []).append(user)
+    UserShard.objects.bulk_create([
+        UserShard(user_id=user.pk, alias=alias) for alias, members in placed.items() for user in members
+    ])
+    for alias, members in placed.items():
+        copy_users(members, alias)
+    return {alias: [user.pk for user in members] for alias, members in placed.items()}
+
+
+def users_by_shard(user_ids):
+    """Group ``user_ids`` by the shard holding their rows."""
+    mapped = dict(UserShard.objects.filter(user_id__in=user_ids).values_list('user_id', 'alias'))
+    grouped = {}
+    for user_id in user_ids:
+        grouped.setdefault(mapped.get(user_id, DEFAULT_DB_ALIAS), []).append(user_id)
+    return grouped
+
+
+def delete_rows(alias, user_id):
+    """Remove a user's rows from ``alias`` with plain DELETEs.
+
+    Like a retention purge this bypasses the delete signals: the rows are
+    leaving the shard, not the farm. The shard's copy of the user goes too.
+    """
+    target = connections[alias]
+    quote = target.ops.quote_name
+    with transaction.atomic(using=alias), target.cursor() as cursor:
+        for model in reversed(MODELS):
+            cursor.execute(f"DELETE FROM {quote(model._meta.db_table)} WHERE user_id = %s", [user_id])
+        if alias != DEFAULT_DB_ALIAS:
+            cursor.execute(f"DELETE FROM {quote(User._meta.db_table)} WHERE id = %s", [user_id])
+
+
+def _set_entry(user_id, alias, moving):
+    UserShard.objects.update_or_create(user_id=user_id, defaults={'alias': alias, 'moving': moving})
+    cache.delete(_map_key(user_id))
+
+
+def _versions(alias, user_id):
+    return list(
+        CollectionVersion.objects.using(alias).filter(user_id=user_id)
+        .order_by('collection').values_list('collection', 'version')
+    )
+
+
+def _copy_rows(user_id, source, target, batch_size):
+    copied = 0
+    with transaction.atomic(using=target):
+        for model in MODELS:
+            batch = []
+            for obj in model.objects.using(source).filter(user_id=user_id).order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(obj)
+                if len(batch) == batch_size:
+                    copied += len(model.objects.using(target).bulk_create(batch))
+                    batch = []
+            copied += len(model.objects.using(target).bulk_create(batch))
+    return copied
+
+
+def move_users(moves, grace=None, batch_size=1000):
+    """Move users' rows between shards while the site keeps serving.
+
+    ``moves`` is ``[(user_id, target)]``. Every user is marked as moving
+    at once, which turns their writes away with a 503 once every process
+    has dropped its cached map entry (``grace`` seconds,
+    SHARD_MAP_CACHE_SECONDS by default), while reads carry on from the old
+    shard. Each user's rows are then copied with their ids in one
+    transaction on their target and their map entry switched. If a user's
+    collection versions changed during the copy, a write slipped through:
+    their copy is undone and they stay where they were. The old rows are
+    deleted one more grace period later, once no process reads them, so a
+    batch waits out the grace period twice however many users it holds.
+
+    Returns ``{user_id: rows copied}``, with a ``ShardMoveConflict`` in
+    place of the count for users that were written to. Users already on
+    their target are left out.
+    """
+    for user_id, target in moves:
+        if target not in shards():
+            raise InvalidShard(f"Unknown shard '{target}', expected one of {', '.join(shards())}")
+    mapped = dict(UserShard.objects.filter(user_id__in=[user_id for user_id, _ in moves]).values_list('user_id', 'alias'))
+    pending = {}
+    for user_id, target in moves:
+        source = mapped.get(user_id, DEFAULT_DB_ALIAS)
+        if source != target:
+            pending[user_id] = (source, target)
+    if not pending:
+        return {}
+    grace = _map_timeout() if grace is None else grace
+
+    for user_id, (source, target) in pending.items():
+        _set_entry(user_id, source, moving=True)
+    results, switched = {}, []
+    try:
+        time.sleep(grace)
+        users = User.objects.in_bulk(list(pending))
+        for user_id, (source, target) in pending.items():
+            before = _versions(source, user_id)
+            copy_users([users[user_id]], target)
+            copied = _copy_rows(user_id, source, target, batch_size)
+            if _versions(source, user_id) != before:
+                delete_rows(target, user_id)
+                _set_entry(user_id, source, moving=False)
+                results[user_id] = ShardMoveConflict(f'User {user_id} was written to during the move; try again')
+                continue
+            _set_entry(user_id, target, moving=False)
+            results[user_id] = copied
+            switched.append(user_id)
+    except BaseException:
+        for user_id, (source, target) in pending.items():
+            if user_id not in results:
+                _set_entry(user_id, source, moving=False)
+        raise
+    finally:
+        if switched:
+            time.sleep(grace)
+            for user_id in switched:
+                delete_rows(pending[user_id][0], user_id)
+    return results
+
+
+def move_user(user_id, target, grace=None, batch_size=1000):
+    """Move one user with ``move_users``; returns the number of rows copied.
+
+    Raises ``ShardMoveConflict`` if the user was written to during the move.
+    """
+    copied = move_users([(user_id, target)], grace, batch_size).get(user_id, 0)
+    if isinstance(copied, ShardMoveConflict):
+        raise copied
+    return copied
+
+
+def plan_rebalance():
+    """``[(user_id, source, target)]`` moves that even out users per shard.
+
+    Users are taken from the fullest shard, newest first, and given to the
+    emptiest until no two shards differ by more than one user.
+    """
+    members = {alias: [] for alias in shards()}
+    mapped = dict(UserShard.objects.values_list('user_id', 'alias'))
+    for user_id in User.objects.order_by('pk').values_list('pk', flat=True).iterator():
+        alias = mapped.get(user_id, DEFAULT_DB_ALIAS)
+        if alias in members:
+            members[alias].append(user_id)
+    moves = []
+    while True:
+        fullest = max(members, key=lambda alias: len(members[alias]))
+        emptiest = min(members, key=lambda alias: len(members[alias]))
+        if len(members[fullest]) - len(members[emptiest]) <= 1:
+            return moves
+        user_id = members[fullest].pop()
+        members[emptiest].append(user_id)
+        moves.append((user_id, fullest, emptiest))
+
+
+def reserve_ids(alias):
+    """Start the id sequences of a shard's tables at its SHARD_ID_SPAN range.
+
+    Run after every migrate of a shard; sequences already past the start
+    of the range are left alone.
+    """
+    if alias not in shards():
+        return
+    start = shards().index(alias) * getattr(settings, 'SHARD_ID_SPAN', 10 ** 12)
+    if not start:
+        return
+    target = connections[alias]
+    with target.cursor() as cursor:
+        for model in MODELS:
+            if model._meta.pk.get_internal_type() not in ('AutoField', 'BigAutoField'):
+                continue
+            table = model._meta.db_table
+            if target.vendor == 'sqlite':
+                cursor.execute("UPDATE sqlite_sequence SET seq = %s WHERE name = %s AND seq < %s", [start, table, start])
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) SELECT %s, %s "
+                    "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = %s)",
+                    [table, start, table],
+                )
+            elif target.vendor == 'postgresql':
+                cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+                sequence = cursor.fetchone()[0]
+                if sequence:
+                    # Comes from the catalog already quoted
+                    cursor.execute(f"SELECT setval(%s, greatest(%s, (SELECT last_value FROM {sequence})))", [sequence, start])
+
+
+COUNTED = {'crops': Crop, 'resources': Resource, 'activities': Activity, 'notifications': Notification}
+
+
+def stats():
+    """Users and rows per shard, counted on every shard in parallel."""
+    users = dict(UserShard.objects.values_list('alias').annotate(count=Count('pk')).order_by())
+    users[DEFAULT_DB_ALIAS] = users.get(DEFAULT_DB_ALIAS, 0) + User.objects.filter(shard__isnull=True).count()
+
+    def count():
+        return {name: model.objects.count() for name, model in COUNTED.items()}
+
+    return {alias: {'users': users.get(alias, 0), **rows} for alias, rows in fan_out(count).items()}
+
+
+class ShardRouter:
+    """Send per-user models to the shard of the user being served.
+
+    Rows already loaded from a shard stay there. Otherwise the shard comes
+    from the request (set when its token is authenticated) or from
+    ``use_shard``. On the default database the next router decides, so
+    replica reads keep working there.
+    """
+
+    def _shard(self, model, hints):
+        if not sharded(model):
+            return None
+        instance = hints.get('instance')
+        alias = instance._state.db if instance is not None and sharded(type(instance)) else None
+        if alias is None:
+            alias = current()
+        return alias if alias != DEFAULT_DB_ALIAS else None
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None and state.read_only and sharded(model):
+            raise ShardUnavailable()
+        return self._shard(model, hints)
@@ -1,61 +1,163 @@
-from django.db.models.signals import post_save
+import contextvars
+from contextlib import contextmanager
+from functools import partial
+
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, post_migrate
 from django.dispatch import receiver
-from .models import Crop, Activity, Notification
-from datetime import datetime, timedelta
+from rest_framework.authtoken.models import Token
+from . import analytics, lifecycle, metrics, routing, sharding
+from .alerts import alert_window
+from .authentication import forget
+from .dashboard import invalidate_dashboard
+from .models import Crop, Resource, Activity, Notification, NotificationCounter, CollectionVersion, SyncTombstone
+from .outbox import enqueue
+from .pubsub import publish
+
+# Set while a bulk delete does the post_delete work below once per batch
+# itself (see api.bulk); the receivers then skip their per-row version.
+_batched = contextvars.ContextVar('batched_deletes', default=False)
+
+@contextmanager
+def batched_deletes():
+    token = _batched.set(True)
+    try:
+        yield
+    finally:
+        _batched.reset(token)
+
+# Alert generation runs in the process_outbox worker. The receivers only
+# record that a due-soon object changed, on the same connection (and so in
+# the same transaction) as the write that triggered them.
 
 @receiver(post_save, sender=Crop)
-def create_harvest_notification(sender, instance, created, **kwargs):
-    print(f"Signal triggered for crop {instance.name}, harvest_date={instance.harvest_date}")  # Debug
-    today = datetime.now().date()
-    threshold = today + timedelta(days=7)
-    
-    # Check if harvest date is within 7 days
+def enqueue_harvest_alert(sender, instance, created, **kwargs):
+    today, threshold = alert_window()
     if instance.harvest_date and today <= instance.harvest_date <= threshold:
-        days_until_harvest = (instance.harvest_date - today).days
-        message = f"Your crop {instance.name} ({instance.variety}) is due for harvest in {days_until_harvest} day(s) on {instance.harvest_date}."
-        
-        # Prevent duplicate notifications
-        existing_notification = Notification.objects.filter(
-            user=instance.user,
-            crop=instance,
-            message=message,
-            is_read=False
-        ).exists()
-        
-        if not existing_notification:
-            print(f"Creating crop notification: {message}")  # Debug
-            Notification.objects.create(
-                user=instance.user,
-                message=message,
-                type='ALERT',
-                crop=instance
-            )
+        enqueue('harvest', instance.pk, instance.user_id)
+
+@receiver(post_save, sender=Crop)
+def recheck_crop_status(sender, instance, **kwargs):
+    lifecycle.forget(instance.user_id)
 
 @receiver(post_save, sender=Activity)
-def create_activity_notification(sender, instance, created, **kwargs):
-    print(f"Signal triggered for activity {instance.description}, date={instance.date}")  # Debug
-    today = datetime.now().date()
-    threshold = today + timedelta(days=7)
-    
-    # Check if activity date is within 7 days
+def enqueue_activity_alert(sender, instance, created, **kwargs):
+    today, threshold = alert_window()
     if instance.date and today <= instance.date <= threshold:
-        days_until_due = (instance.date - today).days
-        crop_name = instance.crop.name if instance.crop else "No crop"
-        message = f"Activity '{instance.description}' for {crop_name} is due in {days_until_due} day(s) on {instance.date}."
-        
-        # Prevent duplicate notifications
-        existing_notification = Notification.objects.filter(
-            user=instance.user,
-            crop=instance.crop,
-            message=message,
-            is_read=False
-        ).exists()
-        
-        if not existing_notification:
-            print(f"Creating activity notification: {message}")  # Debug
-            Notification.objects.create(
-                user=instance.user,
-                message=message,
-                type='ALERT',
-                crop=instance.crop
-            )
\ No newline at end of file
+        enqueue('activity', instance.pk, instance.user_id)
+
+@receiver([post_save, post_delete], sender=Crop)
+@receiver([post_save, post_delete], sender=Resource)
+@receiver([post_save, post_delete], sender=Activity)
+@receiver([post_save, post_delete], sender=Notification)
+def invalidate_dashboard_cache(sender, instance, **kwargs):
+    if _batched.get():
+        return
+    invalidate_dashboard(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Crop)
+@receiver([post_save, post_delete], sender=Resource)
+@receiver([post_save, post_delete], sender=Activity)
+@receiver([post_save, post_delete], sender=Notification)
+def bump_collection_version(sender, instance, **kwargs):
+    if _batched.get():
+        return
+    CollectionVersion.bump(instance.user_id, sender)
+
+@receiver(post_delete, sender=Crop)
+@receiver(post_delete, sender=Resource)
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Notification)
+def record_sync_tombstone(sender, instance, origin=None, **kwargs):
+    # Rows deleted along with their user need none: the account is gone
+    if not _batched.get() and not isinstance(origin, User) and getattr(origin, 'model', None) is not User:
+        SyncTombstone.record(sender, instance.user_id, [instance.pk])
+
+@receiver(post_save, sender=Notification)
+def publish_notification(sender, instance, created, using, **kwargs):
+    # Woken streams query at once, so only once the row is visible
+    if created:
+        transaction.on_commit(partial(publish, [instance.user_id]), using=using)
+
+@receiver(post_save, sender=User)
+def create_user_counters(sender, instance, created, **kwargs):
+    if created:
+        [alias] = sharding.assign([instance])
+        with sharding.use_shard(alias):
+            NotificationCounter.objects.get_or_create(user=instance)
+            CollectionVersion.create_for(instance.pk)
+
+@receiver(post_save, sender=User)
+def copy_user_to_shard(sender, instance, created, **kwargs):
+    # The shard's copy only backs its foreign keys, but keep it current
+    if not created and sharding.enabled() and instance._state.db == DEFAULT_DB_ALIAS:
+        sharding.copy_users([instance], sharding.lookup(instance.pk)[0])
+
+@receiver(pre_delete, sender=User)
+def delete_user_from_shard(sender, instance, **kwargs):
+    # The delete cascade only reaches rows on the default database
+    if sharding.enabled() and instance._state.db == DEFAULT_DB_ALIAS:
+        alias = sharding.lookup(instance.pk)[0]
+        if alias != DEFAULT_DB_ALIAS:
+            sharding.delete_rows(alias, instance.pk)
+
+@receiver(post_save, sender=User)
+def forget_cached_token(sender, instance, created, **kwargs):
+    # Deactivation, password changes and profile edits must not be served
+    # from a stale cached user
+    if not created:
+        for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+            forget(key)
+
+@receiver([post_save, post_delete], sender=Token)
+def forget_token(sender, instance, **kwargs):
+    forget(instance.key)
+
+@receiver(pre_save, sender=Notification)
+def remember_read_state(sender, instance, **kwargs):
+    # Only saves of existing rows (e.g. admin edits) need the old value
+    if not instance._state.adding:
+        instance._was_read = Notification.objects.filter(pk=instance.pk).values_list('is_read', flat=True).first()
+
+@receiver(post_save, sender=Notification)
+def count_saved_notification(sender, instance, created, **kwargs):
+    if created:
+        delta = 0 if instance.is_read else 1
+    else:
+        was_read = getattr(instance, '_was_read', None)
+        delta = 0 if was_read is None or was_read == instance.is_read else (-1 if instance.is_read else 1)
+    NotificationCounter.adjust(instance.user_id, delta)
+
+@receiver(post_delete, sender=Notification)
+def count_deleted_notification(sender, instance, **kwargs):
+    if not instance.is_read and not _batched.get():
+        NotificationCounter.adjust(instance.user_id, -1)
+
+@receiver(pre_save, sender=Crop)
+@receiver(pre_save, sender=Activity)
+def remember_rollup_keys(sender, instance, **kwargs):
+    if not instance._state.adding:
+        instance._rollup_keys = analytics.stored_keys(sender, instance.pk)
+
+@receiver(post_save, sender=Crop)
+@receiver(post_save, sender=Activity)
+def count_saved_rollups(sender, instance, **kwargs):
+    analytics.move(instance.user_id, getattr(instance, '_rollup_keys', []), analytics.keys_for(instance))
+
+@receiver(post_delete, sender=Crop)
+@receiver(post_delete, sender=Activity)
+def count_deleted_rollups(sender, instance, **kwargs):
+    if not _batched.get():
+        analytics.move(instance.user_id, analytics.keys_for(instance), [])
+
+@receiver(connection_created)
+def watch_connection(sender, connection, **kwargs):
+    routing.watch(connection)
+    metrics.watch(connection)
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using, **kwargs):
+    if sender.name == 'api':
+        sharding.reserve_ids(using)
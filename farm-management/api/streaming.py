@@ -0,0 +1,115 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+
+from . import sharding
+from .async_views import authenticate, unauthorized
+from .models import Notification
+from .pubsub import get_backend
+from .serializers import NotificationSerializer
+
+# Upper bound on notifications sent per query so a stale cursor can't pull
+# the user's whole history in one go; the client simply catches up.
+DELIVERY_BATCH = 100
+
+
+async def _cursor(request, user):
+    """The ``seq`` after which to deliver; without one, only future notifications.
+
+    ``seq`` rather than the id: it follows commit order, so a row committed
+    late can't fall behind a cursor already past it, and it is kept when the
+    user moves to another shard, where new ids come from another range.
+    """
+    value = request.headers.get('Last-Event-ID') or request.GET.get('since')
+    if not value:
+        latest = await Notification.objects.filter(user=user).aaggregate(latest=Max('seq'))
+        return latest['latest'] or 0
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+async def _fetch_after(user, cursor, alias):
+    # The stream body runs after the request's routing state is gone
+    queryset = (
+        Notification.objects.using(alias).filter(user=user, seq__gt=cursor)
+        .select_related('crop')
+        .order_by('seq')[:DELIVERY_BATCH]
+    )
+    return [notification async for notification in queryset]
+
+
+@require_GET
+async def notification_stream(request):
+    """Server-sent events feed of notifications created after ``since``.
+
+    Each event's ``id`` is the notification's ``seq``, so a reconnecting
+    EventSource resumes from ``Last-Event-ID`` without gaps. The stream
+    closes after ``NOTIFICATION_STREAM_SECONDS`` and the browser reconnects.
+    """
+    user = await authenticate(request, query_token=True)
+    if user is None:
+        return unauthorized()
+    cursor = await _cursor(request, user)
+    if cursor is None:
+        return JsonResponse({'error': 'since must be a notification seq'}, status=400)
+    alias = sharding.current()
+
+    backend = get_backend()
+    heartbeat = getattr(settings, 'NOTIFICATION_STREAM_HEARTBEAT', 15)
+    lifetime = getattr(settings, 'NOTIFICATION_STREAM_SECONDS', 300)
+
+    async def events():
+        nonlocal cursor
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + lifetime
+        yield 'retry: 3000\n\n'
+        while loop.time() < deadline:
+            notifications = await _fetch_after(user, cursor, alias)
+            for data in NotificationSerializer(notifications, many=True).data:
+                cursor = data['seq']
+                yield f"id: {cursor}\nevent: notification\ndata: {json.dumps(data)}\n\n"
+            if len(notifications) < DELIVERY_BATCH:
+                await backend.wait(user.pk, heartbeat)
+                yield ': keepalive\n\n'
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_GET
+async def notification_poll(request):
+    """Long-poll: return notifications after ``since`` as soon as there are any.
+
+    Waits up to ``?timeout=`` seconds (capped by NOTIFICATION_POLL_TIMEOUT)
+    and returns an empty list if nothing arrives.
+    """
+    user = await authenticate(request, query_token=True)
+    if user is None:
+        return unauthorized()
+    cursor = await _cursor(request, user)
+    limit = getattr(settings, 'NOTIFICATION_POLL_TIMEOUT', 30)
+    try:
+        timeout = min(float(request.GET.get('timeout', limit)), limit)
+    except ValueError:
+        timeout = None
+    if cursor is None or timeout is None:
+        return JsonResponse({'error': 'since must be a notification seq and timeout a number'}, status=400)
+    alias = sharding.current()
+
+    notifications = await _fetch_after(user, cursor, alias)
+    if not notifications and timeout > 0:
+        await get_backend().wait(user.pk, timeout)
+        notifications = await _fetch_after(user, cursor, alias)
+    results = NotificationSerializer(notifications, many=True).data
+    return JsonResponse({
+        'results': results,
+        'cursor': results[-1]['seq'] if results else cursor,
+    })
@@ -0,0 +1,137 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Crop, Resource, Activity, Notification, SyncTombstone
+
+# Delta sync for offline clients. Every crop, resource, activity and
+# notification carries an indexed ``updated_at`` and every delete leaves a
+# SyncTombstone, so the rows changed since a point in time are one keyset
+# scan per collection. A sync walks the collections in a fixed order over
+# the window ``since < timestamp <= until``, with ``until`` fixed when the
+# sync starts; rows changed while it pages are picked up by the next one.
+
+SALT = 'api.sync'
+
+# field: the timestamp the source is scanned by; related: select_related()
+Source = namedtuple('Source', 'collection model field related')
+
+SOURCES = [
+    Source('crops', Crop, 'updated_at', ()),
+    Source('resources', Resource, 'updated_at', ()),
+    Source('activities', Activity, 'updated_at', ('crop',)),
+    Source('notifications', Notification, 'updated_at', ('crop',)),
+    # Deletes last, so a row changed and then deleted ends up deleted
+    Source('deleted', SyncTombstone, 'deleted_at', ()),
+]
+
+# Where a sync stopped: the window, the source being scanned and the
+# (timestamp, id) of the last row returned from it, if any
+Position = namedtuple('Position', 'since until source after')
+
+
+class InvalidSyncToken(Exception):
+    pass
+
+
+class SyncTokenExpired(InvalidSyncToken):
+    pass
+
+
+def _stamp(value):
+    return value.isoformat() if value else None
+
+
+def _parse(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def sync_token(until):
+    """The token a client sends as ``since`` next time.
+
+    It points ``SYNC_OVERLAP_SECONDS`` before ``until``: a write that
+    started before the sync but committed after it carries an earlier
+    timestamp, and would be missed without the overlap. Rows in the overlap
+    are sent twice, which clients must treat as a no-op.
+    """
+    overlap = timedelta(seconds=getattr(settings, 'SYNC_OVERLAP_SECONDS', 30))
+    return signing.dumps({'since': _stamp(until - overlap)}, salt=SALT)
+
+
+def _check_age(since, now):
+    # Tombstones older than this have been purged, so deletes would be missed
+    days = getattr(settings, 'SYNC_TOMBSTONE_DAYS', 30)
+    if since and since < now - timedelta(days=days):
+        raise SyncTokenExpired(f'Sync token is older than {days} days; start again without since')
+
+
+def start(token=None, now=None):
+    """The first ``Position`` of a sync from ``token``, or a full sync without one."""
+    now = now or timezone.now()
+    since = None
+    if token:
+        try:
+            since = _parse(signing.loads(token, salt=SALT)['since'])
+        except (signing.BadSignature, KeyError, TypeError, ValueError):
+            raise InvalidSyncToken('since is not a valid sync token')
+        _check_age(since, now)
+    return Position(since, now, 0, None)
+
+
+def encode(position):
+    after = position.after and [_stamp(position.after[0]), position.after[1]]
+    return signing.dumps(
+        [_stamp(position.since), _stamp(position.until), position.source, after], salt=SALT, compress=True,
+    )
+
+
+def decode(cursor, now=None):
+    try:
+        since, until, source, after = signing.loads(cursor, salt=SALT)
+        position = Position(_parse(since), _parse(until), int(source), after and (_parse(after[0]), int(after[1])))
+    except (signing.BadSignature, TypeError, ValueError):
+        raise InvalidSyncToken('cursor is not a valid sync cursor')
+    if not 0 <= position.source < len(SOURCES) or position.until is None:
+        raise InvalidSyncToken('cursor is not a valid sync cursor')
+    _check_age(position.since, now or timezone.now())
+    return position
+
+
+def _changed(source, user, position, limit):
+    field = source.field
+    queryset = source.model.objects.filter(user=user, **{f'{field}__lte': position.until})
+    if position.since:
+        queryset = queryset.filter(**{f'{field}__gt': position.since})
+    if position.after:
+        stamp, pk = position.after
+        queryset = queryset.filter(Q(**{f'{field}__gt': stamp}) | Q(**{field: stamp, 'pk__gt': pk}))
+    if source.related:
+        queryset = queryset.select_related(*source.related)
+    return list(queryset.order_by(field, 'pk')[:limit])
+
+
+def changes(user, position, limit):
+    """Up to ``limit`` ``(source, object)`` pairs from ``position`` on.
+
+    Returns them with the ``Position`` to continue from, or ``None`` once
+    every source is exhausted. A full sync skips the tombstones: a client
+    starting from nothing has nothing to delete.
+    """
+    found = []
+    for index in range(position.source, len(SOURCES)):
+        source = SOURCES[index]
+        if source.model is SyncTombstone and position.since is None:
+            break
+        after = position.after if index == position.source else None
+        remaining = limit - len(found)
+        rows = _changed(source, user, position._replace(after=after), remaining + 1)
+        found.extend((source, obj) for obj in rows[:remaining])
+        if len(rows) > remaining:
+            last = rows[remaining - 1] if remaining else None
+            after = (getattr(last, source.field), last.pk) if last else after
+            return found, position._replace(source=index, after=after)
+    return found, None
@@ -1,3 +1,1901 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, models, router
+from django.http import HttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework.views import APIView
+
+from .models import (
+    Crop, Resource, ResourceMovement, Activity, Notification, NotificationCounter, NotificationOutbox,
+    CollectionVersion, AnalyticsRollup, ArchivedNotification, SyncTombstone, UserShard,
+)
+from . import analytics, async_views, metrics, response_cache, search, sharding, sync
+from .authentication import CachedTokenAuthentication, _cache_key, cached_user
+from .benchmark import ENDPOINTS
+from .dashboard import dashboard_cache_key
+from .ledger import record_movements
+from .logs import JsonFormatter
+from .outbox import drain
+from .pubsub import InProcessBackend
+from .routing import (
+    DatabaseRoutingMiddleware, PrimaryReplicaRouter, ReplicaReadMixin, RoutingState, _state, record_writes,
+)
+from .serializers import CropSerializer
+from .views import CropListCreate, ResourceDetail
+
+
+class QueryCountTests(TestCase):
+    """Every list and detail endpoint must run a fixed number of queries.
+
+    Counts cover the whole request path, measured with the client's token
+    already resolved by ``CachedTokenAuthentication`` and the day's crop
+    status check done, as on every request after the first, so a
+    regression anywhere shows up here.
+    """
+    ROW_COUNTS = [1, 100, 10000]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='farmer', password='secret')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.client.get(reverse('user-info'))
+        self.client.get(reverse('crop-list-create'))
+        caches['responses'].clear()
+
+    def seed(self, rows):
+        Crop.objects.filter(user=self.user).delete()
+        Resource.objects.filter(user=self.user).delete()
+        start = date(2024, 1, 1)
+        crops = Crop.objects.bulk_create([
+            Crop(
+                user=self.user,
+                name=f'Crop {i}',
+                variety='Hybrid',
+                planting_date=start,
+                harvest_date=start + timedelta(days=90),
+            )
+            for i in range(rows)
+        ])
+        Resource.objects.bulk_create([
+            Resource(user=self.user, name=f'Resource {i}', quantity=i, type='Fertilizer')
+            for i in range(rows)
+        ])
+        Activity.objects.bulk_create([
+            Activity(
+                user=self.user,
+                crop=crops[i % len(crops)],
+                description=f'Activity {i}',
+                date=start + timedelta(days=i % 365),
+            )
+            for i in range(rows)
+        ])
+        Notification.objects.bulk_create([
+            Notification(user=self.user, crop=crops[i % len(crops)], message=f'Notification {i}')
+            for i in range(rows)
+        ])
+
+    def assertEndpointQueries(self, url, expected):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(ctx.captured_queries), expected,
+            '\n'.join(query['sql'] for query in ctx.captured_queries),
+        )
+        return response
+
+    def test_list_endpoints(self):
+        endpoints = ['crop-list-create', 'resource-list-create', 'activity-list-create', 'notification-list']
+        for rows in self.ROW_COUNTS:
+            self.seed(rows)
+            for name in endpoints:
+                with self.subTest(endpoint=name, rows=rows):
+                    # collection version + one page of rows
+                    self.assertEndpointQueries(reverse(name), 2)
+
+    def test_detail_endpoints(self):
+        for rows in self.ROW_COUNTS:
+            self.seed(rows)
+            objects = {
+                'crop-detail': Crop.objects.filter(user=self.user).last(),
+                'resource-detail': Resource.objects.filter(user=self.user).last(),
+                'activity-detail': Activity.objects.filter(user=self.user).last(),
+            }
+            for name, obj in objects.items():
+                with self.subTest(endpoint=name, rows=rows):
+                    # collection version + the object itself
+                    self.assertEndpointQueries(reverse(name, args=[obj.pk]), 2)
+
+    def test_user_info(self):
+        self.assertEndpointQueries(reverse('user-info'), 0)
+
+
+class NotificationDedupeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+
+    def test_resaving_crop_does_not_duplicate_harvest_alert(self):
+        today = date.today()
+        crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=today - timedelta(days=90),
+            harvest_date=today + timedelta(days=3),
+        )
+        drain(workers=1)
+        crop.status = 'Harvesting'
+        crop.save()
+        drain(workers=1)
+
+        notifications = Notification.objects.filter(user=self.user, crop=crop)
+        self.assertEqual(notifications.count(), 1)
+        self.assertEqual(
+            notifications.get().dedupe_key,
+            Notification.make_dedupe_key('harvest', crop.pk, crop.harvest_date),
+        )
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        today = date.today()
+        self.crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=today - timedelta(days=60),
+            harvest_date=today + timedelta(days=10),
+            status='Growing',
+        )
+        Resource.objects.create(user=self.user, name='Urea', quantity=50, type='Fertilizer', unit='kgs')
+        Resource.objects.create(user=self.user, name='CAN', quantity=25, type='Fertilizer', unit='kgs')
+        Activity.objects.create(user=self.user, crop=self.crop, description='Weeding', date=today)
+
+    def test_summary(self):
+        data = self.client.get(reverse('dashboard')).data
+        self.assertEqual(data['crops'], {'total': 1, 'by_status': {'Planting': 0, 'Growing': 1, 'Harvesting': 0}})
+        self.assertEqual([crop['id'] for crop in data['upcoming_harvests']], [self.crop.pk])
+        self.assertEqual(data['resources']['total'], 2)
+        self.assertEqual(data['resources']['totals'][0]['quantity'], 75)
+        self.assertEqual(data['recent_activities'][0]['crop']['name'], 'Maize')
+        self.assertEqual(data['unread_notifications'], 0)
+
+        data = self.client.get(reverse('dashboard'), {'days': 5}).data
+        self.assertEqual(data['upcoming_harvests'], [])
+
+    def test_cached_until_a_write(self):
+        self.client.get(reverse('dashboard'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('dashboard'))
+        # Token and summary both come from the cache
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Crop.objects.create(
+                user=self.user,
+                name='Beans',
+                variety='Rosecoco',
+                planting_date=date.today(),
+                harvest_date=date.today() + timedelta(days=90),
+            )
+        data = self.client.get(reverse('dashboard')).data
+        self.assertEqual(data['crops']['total'], 2)
+
+    def test_invalidated_only_once_the_write_commits(self):
+        key = dashboard_cache_key(self.user.pk, 30)
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.create(user=self.user, crop=self.crop, description='Spraying', date=date.today())
+            # A GET racing the open transaction still gets the old version
+            self.assertEqual(dashboard_cache_key(self.user.pk, 30), key)
+        self.assertNotEqual(dashboard_cache_key(self.user.pk, 30), key)
+
+
+class ScanDueDatesTests(TestCase):
+    def test_scan_is_idempotent(self):
+        user = User.objects.create_user(username='farmer', password='secret')
+        today = date(2025, 6, 1)
+        crops = Crop.objects.bulk_create([
+            Crop(
+                user=user,
+                name=f'Crop {i}',
+                variety='H614',
+                planting_date=today - timedelta(days=120),
+                harvest_date=today + timedelta(days=i),
+            )
+            for i in range(10)
+        ])
+        Activity.objects.bulk_create([
+            Activity(user=user, crop=crops[0], description='Spray', date=today + timedelta(days=2)),
+            Activity(user=user, crop=crops[0], description='Weed', date=today - timedelta(days=1)),
+        ])
+
+        call_command('scan_due_dates', today=today, days=5, batch_size=3, stdout=StringIO())
+        # Crops due in 0..5 days plus the one upcoming activity
+        self.assertEqual(Notification.objects.count(), 7)
+        self.assertIn(
+            "Activity 'Spray' for Crop 0 is due in 2 day(s) on 2025-06-03.",
+            Notification.objects.values_list('message', flat=True),
+        )
+
+        Notification.objects.update(is_read=True)
+        call_command('scan_due_dates', today=today, days=5, batch_size=3, stdout=StringIO())
+        self.assertEqual(Notification.objects.count(), 7)
+
+
+@override_settings(CROP_GROWING_AFTER_DAYS=14, CROP_HARVESTING_LEAD_DAYS=0)
+class CropLifecycleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def plant(self, today):
+        # Through save() so the rollups count them
+        return {
+            name: Crop.objects.create(
+                user=self.user, name=name, variety='H614',
+                planting_date=today + timedelta(days=planted), harvest_date=today + timedelta(days=harvest),
+            )
+            for name, planted, harvest in [('Maize', -30, 60), ('Beans', -100, -1), ('Kale', -1, 80)]
+        }
+
+    def statuses(self):
+        return dict(Crop.objects.values_list('name', 'status'))
+
+    def test_command_moves_due_crops_in_batches(self):
+        today = date(2025, 6, 1)
+        self.plant(today)
+        out = StringIO()
+        call_command('advance_crop_status', today=today, batch_size=1, stdout=out)
+        self.assertIn('Moved 2 crops (1 to Harvesting, 1 to Growing); created 2 notifications', out.getvalue())
+        self.assertEqual(self.statuses(), {'Maize': 'Growing', 'Beans': 'Harvesting', 'Kale': 'Planting'})
+        self.assertIn('Your crop Maize (H614) is now Growing.', Notification.objects.values_list('message', flat=True))
+        self.assertEqual(NotificationCounter.unread_for(self.user.pk), 2)
+
+        # The rollups were moved along, not rebuilt
+        counted = sorted(AnalyticsRollup.objects.exclude(value=0).values_list('metric', 'name', 'status', 'value'))
+        analytics.rebuild([self.user.pk])
+        self.assertEqual(counted, sorted(AnalyticsRollup.objects.values_list('metric', 'name', 'status', 'value')))
+
+        out = StringIO()
+        call_command('advance_crop_status', today=today, stdout=out)
+        self.assertIn('Moved 0 crops', out.getvalue())
+        self.assertEqual(Notification.objects.count(), 2)
+
+    def test_reads_bring_statuses_up_to_date_once_a_day(self):
+        crops = self.plant(timezone.now().date())
+        response = self.client.get(reverse('crop-list-create'))
+        self.assertEqual(
+            {crop['name']: crop['status'] for crop in response.data['results']},
+            {'Maize': 'Growing', 'Beans': 'Harvesting', 'Kale': 'Planting'},
+        )
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('crop-detail', args=[crops['Kale'].pk]))
+        self.assertFalse(any('UPDATE' in query['sql'] for query in ctx.captured_queries))
+
+        # Editing a crop has it checked again on the next read
+        self.client.patch(reverse('crop-detail', args=[crops['Maize'].pk]), {'status': 'Planting'}, format='json')
+        self.assertEqual(self.client.get(reverse('crop-detail', args=[crops['Maize'].pk])).data['status'], 'Growing')
+        self.assertEqual(self.client.get(reverse('dashboard')).data['crops']['by_status']['Planting'], 1)
+
+    @override_settings(CROP_STATUS_ON_READ=False)
+    def test_reads_can_leave_statuses_to_the_command(self):
+        self.plant(timezone.now().date())
+        self.client.get(reverse('crop-list-create'))
+        self.assertEqual(set(self.statuses().values()), {'Planting'})
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.today = date.today()
+
+    def test_write_path_only_enqueues(self):
+        response = self.client.post(reverse('crop-list-create'), {
+            'name': 'Maize',
+            'variety': 'H614',
+            'planting_date': self.today - timedelta(days=90),
+            'harvest_date': self.today + timedelta(days=2),
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Notification.objects.count(), 0)
+        self.assertEqual(NotificationOutbox.objects.count(), 1)
+
+        stats = drain(workers=1)
+        self.assertEqual((stats['processed'], stats['created']), (1, 1))
+        self.assertTrue(NotificationOutbox.objects.get().processed_at)
+        self.assertEqual(Notification.objects.get().crop_id, response.data['id'])
+
+    def test_read_alerts_are_not_sent_again(self):
+        crop = Crop.objects.create(
+            user=self.user, name='Maize', variety='H614',
+            planting_date=self.today - timedelta(days=90), harvest_date=self.today + timedelta(days=2),
+        )
+        drain(workers=1)
+        alert = Notification.objects.get()
+        self.client.post(reverse('notification-mark-read', args=[alert.pk]))
+        crop.variety = 'H624'
+        crop.save()
+        self.assertEqual(drain(workers=1)['created'], 0)
+        self.assertEqual(list(Notification.objects.values_list('pk', 'is_read')), [(alert.pk, True)])
+
+    def test_crops_outside_window_are_not_enqueued(self):
+        Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=self.today,
+            harvest_date=self.today + timedelta(days=120),
+        )
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_failed_rows_are_retried_later(self):
+        crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=self.today - timedelta(days=90),
+            harvest_date=self.today + timedelta(days=2),
+        )
+        with self.settings(NOTIFICATION_LEAD_DAYS='not a number'):
+            stats = drain(workers=1)
+        self.assertEqual(stats['failed'], 1)
+        event = NotificationOutbox.objects.get(object_id=crop.pk)
+        self.assertEqual(event.attempts, 1)
+        self.assertIsNone(event.processed_at)
+        self.assertGreater(event.available_at, event.created_at)
+        self.assertTrue(event.last_error)
+
+    def test_finished_rows_are_purged(self):
+        old = timezone.now() - timedelta(days=8)
+        NotificationOutbox.objects.bulk_create([
+            NotificationOutbox(user=self.user, kind='harvest', object_id=1, processed_at=old),
+            NotificationOutbox(user=self.user, kind='harvest', object_id=2, processed_at=timezone.now()),
+            NotificationOutbox(user=self.user, kind='harvest', object_id=3, attempts=5, available_at=old),
+            NotificationOutbox(user=self.user, kind='harvest', object_id=4, attempts=2, available_at=old),
+        ])
+        out = StringIO()
+        call_command('purge_notifications', '--batch-size', '1', stdout=out)
+        self.assertIn('2 outbox rows', out.getvalue())
+        # Recently processed rows and rows still due a retry stay
+        self.assertEqual(sorted(NotificationOutbox.objects.values_list('object_id', flat=True)), [2, 4])
+
+
+class BulkEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.today = date.today()
+        self.crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=self.today - timedelta(days=90),
+            harvest_date=self.today + timedelta(days=60),
+        )
+
+    def test_bulk_create(self):
+        rows = [
+            {'description': f'Weeding {i}', 'date': self.today + timedelta(days=i), 'crop_id': self.crop.pk}
+            for i in range(20)
+        ]
+        response = self.client.post(reverse('activity-list-create'), rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 20)
+        self.assertEqual(Activity.objects.filter(user=self.user).count(), 20)
+        # Only the activities inside the alert window are queued
+        self.assertEqual(NotificationOutbox.objects.filter(kind='activity').count(), 8)
+
+    def test_bulk_create_reports_per_item_errors(self):
+        rows = [
+            {'name': 'Urea', 'quantity': 10, 'type': 'Fertilizer', 'unit': 'kgs'},
+            {'name': 'Diesel', 'quantity': -5, 'type': 'Fuel', 'unit': 'litres'},
+        ]
+        response = self.client.post(reverse('resource-list-create'), rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['errors'][0], {})
+        self.assertIn('quantity', response.data['errors'][1])
+        self.assertFalse(Resource.objects.exists())
+
+    def test_bulk_update_and_delete(self):
+        other = Crop.objects.create(
+            user=self.user,
+            name='Beans',
+            variety='Rosecoco',
+            planting_date=self.today,
+            harvest_date=self.today + timedelta(days=3),
+        )
+        NotificationOutbox.objects.all().delete()
+        response = self.client.patch(reverse('crop-bulk'), [
+            {'id': self.crop.pk, 'status': 'Growing'},
+            {'id': other.pk, 'status': 'Harvesting'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(Crop.objects.values_list('id', 'status')),
+            {self.crop.pk: 'Growing', other.pk: 'Harvesting'},
+        )
+        self.assertEqual(list(NotificationOutbox.objects.values_list('object_id', flat=True)), [other.pk])
+
+        response = self.client.patch(reverse('crop-bulk'), [
+            {'id': self.crop.pk, 'harvest_date': self.today - timedelta(days=365)},
+            {'id': 999999, 'status': 'Growing'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.data['errors']), 2)
+
+        response = self.client.delete(reverse('crop-bulk'), {'ids': [other.pk, 999999]}, format='json')
+        self.assertEqual(response.data, {'deleted': [other.pk], 'not_found': [999999]})
+        self.assertFalse(Crop.objects.filter(pk=other.pk).exists())
+
+    def test_bulk_delete_applies_side_effects_once_per_batch(self):
+        activities = Activity.objects.bulk_create([
+            Activity(user=self.user, crop=self.crop, description=f'Weeding {i}', date=self.today - timedelta(days=i % 3))
+            for i in range(100)
+        ])
+        analytics.count_created(activities)
+        other = Crop.objects.create(
+            user=self.user, name='Beans', variety='Rosecoco',
+            planting_date=self.today, harvest_date=self.today + timedelta(days=90),
+        )
+        Activity.objects.create(user=self.user, crop=other, description='Planting', date=self.today)
+        Notification.objects.create(user=self.user, crop=other, message='Beans due')
+        version = CollectionVersion.current(self.user.pk, 'activities')[0]
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.delete(
+                reverse('activity-bulk'), {'ids': [activity.pk for activity in activities]}, format='json',
+            )
+        self.assertEqual(len(response.data['deleted']), 100)
+        self.assertLessEqual(len(ctx.captured_queries), 10)
+        self.assertEqual(SyncTombstone.objects.filter(collection='activities').count(), 100)
+        self.assertGreater(CollectionVersion.current(self.user.pk, 'activities')[0], version)
+
+        # Cascades are accounted for too
+        self.client.delete(reverse('crop-bulk'), {'ids': [other.pk]}, format='json')
+        self.assertEqual(
+            sorted(SyncTombstone.objects.exclude(collection='activities').values_list('collection', flat=True)),
+            ['crops', 'notifications'],
+        )
+        self.assertEqual(NotificationCounter.unread_for(self.user.pk), 0)
+        rollups = AnalyticsRollup.objects.exclude(value=0).values_list('metric', 'period_start', 'subject_id', 'value')
+        incremental = sorted(rollups)
+        analytics.rebuild([self.user.pk])
+        self.assertEqual(incremental, sorted(rollups.all()))
+
+    def test_bulk_update_writes_only_each_items_fields(self):
+        other = Crop.objects.create(
+            user=self.user, name='Beans', variety='Rosecoco',
+            planting_date=self.today, harvest_date=self.today + timedelta(days=90),
+        )
+        is_valid = CropSerializer.is_valid
+
+        def validate_then_race(serializer, **kwargs):
+            # Another request changes the rows after this one read them
+            Crop.objects.filter(pk=other.pk).update(status='Growing', variety='KK15')
+            return is_valid(serializer, **kwargs)
+
+        with mock.patch.object(CropSerializer, 'is_valid', validate_then_race):
+            response = self.client.patch(reverse('crop-bulk'), [
+                {'id': self.crop.pk, 'status': 'Harvesting'},
+                {'id': other.pk, 'name': 'Climbing beans'},
+            ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            list(Crop.objects.order_by('pk').values_list('name', 'variety', 'status')),
+            [('Maize', 'H614', 'Harvesting'), ('Climbing beans', 'KK15', 'Growing')],
+        )
+        self.assertEqual(response.data[1]['status'], 'Growing')
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=date(2024, 3, 1),
+            harvest_date=date(2024, 7, 1),
+        )
+
+    def upload(self, kind, name, content):
+        return self.client.post(
+            reverse('import', args=[kind]),
+            {'file': SimpleUploadedFile(name, content.encode())},
+            format='multipart',
+        )
+
+    def test_csv_activities_resolve_crop_names(self):
+        content = (
+            'description,date,crop\n'
+            'Planting,2024-03-01,Maize\n'
+            '"Top dressing, CAN",2024-04-10,Maize\n'
+            'Spraying,2024-13-01,Maize\n'
+            'Weeding,2024-04-01,Sorghum\n'
+        )
+        response = self.upload('activities', 'log.csv', content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['imported'], response.data['failed']), (2, 2))
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5])
+        self.assertEqual(
+            set(Activity.objects.values_list('description', 'crop_id')),
+            {('Planting', self.crop.pk), ('Top dressing, CAN', self.crop.pk)},
+        )
+
+    def test_ndjson_resources(self):
+        content = (
+            '{"name": "Urea", "quantity": 50, "type": "Fertilizer", "unit": "kgs"}\n'
+            '{"name": "Diesel", "quantity": -1, "type": "Fuel"}\n'
+            'not json\n'
+            '{"name": "Seed", "quantity": "12.5", "type": "Seed", "usage_status": "in_use"}\n'
+        )
+        response = self.upload('resources', 'inventory.ndjson', content)
+        self.assertEqual((response.data['imported'], response.data['failed']), (2, 2))
+        self.assertEqual(
+            set(Resource.objects.values_list('name', 'quantity', 'unit', 'usage_status')),
+            # usage_status is derived, whatever the file says
+            {('Urea', 50.0, 'kgs', 'available'), ('Seed', 12.5, 'units', 'available')},
+        )
+
+    def test_activities_in_the_alert_window_are_queued(self):
+        soon = (date.today() + timedelta(days=1)).isoformat()
+        later = (date.today() + timedelta(days=300)).isoformat()
+        self.upload('activities', 'log.csv', f'description,date,crop\nSpraying,{soon},Maize\nPruning,{later},Maize\n')
+        spraying = Activity.objects.get(description='Spraying')
+        self.assertEqual(
+            list(NotificationOutbox.objects.values_list('kind', 'object_id', 'user_id')),
+            [('activity', spraying.pk, self.user.pk)],
+        )
+
+    def test_csv_with_a_byte_order_mark(self):
+        # As saved by Excel's "CSV UTF-8"
+        response = self.upload('activities', 'log.csv', '\ufeffdescription,date,crop\nPlanting,2024-03-01,Maize\n')
+        self.assertEqual((response.data['imported'], response.data['failed']), (1, 0))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'inventory.csv')
+            with open(path, 'w', encoding='utf-8-sig') as f:
+                f.write('name,quantity,type\nUrea,50,Fertilizer\n')
+            call_command('import_records', 'resources', path, user='farmer', stdout=StringIO())
+        self.assertEqual(list(Resource.objects.values_list('name', flat=True)), ['Urea'])
+
+    def test_rejects_unknown_format(self):
+        response = self.upload('resources', 'inventory.xlsx', 'x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_command_in_chunks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'log.ndjson')
+            errors = os.path.join(tmp, 'errors.ndjson')
+            with open(path, 'w') as f:
+                for i in range(25):
+                    f.write(f'{{"description": "Irrigation {i}", "date": "2024-05-01", "crop_id": {self.crop.pk}}}\n')
+                f.write('{"description": "", "date": "2024-05-01", "crop": "Maize"}\n')
+            call_command(
+                'import_records', 'activities', path,
+                user='farmer', chunk_size=10, errors=errors, stdout=StringIO(),
+            )
+            with open(errors) as f:
+                self.assertEqual(len(f.readlines()), 1)
+        self.assertEqual(Activity.objects.count(), 25)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=date(2024, 3, 1),
+            harvest_date=date(2024, 7, 1),
+        )
+        Activity.objects.bulk_create([
+            Activity(user=self.user, crop=self.crop, description=f'Scouting, week {i}', date=date(2024, 3, 1) + timedelta(weeks=i))
+            for i in range(10)
+        ])
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse('export', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_with_date_range(self):
+        body = self.export('activities', start='2024-03-08', end='2024-03-22')
+        lines = body.splitlines()
+        self.assertEqual(lines[0], 'id,description,date,crop_id,crop')
+        self.assertEqual(len(lines), 4)
+        self.assertIn('"Scouting, week 1",2024-03-08', lines[1])
+
+    def test_ndjson_with_status(self):
+        body = self.export('crops', output='ndjson', status='Planting')
+        self.assertEqual(
+            [json.loads(line) for line in body.splitlines()],
+            [{
+                'id': self.crop.pk, 'name': 'Maize', 'variety': 'H614', 'planting_date': '2024-03-01',
+                'harvest_date': '2024-07-01', 'status': 'Planting',
+            }],
+        )
+        self.assertEqual(self.export('crops', output='ndjson', status='Growing'), '')
+
+    def test_rejects_bad_filters(self):
+        url = reverse('export', args=['resources'])
+        self.assertEqual(self.client.get(url, {'start': '2024-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export', args=['users'])).status_code, 400)
+
+
+class NotificationDeliveryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        # Ids out of order, as when a transaction that took a lower id
+        # commits later: delivery follows seq
+        self.first = Notification.objects.create(user=self.user, message='First', id=1000)
+        self.second = Notification.objects.create(user=self.user, message='Second', id=10)
+
+    def test_list_since(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('notification-list'), {'since': self.first.seq})
+        self.assertEqual([n['id'] for n in response.data['results']], [self.second.pk])
+        self.assertEqual(client.get(reverse('notification-list'), {'since': 'x'}).status_code, 400)
+
+    async def test_poll_returns_backlog_immediately(self):
+        client = AsyncClient()
+        headers = {'Authorization': f'Token {self.token.key}'}
+        response = await client.get(reverse('notification-poll'), {'since': self.first.seq}, headers=headers)
+        data = json.loads(response.content)
+        self.assertEqual([n['message'] for n in data['results']], ['Second'])
+        self.assertEqual(data['cursor'], self.second.seq)
+
+        response = await client.get(
+            reverse('notification-poll'), {'since': self.second.seq, 'timeout': 0}, headers=headers,
+        )
+        self.assertEqual(json.loads(response.content)['results'], [])
+
+    async def test_poll_requires_token(self):
+        response = await AsyncClient().get(reverse('notification-poll'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_resumes_from_last_event_id(self):
+        client = AsyncClient()
+        response = await client.get(
+            reverse('notification-stream'),
+            {'token': self.token.key},
+            headers={'Last-Event-ID': str(self.first.seq)},
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = response.streaming_content
+        self.assertEqual(await anext(chunks), 'retry: 3000\n\n'.encode())
+        event = (await anext(chunks)).decode()
+        self.assertTrue(event.startswith(f'id: {self.second.seq}\nevent: notification\n'))
+        await chunks.aclose()
+
+    def test_seq_follows_the_users_writes(self):
+        self.assertEqual((self.first.seq, self.second.seq), (1, 2))
+        other = User.objects.create_user(username='other', password='secret')
+        Notification.objects.bulk_create([
+            Notification(user=other, message='Theirs'), Notification(user=self.user, message='Third'),
+        ])
+        self.assertEqual(
+            list(Notification.objects.order_by('user_id', 'seq').values_list('user_id', 'seq')),
+            [(self.user.pk, 1), (self.user.pk, 2), (self.user.pk, 3), (other.pk, 1)],
+        )
+        self.assertEqual(NotificationCounter.objects.get(user=self.user).last_seq, 3)
+
+    def test_streams_are_woken_once_the_notification_commits(self):
+        with mock.patch('api.signals.publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                Notification.objects.create(user=self.user, message='Third')
+                publish.assert_not_called()
+        publish.assert_called_once_with([self.user.pk])
+
+    async def test_in_process_backend_wakes_waiters_from_other_threads(self):
+        backend = InProcessBackend()
+        loop = asyncio.get_running_loop()
+        threading.Timer(0.05, backend.publish, args=[self.user.pk]).start()
+        started = loop.time()
+        await backend.wait(self.user.pk, 5)
+        self.assertLess(loop.time() - started, 1)
+
+
+class UnreadNotificationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=date(2024, 3, 1),
+            harvest_date=date(2024, 7, 1),
+        )
+        self.notifications = [
+            Notification.objects.create(user=self.user, message=f'Alert {i}', crop=self.crop if i < 3 else None)
+            for i in range(6)
+        ]
+
+    def unread(self):
+        return self.client.get(reverse('notification-unread-count')).data['unread']
+
+    def test_unread_count_is_one_lookup(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.unread(), 6)
+        # token lookup + counter row
+        self.assertEqual(len(ctx.captured_queries), 2)
+
+    def test_bulk_mark_read(self):
+        url = reverse('notification-bulk-mark-read')
+        ids = [n.pk for n in self.notifications]
+        response = self.client.post(url, {'ids': ids[:2]}, format='json')
+        self.assertEqual(response.data, {'updated': 2, 'unread': 4})
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {'crop': self.crop.pk}, format='json')
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(
+            sum('UPDATE "api_notification"' in q['sql'] for q in ctx.captured_queries), 1,
+        )
+
+        response = self.client.post(url, {'before': self.notifications[4].seq}, format='json')
+        self.assertEqual(response.data, {'updated': 2, 'unread': 1})
+        self.assertEqual(self.client.post(url, {'ids': [1], 'crop': 1}, format='json').status_code, 400)
+
+    def test_counter_follows_every_write_path(self):
+        self.client.post(reverse('notification-mark-read', args=[self.notifications[5].pk]))
+        self.client.post(reverse('notification-mark-read', args=[self.notifications[5].pk]))
+        self.assertEqual(self.unread(), 5)
+
+        # Deleting the crop cascades to its three unread notifications
+        self.crop.delete()
+        self.assertEqual(self.unread(), 2)
+
+        notification = self.notifications[3]
+        notification.is_read = True
+        notification.save()
+        self.assertEqual(self.unread(), 1)
+        self.assertEqual(
+            NotificationCounter.objects.get(user=self.user).unread,
+            Notification.objects.filter(user=self.user, is_read=False).count(),
+        )
+
+    def test_missing_counter_is_rebuilt(self):
+        NotificationCounter.objects.filter(user=self.user).delete()
+        self.assertEqual(self.unread(), 6)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=date(2024, 3, 1),
+            harvest_date=date(2024, 7, 1),
+        )
+        Activity.objects.create(user=self.user, crop=self.crop, description='Weeding', date=date(2024, 4, 1))
+
+    def revalidate(self, url, response):
+        with CaptureQueriesContext(connection) as ctx:
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        return again, len(ctx.captured_queries)
+
+    def test_unchanged_reload_is_304_without_reading_rows(self):
+        for url in [reverse('crop-list-create'), reverse('crop-detail', args=[self.crop.pk]), reverse('activity-list-create')]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                again, queries = self.revalidate(url, response)
+                self.assertEqual(again.status_code, 304)
+                self.assertEqual(again['ETag'], response['ETag'])
+                # Only the collection version; the token is cached by now
+                self.assertEqual(queries, 1)
+
+        response = self.client.get(reverse('resource-list-create'))
+        again = self.client.get(reverse('resource-list-create'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_writes_change_the_etag(self):
+        url = reverse('activity-list-create')
+        response = self.client.get(url)
+        # Activities embed their crop, so renaming it changes the list
+        self.client.patch(reverse('crop-detail', args=[self.crop.pk]), {'name': 'Corn'}, format='json')
+        again, _ = self.revalidate(url, response)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.data['results'][0]['crop']['name'], 'Corn')
+
+        response = again
+        self.client.post(url, [{'description': 'Spraying', 'date': '2024-05-01', 'crop_id': self.crop.pk}], format='json')
+        again, _ = self.revalidate(url, response)
+        self.assertEqual(again.status_code, 200)
+
+        notifications = reverse('notification-list')
+        response = self.client.get(notifications)
+        Notification.objects.create(user=self.user, message='Harvest soon')
+        self.assertEqual(self.revalidate(notifications, response)[0].status_code, 200)
+
+    def test_query_string_is_part_of_the_etag(self):
+        url = reverse('crop-list-create')
+        response = self.client.get(url)
+        again = self.client.get(url, {'page_size': 1}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 200)
+
+    def test_versions_are_per_user(self):
+        other = User.objects.create_user(username='other', password='secret')
+        Crop.objects.create(
+            user=other, name='Beans', variety='Rosecoco',
+            planting_date=date(2024, 3, 1), harvest_date=date(2024, 6, 1),
+        )
+        self.assertEqual(CollectionVersion.current(self.user.pk, 'crops')[0], 2)
+        self.assertEqual(CollectionVersion.current(other.pk, 'crops')[0], 2)
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['responses'].clear()
+        response_cache.stats.reset()
+        self.user = User.objects.create_user(username='farmer', password='secret', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.crop = Crop.objects.create(
+            user=self.user,
+            name='Maize',
+            variety='H614',
+            planting_date=date(2024, 3, 1),
+            harvest_date=date(2024, 7, 1),
+        )
+        Activity.objects.create(user=self.user, crop=self.crop, description='Weeding', date=date(2024, 4, 1))
+
+    def test_repeat_read_is_served_from_cache(self):
+        url = reverse('activity-list-create')
+        first = self.client.get(url)
+        self.assertEqual(first['X-Cache'], 'MISS')
+        with CaptureQueriesContext(connection) as ctx:
+            second = self.client.get(url)
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.json(), first.json())
+        # Only the collection version; the token is cached by now
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        stats = self.client.get(reverse('cache-stats')).data
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_crop_delete_invalidates_cascaded_collections(self):
+        urls = [reverse('crop-list-create'), reverse('activity-list-create')]
+        for url in urls:
+            self.client.get(url)
+        self.crop.delete()
+        for url in urls:
+            response = self.client.get(url)
+            self.assertEqual(response['X-Cache'], 'MISS')
+            self.assertEqual(response.data['results'], [])
+
+    def test_other_users_never_share_entries(self):
+        url = reverse('crop-list-create')
+        self.client.get(url)
+        other = User.objects.create_user(username='other', password='secret')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=other).key}')
+        response = client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'], [])
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'responses': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'responses-lru',
+            'OPTIONS': {'MAX_ENTRIES': 2, 'CULL_FREQUENCY': 2},
+        },
+        'auth': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'auth-lru'},
+    })
+    def test_least_recently_used_entry_is_evicted(self):
+        crops, resources, activities = (
+            reverse('crop-list-create'), reverse('resource-list-create'), reverse('activity-list-create'),
+        )
+        self.client.get(crops)
+        self.client.get(resources)
+        self.client.get(crops)
+        self.client.get(activities)
+        self.assertEqual(self.client.get(crops)['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(resources)['X-Cache'], 'MISS')
+
+    def test_stats_are_admin_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('cache-stats')).status_code, 403)
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def queries_per_request(self, authentication, requests=10):
+        with CaptureQueriesContext(connection) as ctx:
+            for _ in range(requests):
+                user, _ = authentication.authenticate_credentials(self.token.key)
+                self.assertEqual(user, self.user)
+        return len(ctx.captured_queries) / requests
+
+    def test_benchmark_queries_per_request(self):
+        before = self.queries_per_request(TokenAuthentication())
+        after = self.queries_per_request(CachedTokenAuthentication())
+        self.assertEqual(before, 1)
+        # One miss, then nine requests served from the cache
+        self.assertEqual(after, 0.1)
+
+    def test_same_failures_as_token_authentication(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Token not-a-token')
+        self.assertEqual(self.client.get(reverse('user-info')).status_code, 401)
+
+    def test_token_deletion_takes_effect_immediately(self):
+        self.assertEqual(self.client.get(reverse('user-info')).status_code, 200)
+        self.token.delete()
+        self.assertEqual(self.client.get(reverse('user-info')).status_code, 401)
+
+    def test_deactivation_takes_effect_immediately(self):
+        self.assertEqual(self.client.get(reverse('user-info')).status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('user-info')).status_code, 401)
+
+    def test_password_change_evicts_cached_user(self):
+        self.client.get(reverse('user-info'))
+        self.user.set_password('new-secret')
+        self.user.save()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('user-info'))
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertTrue(cached_user(self.token.key).check_password('new-secret'))
+
+    def test_cache_holds_no_password_hash(self):
+        self.client.get(reverse('user-info'))
+        entry = caches['auth'].get(_cache_key(self.token.key))
+        self.assertNotIn(self.user.password, entry)
+        user = cached_user(self.token.key)
+        self.assertEqual((user.pk, user.username, user.is_staff), (self.user.pk, 'farmer', False))
+        self.assertEqual(user.get_deferred_fields(), {'password', 'last_login', 'first_name', 'last_name', 'date_joined'})
+        # Saving the rebuilt user only writes what was loaded
+        user.email = 'farmer@example.com'
+        user.save()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.email, 'farmer@example.com')
+        self.assertTrue(self.user.check_password('secret'))
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def test_seed_farm_creates_consistent_data(self):
+        out = StringIO()
+        call_command(
+            'seed_farm', users=3, crops=2, activities=3, resources=4, notifications=5,
+            users_per_transaction=2, seed=7, stdout=out,
+        )
+        self.assertIn('Created 3 users, 6 crops, 18 activities, 12 resources, 15 notifications', out.getvalue())
+        for user in User.objects.filter(username__startswith='farmer'):
+            self.assertTrue(user.check_password('farm-pass'))
+            self.assertTrue(Token.objects.filter(user=user).exists())
+            self.assertEqual(
+                NotificationCounter.unread_for(user.pk),
+                Notification.objects.filter(user=user, is_read=False).count(),
+            )
+            self.assertEqual(CollectionVersion.objects.filter(user=user).count(), 4)
+        self.assertFalse(Activity.objects.exclude(user_id=models.F('crop__user_id')).exists())
+
+    def test_benchmark_writes_machine_readable_results(self):
+        call_command('seed_farm', users=2, crops=1, activities=1, resources=1, notifications=2, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command('benchmark_api', requests=2, concurrency=1, users=2, output=path, stdout=StringIO())
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(report['database'], connection.vendor)
+        self.assertEqual(set(report['endpoints']), set(ENDPOINTS))
+        for name, result in report['endpoints'].items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(result['errors'], 0, result['statuses'])
+                self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+                self.assertGreater(result['throughput_rps'], 0)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.registry.reset()
+        self.user = User.objects.create_user(username='farmer', password='secret', is_staff=True)
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_metrics_endpoint_reports_per_view_series(self):
+        self.client.get(reverse('crop-list-create'))
+        self.client.get(reverse('crop-list-create'))
+        self.client.get('/api/no-such-page/')
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        labels = 'view="crop-list-create",method="GET"'
+        self.assertIn(f'farm_http_requests_total{{{labels},status="200"}} 2', body)
+        self.assertIn(f'farm_http_request_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'farm_db_queries_per_request_bucket{{{labels},le="+Inf"}} 2', body)
+        self.assertIn(f'farm_json_render_duration_seconds_count{{{labels}}} 2', body)
+        self.assertIn(f'farm_http_response_bytes_count{{{labels}}} 2', body)
+        self.assertIn('view="unmatched"', body)
+        self.assertNotIn('view="metrics"', body)
+
+    async def test_queries_are_counted_under_asgi(self):
+        # AsyncClient runs the middleware chain async, as an ASGI server does;
+        # the DRF view itself is sync and runs on another thread
+        response = await AsyncClient().get(
+            reverse('crop-list-create'), headers={'Authorization': f'Token {self.token.key}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        histogram = metrics.registry._histograms['farm_db_queries_per_request'][('crop-list-create', 'GET')]
+        self.assertEqual(histogram.count, 1)
+        self.assertGreater(histogram.sum, 0)
+
+    def test_metrics_are_admin_only(self):
+        self.user.is_staff = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get(reverse('crop-list-create'))
+        record = logs.records[0]
+        self.assertEqual(record.view, 'crop-list-create')
+        self.assertTrue(any('api_crop' in query['sql'] for query in record.slowest_sql))
+        json.loads(JsonFormatter().format(record))
+
+    def test_login_is_logged_without_the_password(self):
+        with self.assertLogs('api.views', 'DEBUG') as logs:
+            self.client.post(reverse('login'), {'username': 'farmer', 'password': 'secret'}, format='json')
+        self.assertEqual(logs.records[0].username, 'farmer')
+        self.assertNotIn('secret', ' '.join(logs.output))
+
+
+class ResourceLedgerTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.urea = Resource.objects.create(user=self.user, name='Urea', quantity=100, type='Fertilizer', unit='kgs')
+        self.diesel = Resource.objects.create(user=self.user, name='Diesel', quantity=40, type='Fuel', unit='litres')
+        self.url = reverse('resource-movements')
+
+    def test_batch_moves_balances_without_reading_them(self):
+        movements = [
+            {'resource': self.urea.pk, 'kind': 'consumption', 'quantity': 30, 'occurred_on': '2025-03-01'},
+            {'resource': self.urea.pk, 'kind': 'consumption', 'quantity': 20, 'occurred_on': '2025-03-02'},
+            {'resource': self.diesel.pk, 'kind': 'consumption', 'quantity': 40, 'occurred_on': '2025-03-02'},
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(self.url, movements, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['balances'], [
+            {'id': self.urea.pk, 'quantity': 50.0, 'usage_status': 'in_use'},
+            {'id': self.diesel.pk, 'quantity': 0.0, 'usage_status': 'depleted'},
+        ])
+        updates = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('UPDATE "api_resource"')]
+        self.assertEqual(len(updates), 2)
+        self.assertTrue(all('"quantity" = ("api_resource"."quantity" +' in sql for sql in updates))
+
+        response = self.client.post(self.url, {'resource': self.diesel.pk, 'kind': 'restock', 'quantity': 10}, format='json')
+        self.diesel.refresh_from_db()
+        self.assertEqual((self.diesel.quantity, self.diesel.usage_status), (10, 'available'))
+
+    def test_overdraw_rejects_the_whole_batch(self):
+        response = self.client.post(self.url, [
+            {'resource': self.diesel.pk, 'kind': 'restock', 'quantity': 5},
+            {'resource': self.urea.pk, 'kind': 'consumption', 'quantity': 101},
+        ], format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['resource'], self.urea.pk)
+        self.assertFalse(ResourceMovement.objects.exists())
+        self.diesel.refresh_from_db()
+        self.assertEqual(self.diesel.quantity, 40)
+
+    def test_other_users_resources_are_rejected(self):
+        other = User.objects.create_user(username='other', password='secret')
+        theirs = Resource.objects.create(user=other, name='Seed', quantity=5, type='Seeds')
+        response = self.client.post(self.url, {'resource': theirs.pk, 'kind': 'consumption', 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_balance_as_of_date(self):
+        self.client.post(self.url, [
+            {'resource': self.urea.pk, 'kind': 'consumption', 'quantity': 30, 'occurred_on': '2025-03-01'},
+            {'resource': self.urea.pk, 'kind': 'restock', 'quantity': 50, 'occurred_on': '2025-04-01'},
+            {'resource': self.urea.pk, 'kind': 'consumption', 'quantity': 5, 'occurred_on': '2025-05-01'},
+        ], format='json')
+        balances = reverse('resource-balances')
+        expected = {'2025-02-28': 100, '2025-03-01': 70, '2025-04-15': 120, '2025-05-01': 115}
+        for day, balance in expected.items():
+            with self.subTest(as_of=day):
+                results = self.client.get(balances, {'as_of': day}).data['results']
+                self.assertEqual({r['id']: r['balance'] for r in results}[self.urea.pk], balance)
+        self.assertEqual(self.client.get(balances, {'as_of': 'March'}).status_code, 400)
+
+        listed = self.client.get(self.url, {'resource': self.urea.pk, 'start': '2025-04-01'}).data['results']
+        self.assertEqual([m['delta'] for m in listed], [-5, 50])
+
+    def test_quantity_edits_are_recorded_as_stock_takes(self):
+        # Usage recorded by another worker after this client loaded the resource
+        self.client.post(self.url, {'resource': self.urea.pk, 'kind': 'consumption', 'quantity': 10}, format='json')
+        response = self.client.patch(reverse('resource-detail', args=[self.urea.pk]), {'quantity': 80}, format='json')
+        self.assertEqual(response.data['quantity'], 80)
+        adjustment = ResourceMovement.objects.get(kind='adjustment')
+        self.assertEqual(adjustment.delta, -10)
+
+        response = self.client.patch(reverse('resource-bulk'), [{'id': self.diesel.pk, 'quantity': 0}], format='json')
+        self.assertEqual(response.data[0]['usage_status'], 'depleted')
+        self.assertEqual(ResourceMovement.objects.filter(resource=self.diesel).get().delta, -40)
+
+    def test_edits_keep_movements_recorded_since_the_row_was_read(self):
+        get_object = ResourceDetail.get_object
+
+        def stale_read(view):
+            resource = get_object(view)
+            # Another worker records usage after this request read the row
+            record_movements(self.user, [{'resource': resource, 'kind': 'consumption', 'quantity': 30}])
+            return resource
+
+        with mock.patch.object(ResourceDetail, 'get_object', stale_read):
+            response = self.client.patch(
+                reverse('resource-detail', args=[self.urea.pk]), {'name': 'Urea 46%', 'usage_status': 'depleted'},
+                format='json',
+            )
+        self.assertEqual(
+            (response.data['name'], response.data['quantity'], response.data['usage_status']), ('Urea 46%', 70, 'in_use'),
+        )
+        self.urea.refresh_from_db()
+        self.assertEqual((self.urea.name, self.urea.quantity, self.urea.usage_status), ('Urea 46%', 70, 'in_use'))
+
+    def test_usage_status_is_derived_on_create(self):
+        response = self.client.post(
+            reverse('resource-list-create'), {'name': 'Seed', 'quantity': 0, 'type': 'Seed', 'usage_status': 'in_use'},
+            format='json',
+        )
+        self.assertEqual(response.data['usage_status'], 'depleted')
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.maize = Crop.objects.create(
+            user=self.user, name='Maize', variety='H614',
+            planting_date=date(2025, 3, 3), harvest_date=date(2025, 7, 1), status='Growing',
+        )
+        self.beans = Crop.objects.create(
+            user=self.user, name='Beans', variety='KK15',
+            planting_date=date(2025, 3, 20), harvest_date=date(2025, 6, 1),
+        )
+
+    def rollups(self):
+        return sorted(
+            AnalyticsRollup.objects.exclude(value=0)
+            .values_list('metric', 'period_start', 'subject_id', 'name', 'status', 'value')
+        )
+
+    def test_writes_keep_rollups_equal_to_a_rebuild(self):
+        weeding = Activity.objects.create(user=self.user, crop=self.maize, description='Weeding', date=date(2025, 3, 5))
+        Activity.objects.create(user=self.user, crop=self.maize, description='Spraying', date=date(2025, 3, 6))
+        Activity.objects.create(user=self.user, crop=self.beans, description='Planting', date=date(2025, 3, 20))
+        weeding.date, weeding.crop = date(2025, 3, 12), self.beans
+        weeding.save()
+        self.maize.status = 'Harvesting'
+        self.maize.save()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.patch(reverse('activity-bulk'), [{'id': weeding.pk, 'date': '2025-04-01'}], format='json')
+            self.client.patch(reverse('crop-bulk'), [{'id': self.beans.pk, 'status': 'Growing'}], format='json')
+            self.client.post(reverse('activity-list-create'), [
+                {'description': 'Scouting', 'date': '2025-03-21', 'crop_id': self.beans.pk},
+            ], format='json')
+        # Bulk writes move their rows' counts rather than rebuilding the user's rollups
+        self.assertFalse(any(q['sql'].startswith('DELETE FROM "api_analyticsrollup"') for q in ctx.captured_queries))
+        self.beans.refresh_from_db()
+        self.beans.delete()
+
+        incremental = self.rollups()
+        analytics.rebuild([self.user.pk])
+        self.assertEqual(incremental, self.rollups())
+        self.assertIn(('activities_weekly', date(2025, 3, 3), self.maize.pk, '', '', 1), incremental)
+        self.assertIn(('planted', date(2025, 3, 1), 0, 'Maize', 'Harvesting', 1), incremental)
+
+    def test_activity_series(self):
+        for day in (date(2025, 3, 3), date(2025, 3, 9), date(2025, 3, 10), date(2025, 4, 2)):
+            Activity.objects.create(user=self.user, crop=self.maize, description='Weeding', date=day)
+        Activity.objects.create(user=self.user, crop=self.beans, description='Planting', date=date(2025, 3, 20))
+        url = reverse('analytics', args=['activities'])
+
+        weekly = self.client.get(url, {'end': '2025-03-16'}).data['results']
+        self.assertEqual(
+            [(r['period'], r['crop'], r['count']) for r in weekly],
+            [(date(2025, 3, 3), 'Maize', 2), (date(2025, 3, 10), 'Maize', 1)],
+        )
+        monthly = self.client.get(url, {'period': 'month'}).data['results']
+        self.assertEqual(
+            [(r['period'], r['crop_id'], r['count']) for r in monthly],
+            [(date(2025, 3, 1), self.maize.pk, 3), (date(2025, 3, 1), self.beans.pk, 1), (date(2025, 4, 1), self.maize.pk, 1)],
+        )
+        self.assertEqual(self.client.get(url, {'period': 'decade'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('analytics', args=['weather'])).status_code, 400)
+
+    def test_crop_series_groups_by_name_and_status(self):
+        Crop.objects.create(
+            user=self.user, name='Maize', variety='DK8031',
+            planting_date=date(2025, 4, 1), harvest_date=date(2025, 7, 20), status='Growing',
+        )
+        url = reverse('analytics', args=['crops'])
+        by_status = self.client.get(url, {'date': 'harvest', 'group_by': 'status'}).data['results']
+        self.assertEqual(
+            [(r['period'], r['status'], r['count']) for r in by_status],
+            [(date(2025, 6, 1), 'Planting', 1), (date(2025, 7, 1), 'Growing', 2)],
+        )
+        yearly = self.client.get(url, {'period': 'year', 'group_by': 'name'}).data['results']
+        self.assertEqual([(r['name'], r['count']) for r in yearly], [('Beans', 1), ('Maize', 2)])
+        self.assertEqual(self.client.get(url, {'group_by': 'variety'}).status_code, 400)
+
+    def test_resource_series_sums_ledger_movements(self):
+        urea = Resource.objects.create(user=self.user, name='Urea', quantity=100, type='Fertilizer', unit='kgs')
+        self.client.post(reverse('resource-movements'), [
+            {'resource': urea.pk, 'kind': 'consumption', 'quantity': 30, 'occurred_on': '2025-03-01'},
+            {'resource': urea.pk, 'kind': 'consumption', 'quantity': 20, 'occurred_on': '2025-03-15'},
+            {'resource': urea.pk, 'kind': 'restock', 'quantity': 50, 'occurred_on': '2025-04-01'},
+        ], format='json')
+        results = self.client.get(reverse('analytics', args=['resources'])).data['results']
+        self.assertEqual(
+            [(r['period'], r['resource'], r['consumed'], r['restocked']) for r in results],
+            [(date(2025, 3, 1), 'Urea', 50, 0), (date(2025, 4, 1), 'Urea', 0, 50)],
+        )
+
+    def test_rebuild_command(self):
+        Activity.objects.bulk_create([
+            Activity(user=self.user, crop=self.maize, description='Weeding', date=date(2025, 3, 4)),
+        ])
+        out = StringIO()
+        call_command('rebuild_rollups', '--user', 'farmer', stdout=out)
+        self.assertIn('for 1 users', out.getvalue())
+        self.assertTrue(AnalyticsRollup.objects.filter(metric='activities_monthly', value=1).exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.maize = Crop.objects.create(
+            user=self.user, name='Maize', variety='H614',
+            planting_date=date(2025, 3, 1), harvest_date=date(2025, 7, 1), status='Growing',
+        )
+        self.beans = Crop.objects.create(
+            user=self.user, name='Beans', variety='Rosecoco',
+            planting_date=date(2025, 4, 1), harvest_date=date(2025, 6, 1),
+        )
+        # bulk_create skips signals; the index is kept by the database
+        Activity.objects.bulk_create([
+            Activity(user=self.user, crop=self.maize, description='Weeding the maize rows', date=date(2025, 3, 10)),
+            Activity(user=self.user, crop=self.beans, description='Weeded beans', date=date(2025, 4, 10)),
+            Activity(user=self.user, crop=self.maize, description='Top dressing', date=date(2025, 4, 20)),
+        ])
+        Notification.objects.create(user=self.user, crop=self.maize, message='Maize weeding is overdue')
+        other = User.objects.create_user(username='other', password='secret')
+        theirs = Crop.objects.create(
+            user=other, name='Maize', variety='DK8031', planting_date=date(2025, 3, 1), harvest_date=date(2025, 7, 1),
+        )
+        Activity.objects.create(user=other, crop=theirs, description='Weeding', date=date(2025, 3, 10))
+        self.url = reverse('search')
+
+    def found(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [(hit['type'], hit['object']['id']) for hit in response.data['results']]
+
+    def test_matches_stems_and_prefixes_within_the_user(self):
+        hits = self.found(q='weed')
+        self.assertEqual({kind for kind, _ in hits}, {'activities', 'notifications'})
+        self.assertEqual(len(hits), 3)
+        self.assertEqual(self.found(q='roseco'), [('crops', self.beans.pk)])
+        self.assertEqual(len(self.found(q='maize weeding')), 2)
+
+    def test_filters(self):
+        self.assertEqual(len(self.found(q='weed', type='activities', start='2025-04-01')), 1)
+        self.assertEqual(len(self.found(q='weed', crop=self.maize.pk)), 2)
+        self.assertEqual(self.found(q='weed', status='Planting'), [('activities', Activity.objects.get(description='Weeded beans').pk)])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.beans.variety = 'KK15'
+        self.beans.save()
+        self.assertEqual(self.found(q='rosecoco'), [])
+        self.assertEqual(self.found(q='kk15'), [('crops', self.beans.pk)])
+        Activity.objects.filter(description='Top dressing').delete()
+        self.assertEqual(self.found(q='dressing'), [])
+
+    def test_pagination(self):
+        response = self.client.get(self.url, {'q': 'weed', 'page_size': 2})
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['previous'])
+        second = self.client.get(response.data['next'])
+        self.assertEqual(len(second.data['results']), 1)
+        self.assertIsNone(second.data['next'])
+        first_ids = {(hit['type'], hit['object']['id']) for hit in response.data['results']}
+        self.assertNotIn((second.data['results'][0]['type'], second.data['results'][0]['object']['id']), first_ids)
+
+    def test_unindexed_fallback(self):
+        search._backends[connection.alias] = None
+        self.addCleanup(search._backends.clear)
+        self.assertEqual(len(self.found(q='weed')), 3)
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'q': '!!'}, {'q': 'weed', 'type': 'resources'}, {'q': 'weed', 'status': 'Dormant'},
+                       {'q': 'weed', 'start': 'March'}, {'q': 'weed', 'page': 0}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+
+class RetentionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        now = timezone.now()
+        self.ages = {'fresh read': (5, True), 'old read': (100, True), 'old unread': (100, False), 'ancient unread': (400, False)}
+        for message, (days, is_read) in self.ages.items():
+            notification = Notification.objects.create(user=self.user, message=message, is_read=is_read)
+            Notification.objects.filter(pk=notification.pk).update(created_at=now - timedelta(days=days))
+
+    def test_expired_notifications_are_archived_in_batches(self):
+        version = CollectionVersion.current(self.user.pk, 'notifications')[0]
+        out = StringIO()
+        call_command('purge_notifications', '--read-days', '90', '--unread-days', '365', '--batch-size', '1', stdout=out)
+        self.assertIn('Purged 2 expired notifications', out.getvalue())
+        self.assertEqual(
+            set(Notification.objects.values_list('message', flat=True)), {'fresh read', 'old unread'},
+        )
+        archived = ArchivedNotification.objects.order_by('created_at')
+        self.assertEqual([(a.message, a.is_read) for a in archived], [('ancient unread', False), ('old read', True)])
+        self.assertEqual(NotificationCounter.unread_for(self.user.pk), 1)
+        self.assertGreater(CollectionVersion.current(self.user.pk, 'notifications')[0], version)
+
+    def test_delete_without_archiving(self):
+        call_command('purge_notifications', '--read-days', '1', '--unread-days', '1', '--delete', stdout=StringIO())
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(ArchivedNotification.objects.exists())
+        self.assertEqual(NotificationCounter.unread_for(self.user.pk), 0)
+
+
+class RouteProbe(ReplicaReadMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'db': router.db_for_read(Crop)})
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.token = Token.objects.create(user=self.user)
+        self.probe = DatabaseRoutingMiddleware(RouteProbe.as_view())
+
+    def route(self, method='get'):
+        request = getattr(APIRequestFactory(), method)('/', HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return self.probe(request).data['db']
+
+    def test_reads_outside_opted_in_views_use_the_primary(self):
+        self.assertEqual(router.db_for_read(Crop), 'default')
+        self.assertFalse(PrimaryReplicaRouter().allow_migrate('replica1', 'api'))
+
+    def test_reads_after_a_write_in_the_same_request_use_the_primary(self):
+        token = _state.set(RoutingState())
+        self.addCleanup(_state.reset, token)
+        _state.get().replica_reads = True
+        self.assertEqual(router.db_for_read(Crop), 'replica1')
+        # Assigning a related object asks the router where to write, but is no write
+        Token(key='k', user=self.user)
+        self.assertEqual(router.db_for_read(Crop), 'replica1')
+        Crop.objects.filter(user=self.user).update(status='Growing')
+        self.assertEqual(router.db_for_read(Crop), 'default')
+
+    def test_copy_and_data_modifying_with_are_writes(self):
+        writes = [
+            'COPY "api_resource" ("user_id", "name") FROM STDIN WITH (FORMAT csv)',
+            'WITH moved AS (UPDATE "api_crop" SET "status" = %s RETURNING "id") SELECT count(*) FROM moved',
+            '  insert into "api_crop" ("name") values (%s)',
+        ]
+        reads = ['SELECT 1', 'WITH recent AS (SELECT "id" FROM "api_crop") SELECT * FROM recent', 'SAVEPOINT "s1"']
+        for sql in writes + reads:
+            with self.subTest(sql=sql):
+                state = RoutingState()
+                token = _state.set(state)
+                try:
+                    record_writes(lambda *args: None, sql, None, False, {})
+                finally:
+                    _state.reset(token)
+                self.assertEqual(state.wrote, sql in writes)
+
+    def test_writers_are_pinned_to_the_primary(self):
+        self.assertEqual(self.route(), 'replica1')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = client.post(reverse('crop-list-create'), {
+            'name': 'Maize', 'variety': 'H614', 'planting_date': '2025-03-01', 'harvest_date': '2025-07-01',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.route(), 'default')
+        cache.clear()
+        self.assertEqual(self.route(), 'replica1')
+
+
+@override_settings(ASYNC_DB_WORKERS=0)
+class AsyncReadViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='secret', email='farmer@example.com')
+        self.token = Token.objects.create(user=self.user)
+        self.headers = {'Authorization': f'Token {self.token.key}'}
+        for name in ['Maize', 'Beans', 'Kale']:
+            Crop.objects.create(
+                user=self.user, name=name, variety='Local',
+                planting_date=date(2025, 3, 1), harvest_date=date(2025, 7, 1),
+            )
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def call(self, view, url, **kwargs):
+        request = AsyncRequestFactory().get(url, headers={**self.headers, **kwargs.pop('headers', {})}, **kwargs)
+        return async_to_sync(view)(request)
+
+    def test_lists_match_the_sync_views(self):
+        for name, view in [
+            ('crop-list-create', async_views.crop_list),
+            ('resource-list-create', async_views.resource_list),
+            ('activity-list-create', async_views.activity_list),
+            ('notification-list', async_views.notification_list),
+        ]:
+            with self.subTest(endpoint=name):
+                url = reverse(name) + '?page_size=2'
+                expected = self.client.get(url)
+                response = self.call(view, url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(json.loads(response.content), expected.json())
+                self.assertEqual(response['ETag'], expected['ETag'])
+
+    def test_list_pages_and_revalidates(self):
+        url = reverse('crop-list-create')
+        first = self.call(async_views.crop_list, url + '?page_size=2')
+        data = json.loads(first.content)
+        self.assertEqual([crop['name'] for crop in data['results']], ['Maize', 'Beans'])
+        rest = json.loads(self.call(async_views.crop_list, data['next']).content)
+        self.assertEqual([crop['name'] for crop in rest['results']], ['Kale'])
+
+        cached = self.call(async_views.crop_list, url + '?page_size=2')
+        self.assertEqual(cached['X-Cache'], 'HIT')
+        unchanged = self.call(async_views.crop_list, url + '?page_size=2', headers={'If-None-Match': first['ETag']})
+        self.assertEqual(unchanged.status_code, 304)
+
+        invalid = self.call(async_views.notification_list, reverse('notification-list') + '?since=x')
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn('since', json.loads(invalid.content))
+
+    def test_user_info_and_unread_count(self):
+        Notification.objects.create(user=self.user, message='Harvest due')
+        response = self.call(async_views.user_info, reverse('user-info'))
+        self.assertEqual(json.loads(response.content), {'username': 'farmer', 'email': 'farmer@example.com'})
+        with self.assertNumQueries(0):
+            # The token's user comes from the auth cache the first call filled
+            self.call(async_views.user_info, reverse('user-info'))
+        response = self.call(async_views.notification_unread_count, reverse('notification-unread-count'))
+        self.assertEqual(json.loads(response.content), {'unread': 1})
+
+    def test_requires_token(self):
+        request = AsyncRequestFactory().get(reverse('user-info'))
+        self.assertEqual(async_to_sync(async_views.user_info)(request).status_code, 401)
+        request = AsyncRequestFactory().get(reverse('crop-list-create'), headers={'Authorization': 'Token nope'})
+        self.assertEqual(async_to_sync(async_views.crop_list)(request).status_code, 401)
+
+    def test_read_view_sends_writes_to_the_sync_view(self):
+        with override_settings(ASYNC_READ_VIEWS=False):
+            sync_view = CropListCreate.as_view()
+            self.assertIs(async_views.read_view(sync_view, async_views.crop_list), sync_view)
+        with override_settings(ASYNC_READ_VIEWS=True):
+            view = async_views.read_view(sync_view, async_views.crop_list)
+        request = AsyncRequestFactory().post(reverse('crop-list-create'), {
+            'name': 'Sorghum', 'variety': 'Local', 'planting_date': '2025-03-01', 'harvest_date': '2025-07-01',
+        }, content_type='application/json', headers=self.headers)
+        self.assertEqual(async_to_sync(view)(request).status_code, 201)
+        response = self.call(view, reverse('crop-list-create'))
+        self.assertEqual(len(json.loads(response.content)['results']), 4)
+
+
+class AsyncExecutorTests(TransactionTestCase):
+    """The bounded pool and the ASGI benchmark use their own connections, so
+    their data has to be committed."""
+
+    def test_lists_run_on_the_pool(self):
+        user = User.objects.create_user(username='farmer', password='secret')
+        token = Token.objects.create(user=user)
+        Resource.objects.create(user=user, name='Urea', quantity=5, type='Fertilizer', unit='kgs')
+        threads = []
+        page = async_views._page
+
+        def record(*args):
+            threads.append(threading.current_thread().name)
+            return page(*args)
+
+        request = AsyncRequestFactory().get(reverse('resource-list-create'), headers={'Authorization': f'Token {token.key}'})
+        with override_settings(ASYNC_DB_WORKERS=2), mock.patch.object(async_views, '_page', record):
+            response = async_to_sync(async_views.resource_list)(request)
+        self.assertEqual(json.loads(response.content)['results'][0]['name'], 'Urea')
+        self.assertTrue(threads[0].startswith('api-db'))
+
+    def test_benchmark_under_asgi(self):
+        call_command('seed_farm', users=2, crops=1, activities=1, resources=1, notifications=2, stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_api', requests=4, concurrency=2, users=2, interface='asgi', output=path,
+                endpoints='user-info,crop-list,notification-list,notification-unread-count', stdout=StringIO(),
+            )
+            with open(path) as f:
+                report = json.load(f)
+        self.assertEqual(report['interface'], 'asgi')
+        for name, result in report['endpoints'].items():
+            with self.subTest(endpoint=name):
+                self.assertEqual(result['errors'], 0, result['statuses'])
+                self.assertIsNone(result['queries_per_request'])
+
+
+@override_settings(DATABASE_SHARDS=['default', 'shard1'])
+class ShardingTests(TransactionTestCase):
+    """A second SQLite file as shard1, next to the default test database.
+
+    The alias is added after the test runner set its databases up, so it
+    is migrated here.
+    """
+    databases = {'default'}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        connections.settings['shard1'] = {
+            **connections.settings['default'], 'NAME': os.path.join(cls.directory.name, 'shard1.sqlite3'),
+        }
+        cls.databases = {'default', 'shard1'}
+        call_command('migrate', database='shard1', verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['shard1'].close()
+        del connections['shard1']
+        del connections.settings['shard1']
+        cls.databases = {'default'}
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    # SQLite keeps the highest id a table has seen, so a test copying shard1
+    # rows to default would leave default drawing from shard1's range
+    reset_sequences = True
+
+    def setUp(self):
+        cache.clear()
+        sharding.reserve_ids('shard1')
+        # Round-robin by id: one user on each shard
+        self.users = [User.objects.create_user(username=f'farmer{i}', password='secret') for i in range(2)]
+        self.homes = {user.pk: sharding.lookup(user.pk)[0] for user in self.users}
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.get_or_create(user=user)[0].key}')
+        return client
+
+    def create_crop(self, user, name='Maize'):
+        return self.client_for(user).post(reverse('crop-list-create'), {
+            'name': name, 'variety': 'H614', 'planting_date': '2025-03-01', 'harvest_date': '2025-07-01',
+        }, format='json')
+
+    def other(self, alias):
+        return 'default' if alias == 'shard1' else 'shard1'
+
+    def test_requests_use_the_owning_shard(self):
+        self.assertEqual(set(self.homes.values()), {'default', 'shard1'})
+        for user in self.users:
+            home = self.homes[user.pk]
+            response = self.create_crop(user)
+            self.assertEqual(response.status_code, 201)
+            self.assertTrue(Crop.objects.using(home).filter(pk=response.data['id'], user_id=user.pk).exists())
+            self.assertFalse(Crop.objects.using(self.other(home)).filter(user_id=user.pk).exists())
+            self.assertEqual(NotificationCounter.objects.using(home).filter(user_id=user.pk).count(), 1)
+            if home == 'shard1':
+                self.assertGreaterEqual(response.data['id'], 10 ** 12)
+            listed = self.client_for(user).get(reverse('crop-list-create'))
+            self.assertEqual([crop['name'] for crop in listed.data['results']], ['Maize'])
+
+    def test_metrics_count_queries_on_every_database(self):
+        def view(request):
+            Crop.objects.using('default').count()
+            Crop.objects.using('shard1').count()
+            return HttpResponse()
+
+        counts = []
+
+        def record(middleware, request, response, elapsed, recorder):
+            counts.append(recorder.count)
+
+        with mock.patch.object(metrics.MetricsMiddleware, 'record', record):
+            metrics.MetricsMiddleware(view)(APIRequestFactory().get('/'))
+        self.assertEqual(counts, [2])
+
+    def test_stats_and_commands_fan_out(self):
+        for user in self.users:
+            self.create_crop(user)
+        admin = User.objects.create_user(username='admin', password='secret', is_staff=True)
+        response = self.client_for(admin).get(reverse('shard-stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({alias: row['crops'] for alias, row in response.data['shards'].items()}, {'default': 1, 'shard1': 1})
+        self.assertEqual(response.data['shards']['shard1']['users'] + response.data['shards']['default']['users'], 3)
+
+        out = StringIO()
+        call_command('scan_due_dates', today=date(2025, 6, 30), days=7, stdout=out)
+        self.assertIn('Scanned 2 crops', out.getvalue())
+        for user in self.users:
+            self.assertEqual(Notification.objects.using(self.homes[user.pk]).filter(user_id=user.pk).count(), 1)
+
+    def test_rebalance_moves_a_user_with_their_ids(self):
+        user = next(user for user in self.users if self.homes[user.pk] == 'default')
+        source = self.homes[user.pk]
+        crop_id = self.create_crop(user).data['id']
+        out = StringIO()
+        call_command('rebalance_shards', user=[user.username], to=self.other(source), grace=0, stdout=out)
+        self.assertIn('Moved 1 of 1 users', out.getvalue())
+
+        self.assertEqual(sharding.lookup(user.pk), (self.other(source), False))
+        self.assertFalse(Crop.objects.using(source).filter(user_id=user.pk).exists())
+        self.assertTrue(Crop.objects.using(self.other(source)).filter(pk=crop_id).exists())
+        listed = self.client_for(user).get(reverse('crop-list-create'))
+        self.assertEqual([crop['id'] for crop in listed.data['results']], [crop_id])
+        self.assertEqual(self.create_crop(user, 'Beans').status_code, 201)
+
+    def test_rebalance_waits_out_the_grace_period_once_per_batch(self):
+        for user in self.users:
+            self.create_crop(user)
+        out = StringIO()
+        with mock.patch.object(sharding.time, 'sleep') as sleep:
+            call_command(
+                'rebalance_shards', user=[user.username for user in self.users], to='shard1',
+                grace=5, users_per_move=10, stdout=out,
+            )
+        moving = [user.pk for user in self.users if self.homes[user.pk] == 'default']
+        self.assertIn(f'Moved {len(moving)} of {len(moving)} users', out.getvalue())
+        self.assertEqual(sleep.call_args_list, [mock.call(5), mock.call(5)])
+        for user_id in moving:
+            self.assertEqual(sharding.lookup(user_id), ('shard1', False))
+            self.assertFalse(Crop.objects.using('default').filter(user_id=user_id).exists())
+
+    def test_a_conflicting_user_stays_put_while_the_rest_of_the_batch_moves(self):
+        self.users += [User.objects.create_user(username=f'farmer{i}', password='secret') for i in range(2, 4)]
+        first, second = [user for user in self.users if sharding.lookup(user.pk)[0] == 'default'][:2]
+        for user in (first, second):
+            self.create_crop(user)
+            self.client_for(user).get(reverse('crop-list-create'))
+        copy_rows = sharding._copy_rows
+
+        def copy_and_write(user_id, source, target, batch_size):
+            copied = copy_rows(user_id, source, target, batch_size)
+            if user_id == first.pk:
+                CollectionVersion.objects.using(source).filter(user_id=user_id).update(version=models.F('version') + 1)
+            return copied
+
+        with mock.patch.object(sharding, '_copy_rows', copy_and_write):
+            results = sharding.move_users([(first.pk, 'shard1'), (second.pk, 'shard1')], grace=0)
+        self.assertIsInstance(results[first.pk], sharding.ShardMoveConflict)
+        self.assertGreater(results[second.pk], 0)
+        self.assertEqual(sharding.lookup(first.pk), ('default', False))
+        self.assertFalse(Crop.objects.using('shard1').filter(user_id=first.pk).exists())
+        self.assertEqual(sharding.lookup(second.pk), ('shard1', False))
+
+    async def test_notification_cursors_survive_a_move_to_a_lower_shard(self):
+        user = next(user for user in self.users if self.homes[user.pk] == 'shard1')
+        with sharding.use_shard('shard1'):
+            old = [await Notification.objects.acreate(user=user, message=f'Old {i}') for i in range(2)]
+        await sync_to_async(sharding.move_user)(user.pk, 'default', grace=0)
+        with sharding.use_shard('default'):
+            # Below the ids seen on shard1, as the default shard's sequence is
+            new = await Notification.objects.acreate(user=user, message='New', id=old[0].pk - 10 ** 12)
+        self.assertLess(new.pk, old[0].pk)
+
+        headers = {'Authorization': f'Token {(await Token.objects.acreate(user=user)).key}'}
+        client = AsyncClient()
+        response = await client.get(reverse('notification-poll'), {'since': old[1].seq, 'timeout': 0}, headers=headers)
+        self.assertEqual([n['message'] for n in json.loads(response.content)['results']], ['New'])
+
+        response = await client.get(
+            reverse('notification-stream'), headers={**headers, 'Last-Event-ID': str(old[1].seq)},
+        )
+        chunks = response.streaming_content
+        await anext(chunks)
+        self.assertIn('"message": "New"', (await anext(chunks)).decode())
+        await chunks.aclose()
+
+        response = await client.post(
+            reverse('notification-bulk-mark-read'), {'before': old[1].seq}, content_type='application/json', headers=headers,
+        )
+        self.assertEqual(json.loads(response.content), {'updated': 2, 'unread': 1})
+
+    def test_writes_are_refused_while_a_user_moves(self):
+        user = self.users[0]
+        self.create_crop(user)
+        UserShard.objects.filter(user=user).update(moving=True)
+        cache.clear()
+        self.assertEqual(self.create_crop(user, 'Beans').status_code, 503)
+        self.assertEqual(self.client_for(user).get(reverse('crop-list-create')).status_code, 200)
+
+    def test_deleting_a_user_clears_their_shard(self):
+        user = next(user for user in self.users if self.homes[user.pk] == 'shard1')
+        self.create_crop(user)
+        user.delete()
+        self.assertFalse(Crop.objects.using('shard1').filter(user_id=user.pk).exists())
+        self.assertFalse(User.objects.using('shard1').filter(pk=user.pk).exists())
+
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class SyncTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='farmer', password='secret')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.user).key}')
+        self.crop = Crop.objects.create(
+            user=self.user, name='Maize', variety='H614',
+            planting_date=date.today() + timedelta(days=1), harvest_date=date.today() + timedelta(days=90),
+        )
+        self.resource = Resource.objects.create(user=self.user, name='Urea', quantity=10, type='Fertilizer')
+        self.activity = Activity.objects.create(user=self.user, crop=self.crop, description='Sowing', date=date.today())
+        self.notification = Notification.objects.create(user=self.user, crop=self.crop, message='Sown')
+
+    def sync(self, since=None, page_size=None):
+        """Follow ``next`` to the end; returns ``(entries, sync_token, pages)``."""
+        params = {key: value for key, value in [('since', since), ('page_size', page_size)] if value}
+        response = self.client.get(reverse('sync'), params)
+        entries, pages = [], 0
+        while True:
+            self.assertEqual(response.status_code, 200, response.data)
+            entries.extend(response.data['results'])
+            pages += 1
+            if not response.data['next']:
+                return entries, response.data['sync_token'], pages
+            self.assertIsNone(response.data['sync_token'])
+            response = self.client.get(response.data['next'])
+
+    def keys(self, entries):
+        return [(entry['collection'], entry['id'], entry['deleted']) for entry in entries]
+
+    def test_full_sync_then_only_changes_and_deletes(self):
+        entries, token, _ = self.sync()
+        self.assertEqual(self.keys(entries), [
+            ('crops', self.crop.pk, False), ('resources', self.resource.pk, False),
+            ('activities', self.activity.pk, False), ('notifications', self.notification.pk, False),
+        ])
+        self.assertEqual(entries[1]['data']['name'], 'Urea')
+
+        entries, token, _ = self.sync(token)
+        self.assertEqual(entries, [])
+
+        self.client.patch(reverse('crop-detail', args=[self.crop.pk]), {'name': 'Sorghum'}, format='json')
+        self.client.post(reverse('notification-mark-read', args=[self.notification.pk]))
+        self.client.delete(reverse('resource-detail', args=[self.resource.pk]))
+        entries, token, _ = self.sync(token)
+        self.assertEqual(self.keys(entries), [
+            ('crops', self.crop.pk, False), ('notifications', self.notification.pk, False),
+            ('resources', self.resource.pk, True),
+        ])
+        self.assertEqual(entries[0]['data']['name'], 'Sorghum')
+        self.assertTrue(entries[1]['data']['is_read'])
+
+    def test_bulk_and_set_based_writes_are_picked_up(self):
+        _, token, _ = self.sync()
+        self.client.patch(reverse('resource-bulk'), [{'id': self.resource.pk, 'quantity': 4}], format='json')
+        self.client.patch(reverse('activity-bulk'), [{'id': self.activity.pk, 'description': 'Weeding'}], format='json')
+        self.client.delete(reverse('crop-bulk'), {'ids': [self.crop.pk]}, format='json')
+        entries, _, _ = self.sync(token)
+        # Deleting the crop cascaded to its activity and notification
+        self.assertEqual(sorted(self.keys(entries)), sorted([
+            ('resources', self.resource.pk, False),
+            ('crops', self.crop.pk, True),
+            ('activities', self.activity.pk, True),
+            ('notifications', self.notification.pk, True),
+        ]))
+        self.assertEqual(entries[0]['data']['quantity'], 4)
+
+    def test_pages_walk_every_collection_once(self):
+        for number in range(4):
+            Resource.objects.create(user=self.user, name=f'Seed {number}', quantity=1, type='Seed')
+        entries, token, pages = self.sync(page_size=3)
+        self.assertEqual(len(entries), 8)
+        self.assertEqual(len(set(self.keys(entries))), 8)
+        self.assertEqual(pages, 3)
+        self.assertIsNotNone(token)
+
+        other = User.objects.create_user(username='neighbour', password='secret')
+        Crop.objects.create(
+            user=other, name='Beans', variety='Rosecoco',
+            planting_date=date.today() + timedelta(days=1), harvest_date=date.today() + timedelta(days=60),
+        )
+        self.assertEqual(self.sync(token)[0], [])
+
+    def test_bad_and_expired_tokens(self):
+        self.assertEqual(self.client.get(reverse('sync'), {'since': 'nonsense'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('sync'), {'cursor': 'nonsense'}).status_code, 400)
+        expired = sync.sync_token(timezone.now() - timedelta(days=31))
+        response = self.client.get(reverse('sync'), {'since': expired})
+        self.assertEqual(response.status_code, 410)
+        self.assertIn('error', response.data)
+
+    def test_old_tombstones_are_purged_and_user_deletes_leave_none(self):
+        self.resource.delete()
+        SyncTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=40))
+        self.crop.delete()
+        out = StringIO()
+        call_command('purge_notifications', stdout=out)
+        self.assertIn('1 sync tombstones', out.getvalue())
+        self.assertEqual(
+            sorted(SyncTombstone.objects.values_list('collection', flat=True)), ['activities', 'crops', 'notifications'],
+        )
+        self.user.delete()
+        self.assertFalse(SyncTombstone.objects.exists())
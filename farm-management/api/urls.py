@@ -1,28 +1,65 @@
 from django.urls import path
 from .views import (
     UserInfoView,
+    DashboardView,
     RegisterView,
     LoginView,
     CropListCreate,
     CropDetail,
+    CropBulk,
     ResourceListCreate,
     ResourceDetail,
+    ResourceBulk,
+    ResourceMovementList,
+    ResourceBalances,
     ActivityListCreate,
     ActivityDetail,
+    ActivityBulk,
     NotificationList,
     NotificationMarkRead,
+    NotificationBulkMarkRead,
+    NotificationUnreadCount,
+    CacheStatsView,
+    MetricsView,
+    ShardStatsView,
+    AnalyticsView,
+    SearchView,
+    ImportView,
+    ExportView,
+    SyncView,
 )
+from . import async_views
+from .async_views import read_view
+from .streaming import notification_stream, notification_poll
 
 urlpatterns = [
-    path('user/', UserInfoView.as_view(), name='user-info'),
+    path('user/', read_view(UserInfoView.as_view(), async_views.user_info), name='user-info'),
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
-    path('crops/', CropListCreate.as_view(), name='crop-list-create'),
+    path('crops/', read_view(CropListCreate.as_view(), async_views.crop_list), name='crop-list-create'),
     path('crops/<int:pk>/', CropDetail.as_view(), name='crop-detail'),
-    path('resources/', ResourceListCreate.as_view(), name='resource-list-create'),
+    path('crops/bulk/', CropBulk.as_view(), name='crop-bulk'),
+    path('resources/', read_view(ResourceListCreate.as_view(), async_views.resource_list), name='resource-list-create'),
     path('resources/<int:pk>/', ResourceDetail.as_view(), name='resource-detail'),
-    path('activities/', ActivityListCreate.as_view(), name='activity-list-create'),
+    path('resources/bulk/', ResourceBulk.as_view(), name='resource-bulk'),
+    path('resources/movements/', ResourceMovementList.as_view(), name='resource-movements'),
+    path('resources/balances/', ResourceBalances.as_view(), name='resource-balances'),
+    path('activities/', read_view(ActivityListCreate.as_view(), async_views.activity_list), name='activity-list-create'),
     path('activities/<int:pk>/', ActivityDetail.as_view(), name='activity-detail'),
-    path('notifications/', NotificationList.as_view(), name='notification-list'),
+    path('activities/bulk/', ActivityBulk.as_view(), name='activity-bulk'),
+    path('notifications/', read_view(NotificationList.as_view(), async_views.notification_list), name='notification-list'),
+    path('notifications/stream/', notification_stream, name='notification-stream'),
+    path('notifications/poll/', notification_poll, name='notification-poll'),
     path('notifications/<int:pk>/read/', NotificationMarkRead.as_view(), name='notification-mark-read'),
+    path('notifications/read/', NotificationBulkMarkRead.as_view(), name='notification-bulk-mark-read'),
+    path('notifications/unread-count/', read_view(NotificationUnreadCount.as_view(), async_views.notification_unread_count), name='notification-unread-count'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+    path('shards/', ShardStatsView.as_view(), name='shard-stats'),
+    path('analytics/<str:kind>/', AnalyticsView.as_view(), name='analytics'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('import/<str:kind>/', ImportView.as_view(), name='import'),
+    path('export/<str:kind>/', ExportView.as_view(), name='export'),
+    path('sync/', SyncView.as_view(), name='sync'),
 ]
\ No newline at end of file
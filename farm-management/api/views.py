@@ -1,12 +1,77 @@
+import codecs
+import logging
+from datetime import date
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth import authenticate
+from django.utils import timezone
 from django.contrib.auth.models import User
 from rest_framework.authtoken.models import Token
-from .models import Crop, Resource, Activity, Notification
-from .serializers import CropSerializer, ResourceSerializer, ActivitySerializer, NotificationSerializer
+from .models import (
+    Crop, Resource, ResourceMovement, Activity, Notification, NotificationCounter, CollectionVersion, SyncTombstone,
+)
+from .serializers import (
+    CropSerializer,
+    ResourceSerializer,
+    ResourceMovementSerializer,
+    ResourceBalanceSerializer,
+    ActivitySerializer,
+    NotificationSerializer,
+)
+from .analytics import InvalidAnalytics, series as analytics_series
+from .bulk import BulkCreateMixin, BulkUpdateDestroyView, too_many_items
+from . import response_cache, sharding, sync
+from .conditional import ConditionalGetMixin
+from .dashboard import get_dashboard, invalidate_dashboard
+from .exporter import FORMATS as EXPORT_FORMATS, InvalidExport, export_rows, render
+from .importer import InvalidImport, detect_format, run_import
+from .lifecycle import CurrentStatusMixin, ensure_current as ensure_crop_status
+from .ledger import InsufficientStock, balances_as_of, record_movements, set_quantities
+from .metrics import registry as metrics_registry
+from .pagination import (
+    BoundedCursorPagination,
+    CropCursorPagination,
+    ResourceCursorPagination,
+    ResourceMovementCursorPagination,
+    ActivityCursorPagination,
+    NotificationCursorPagination,
+)
+from .routing import ReplicaReadMixin
+from .search import TARGETS as SEARCH_TARGETS, InvalidSearch, search
+
+logger = logging.getLogger(__name__)
+
+def mark_read(user, queryset):
+    """Flip unread rows in ``queryset`` to read and keep the counter in step.
+
+    Must run inside a transaction so the UPDATE and the counter change
+    commit together. Returns the number of notifications changed.
+    """
+    changed = queryset.filter(is_read=False).update(is_read=True, updated_at=timezone.now())
+    if changed:
+        NotificationCounter.adjust(user.pk, -changed)
+        CollectionVersion.bump(user.pk, Notification)
+        invalidate_dashboard(user.pk)
+    return changed
+
+class AtomicWriteMixin:
+    """Run create/update in one transaction so the row and the notification
+    outbox entry its post_save receiver appends commit together."""
+
+    def create(self, request, *args, **kwargs):
+        with sharding.atomic():
+            return super().create(request, *args, **kwargs)
+
+    def update(self, request, *args, **kwargs):
+        with sharding.atomic():
+            return super().update(request, *args, **kwargs)
 
 class UserInfoView(APIView):
     permission_classes = [IsAuthenticated]
@@ -18,12 +83,24 @@ class UserInfoView(APIView):
             'email': user.email,
         })
 
+class DashboardView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({'error': 'days must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        days = max(0, min(days, 365))
+        ensure_crop_status(request.user.pk)
+        return Response(get_dashboard(request.user, days))
+
 class RegisterView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        print("Register request data:", request.data)
         username = request.data.get('username')
+        logger.debug('register attempt', extra={'username': username})
         password = request.data.get('password')
         confirm_password = request.data.get('confirm_password')
 
@@ -47,19 +124,22 @@ class LoginView(APIView):
     permission_classes = [AllowAny]
 
     def post(self, request):
-        print("Login request data:", request.data)
         username = request.data.get('username')
         password = request.data.get('password')
-        print("Attempting to authenticate:", username)
+        logger.debug('login attempt', extra={'username': username})
         user = authenticate(username=username, password=password)
         if user:
             token, created = Token.objects.get_or_create(user=user)
             return Response({'token': token.key}, status=status.HTTP_200_OK)
         return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
-class CropListCreate(generics.ListCreateAPIView):
+class CropListCreate(CurrentStatusMixin, ReplicaReadMixin, ConditionalGetMixin, BulkCreateMixin, AtomicWriteMixin, generics.ListCreateAPIView):
     serializer_class = CropSerializer
+    version_collection = 'crops'
+    alert_kind = 'harvest'
+    alert_date_field = 'harvest_date'
     permission_classes = [IsAuthenticated]
+    pagination_class = CropCursorPagination
 
     def get_queryset(self):
         return Crop.objects.filter(user=self.request.user)
@@ -67,16 +147,26 @@ class CropListCreate(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class CropDetail(generics.RetrieveUpdateDestroyAPIView):
+class CropDetail(CurrentStatusMixin, ReplicaReadMixin, ConditionalGetMixin, AtomicWriteMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CropSerializer
+    version_collection = 'crops'
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         return Crop.objects.filter(user=self.request.user)
 
-class ResourceListCreate(generics.ListCreateAPIView):
+class CropBulk(BulkUpdateDestroyView):
+    model = Crop
+    serializer_class = CropSerializer
+    permission_classes = [IsAuthenticated]
+    alert_kind = 'harvest'
+    alert_date_field = 'harvest_date'
+
+class ResourceListCreate(ReplicaReadMixin, ConditionalGetMixin, BulkCreateMixin, generics.ListCreateAPIView):
     serializer_class = ResourceSerializer
+    version_collection = 'resources'
     permission_classes = [IsAuthenticated]
+    pagination_class = ResourceCursorPagination
 
     def get_queryset(self):
         return Resource.objects.filter(user=self.request.user)
@@ -84,45 +174,387 @@ class ResourceListCreate(generics.ListCreateAPIView):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ResourceDetail(generics.RetrieveUpdateDestroyAPIView):
+def apply_stock_takes(user, instances, quantities):
+    """Write edited quantities through the ledger and refresh ``instances``."""
+    balances = set_quantities(user, quantities)
+    for instance in instances:
+        if instance.pk in balances:
+            instance.quantity, instance.usage_status = balances[instance.pk]
+
+class ResourceDetail(ReplicaReadMixin, ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ResourceSerializer
+    version_collection = 'resources'
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         return Resource.objects.filter(user=self.request.user)
 
-class ActivityListCreate(generics.ListCreateAPIView):
+    def perform_update(self, serializer):
+        # quantity and usage_status belong to the ledger: only the other
+        # fields are written, so movements committed since the row was read
+        # are kept, and a changed quantity is recorded as a stock take
+        instance = serializer.instance
+        changes = dict(serializer.validated_data)
+        quantity = changes.pop('quantity', None)
+        with sharding.atomic():
+            if changes:
+                for attr, value in changes.items():
+                    setattr(instance, attr, value)
+                instance.save(update_fields=[*changes, 'updated_at'])
+            if quantity is not None:
+                set_quantities(self.request.user, {instance.pk: quantity})
+            instance.refresh_from_db(fields=['quantity', 'usage_status'])
+
+class ResourceBulk(BulkUpdateDestroyView):
+    model = Resource
+    serializer_class = ResourceSerializer
+    permission_classes = [IsAuthenticated]
+
+    def save_updates(self, instances, changes):
+        quantities = {
+            instance.pk: change['quantity'] for instance, change in zip(instances, changes) if 'quantity' in change
+        }
+        super().save_updates(
+            instances, [{field: value for field, value in change.items() if field != 'quantity'} for change in changes],
+        )
+        if quantities:
+            apply_stock_takes(self.request.user, instances, quantities)
+
+class ResourceMovementList(generics.ListCreateAPIView):
+    """The user's stock ledger; POST one movement or a list of them.
+
+    Filters: ``?resource=<id>`` and ``start``/``end`` dates. A batch that
+    would take any balance below zero is rejected with 409 and nothing is
+    recorded.
+    """
+    serializer_class = ResourceMovementSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ResourceMovementCursorPagination
+
+    def get_queryset(self):
+        queryset = ResourceMovement.objects.filter(user=self.request.user)
+        params = self.request.query_params
+        try:
+            if params.get('resource'):
+                queryset = queryset.filter(resource_id=int(params['resource']))
+            if params.get('start'):
+                queryset = queryset.filter(occurred_on__gte=date.fromisoformat(params['start']))
+            if params.get('end'):
+                queryset = queryset.filter(occurred_on__lte=date.fromisoformat(params['end']))
+        except ValueError:
+            raise ValidationError({'error': 'resource must be an id and start/end dates YYYY-MM-DD'})
+        return queryset
+
+    def create(self, request, *args, **kwargs):
+        many = isinstance(request.data, list)
+        too_many = too_many_items(request.data) if many else None
+        if too_many:
+            return too_many
+        serializer = self.get_serializer(data=request.data, many=many)
+        serializer.is_valid(raise_exception=True)
+        movements = serializer.validated_data if many else [serializer.validated_data]
+        try:
+            entries, balances = record_movements(request.user, movements)
+        except InsufficientStock as e:
+            return Response({'error': str(e), 'resource': e.resource_id}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'movements': self.get_serializer(entries, many=True).data,
+            'balances': [
+                {'id': pk, 'quantity': quantity, 'usage_status': usage_status}
+                for pk, (quantity, usage_status) in sorted(balances.items())
+            ],
+        }, status=status.HTTP_201_CREATED)
+
+class ResourceBalances(generics.ListAPIView):
+    """Each resource's balance at the end of ``?as_of=`` (default today)."""
+    serializer_class = ResourceBalanceSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ResourceCursorPagination
+
+    def get_queryset(self):
+        as_of = self.request.query_params.get('as_of')
+        try:
+            day = date.fromisoformat(as_of) if as_of else timezone.localdate()
+        except ValueError:
+            raise ValidationError({'as_of': 'Date has wrong format. Use YYYY-MM-DD.'})
+        return balances_as_of(Resource.objects.filter(user=self.request.user), day)
+
+class ActivityListCreate(ReplicaReadMixin, ConditionalGetMixin, BulkCreateMixin, AtomicWriteMixin, generics.ListCreateAPIView):
     serializer_class = ActivitySerializer
+    version_collection = 'activities'
+    alert_kind = 'activity'
+    alert_date_field = 'date'
     permission_classes = [IsAuthenticated]
+    pagination_class = ActivityCursorPagination
 
     def get_queryset(self):
-        return Activity.objects.filter(user=self.request.user)
+        return Activity.objects.filter(user=self.request.user).select_related('crop')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class ActivityDetail(generics.RetrieveUpdateDestroyAPIView):
+class ActivityDetail(ReplicaReadMixin, ConditionalGetMixin, AtomicWriteMixin, generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = ActivitySerializer
+    version_collection = 'activities'
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Activity.objects.filter(user=self.request.user).select_related('crop')
+
+class ActivityBulk(BulkUpdateDestroyView):
+    model = Activity
     serializer_class = ActivitySerializer
     permission_classes = [IsAuthenticated]
+    alert_kind = 'activity'
+    alert_date_field = 'date'
 
     def get_queryset(self):
-        return Activity.objects.filter(user=self.request.user)
+        return super().get_queryset().select_related('crop')
 
-class NotificationList(generics.ListAPIView):
+class NotificationList(ReplicaReadMixin, ConditionalGetMixin, generics.ListAPIView):
     serializer_class = NotificationSerializer
+    version_collection = 'notifications'
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
-        return Notification.objects.filter(user=self.request.user).order_by('-created_at')
+        queryset = Notification.objects.filter(user=self.request.user).select_related('crop').order_by('-created_at')
+        # Delta mode for clients that can't hold a stream open: only rows
+        # after the highest notification seq they have seen.
+        since = self.request.query_params.get('since')
+        if since:
+            try:
+                queryset = queryset.filter(seq__gt=int(since))
+            except ValueError:
+                raise ValidationError({'since': 'Must be a notification seq.'})
+        return queryset
 
 class NotificationMarkRead(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request, pk):
+        notification = Notification.objects.filter(pk=pk, user=self.request.user)
+        with sharding.atomic():
+            changed = mark_read(request.user, notification)
+            if not changed and not notification.exists():
+                return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'Notification marked as read'}, status=status.HTTP_200_OK)
+
+class NotificationBulkMarkRead(APIView):
+    """Mark many notifications read with one UPDATE.
+
+    The body selects the rows with exactly one of ``{"ids": [...]}``,
+    ``{"before": <seq>}`` (every notification up to and including that
+    ``seq``, which stays in order when ids don't, e.g. across shard moves)
+    or ``{"crop": <crop id>}``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        selectors = [key for key in ('ids', 'before', 'crop') if key in request.data]
+        if len(selectors) != 1:
+            return Response({'error': 'Provide exactly one of ids, before or crop'}, status=status.HTTP_400_BAD_REQUEST)
+        value = request.data[selectors[0]]
+        if selectors[0] == 'ids':
+            valid = isinstance(value, list) and all(isinstance(pk, int) for pk in value)
+            lookup = {'id__in': value}
+        else:
+            valid = isinstance(value, int)
+            lookup = {'seq__lte': value} if selectors[0] == 'before' else {'crop_id': value}
+        if not valid:
+            return Response({'error': f'Invalid {selectors[0]}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with sharding.atomic():
+            updated = mark_read(request.user, Notification.objects.filter(user=request.user, **lookup))
+        return Response({'updated': updated, 'unread': NotificationCounter.unread_for(request.user.pk)})
+
+class NotificationUnreadCount(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response({'unread': NotificationCounter.unread_for(request.user.pk)})
+
+class CacheStatsView(APIView):
+    """Response cache hit/miss counters for the worker serving the request."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(response_cache.stats.snapshot())
+
+class MetricsView(APIView):
+    """Request metrics for this worker in the Prometheus text format."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class ShardStatsView(APIView):
+    """Users and rows on each database shard, counted on all of them in parallel."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({'shards': sharding.stats()})
+
+class AnalyticsView(APIView):
+    """Time series read from the pre-aggregated rollup table.
+
+    ``activities`` counts activities per crop, ``crops`` counts crops by
+    planting or harvest month and ``resources`` sums consumption and
+    restocks per resource. All take ``period`` and ``start``/``end``
+    (YYYY-MM-DD).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, kind):
+        try:
+            results = analytics_series(request.user, kind, request.query_params)
+        except InvalidAnalytics as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'results': results})
+
+class SearchView(APIView):
+    """Ranked full-text search over crops, activities and notifications.
+
+    ``?q=`` is required. ``type`` limits the kinds searched (comma
+    separated), ``start``/``end`` (YYYY-MM-DD) filter on the planting,
+    activity or creation date, ``status`` on the crop status and ``crop``
+    on the crop id. Paginated with ``page`` and ``page_size``.
+    """
+    permission_classes = [IsAuthenticated]
+    serializers = {
+        'crops': CropSerializer,
+        'activities': ActivitySerializer,
+        'notifications': NotificationSerializer,
+    }
+
+    def get(self, request):
+        params = request.query_params
+        kinds = [kind for kind in params.get('type', ','.join(SEARCH_TARGETS)).split(',') if kind]
+        if not kinds or not set(kinds) <= set(SEARCH_TARGETS):
+            return Response(
+                {'error': f"type must be a comma separated list of {', '.join(SEARCH_TARGETS)}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if params.get('status') and params['status'] not in dict(Crop.STATUS_CHOICES):
+            return Response({'error': 'Invalid status.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            filters = {
+                'start': date.fromisoformat(params['start']) if params.get('start') else None,
+                'end': date.fromisoformat(params['end']) if params.get('end') else None,
+                'crop': int(params['crop']) if params.get('crop') else None,
+                'status': params.get('status'),
+            }
+            page = int(params.get('page', 1))
+            page_size = min(int(params.get('page_size', api_settings.PAGE_SIZE)), BoundedCursorPagination.max_page_size)
+        except ValueError:
+            return Response(
+                {'error': 'start/end must be dates YYYY-MM-DD; crop, page and page_size must be numbers'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if page < 1 or page_size < 1:
+            return Response({'error': 'page and page_size must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            hits = search(request.user, params.get('q'), kinds, filters, (page - 1) * page_size, page_size)
+        except InvalidSearch as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        url = request.build_absolute_uri()
+        context = {'request': request, 'view': self}
+        return Response({
+            'next': replace_query_param(url, 'page', page + 1) if len(hits) > page_size else None,
+            'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+            'results': [
+                {'type': kind, 'rank': rank, 'object': self.serializers[kind](obj, context=context).data}
+                for kind, rank, obj in hits[:page_size]
+            ],
+        })
+
+class ImportView(APIView):
+    """Upload a CSV or NDJSON file of resources or activities as ``file``."""
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, kind):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A file upload is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            fmt = detect_format(upload.name, request.data.get('format'))
+            imported, failed, errors = run_import(
+                request.user, kind, codecs.iterdecode(upload, 'utf-8-sig'), fmt,
+            )
+        except InvalidImport as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except UnicodeDecodeError:
+            return Response({'error': 'File must be UTF-8 encoded'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'imported': imported, 'failed': failed, 'errors': errors}, status=status.HTTP_200_OK)
+
+class ExportView(APIView):
+    """Stream a collection as ``?output=csv`` (default) or ``?output=ndjson``.
+
+    Supports ``start``/``end`` (YYYY-MM-DD) and ``status`` filters.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, kind):
+        fmt = request.query_params.get('output', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return Response({'error': f"output must be one of {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            notification = Notification.objects.get(pk=pk, user=self.request.user)
-            notification.is_read = True
-            notification.save()
-            return Response({'status': 'Notification marked as read'}, status=status.HTTP_200_OK)
-        except Notification.DoesNotExist:
-            return Response({'error': 'Notification not found'}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            header, rows = export_rows(request.user, kind, request.query_params)
+        except InvalidExport as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        response = StreamingHttpResponse(render(header, rows, fmt), content_type=EXPORT_FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+        return response
+
+class SyncView(CurrentStatusMixin, APIView):
+    """Everything changed or deleted since ``?since=<sync token>``, across collections.
+
+    Without ``since`` every row is returned. Results are
+    ``{collection, id, deleted, data}`` entries paginated with ``next``;
+    the last page carries the ``sync_token`` to send next time. A token
+    older than ``SYNC_TOMBSTONE_DAYS`` gets 410 and the client must start
+    over. Activities and notifications embed their crop as it was when
+    they last changed; the crops collection has the current version.
+    """
+    permission_classes = [IsAuthenticated]
+    serializers = {
+        'crops': CropSerializer,
+        'resources': ResourceSerializer,
+        'activities': ActivitySerializer,
+        'notifications': NotificationSerializer,
+    }
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            page_size = min(int(params.get('page_size', api_settings.PAGE_SIZE)), BoundedCursorPagination.max_page_size)
+        except ValueError:
+            return Response({'error': 'page_size must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        if page_size < 1:
+            return Response({'error': 'page_size must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            position = sync.decode(params['cursor']) if params.get('cursor') else sync.start(params.get('since'))
+        except sync.SyncTokenExpired as e:
+            return Response({'error': str(e)}, status=status.HTTP_410_GONE)
+        except sync.InvalidSyncToken as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        found, following = sync.changes(request.user, position, page_size)
+        context = {'request': request, 'view': self}
+        results = []
+        for source, obj in found:
+            if source.model is SyncTombstone:
+                results.append({'collection': obj.collection, 'id': obj.object_id, 'deleted': True, 'data': None})
+            else:
+                results.append({
+                    'collection': source.collection, 'id': obj.pk, 'deleted': False,
+                    'data': self.serializers[source.collection](obj, context=context).data,
+                })
+        url = request.build_absolute_uri()
+        return Response({
+            'results': results,
+            'next': replace_query_param(url, 'cursor', sync.encode(following)) if following else None,
+            'sync_token': None if following else sync.sync_token(position.until),
+        })
@@ -27,6 +27,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.routing.DatabaseRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -57,15 +59,120 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'farm_management.wsgi.application'
 
+# Connection reuse: seconds a connection is kept open between requests (0
+# closes it after every request), checked for liveness before reuse.
+# DB_POOL=True uses Django's connection pool instead, which needs psycopg 3
+# (psycopg[pool]) installed in place of psycopg2; persistent connections are
+# turned off with it, since the pool already keeps connections open.
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+DB_POOL = os.getenv('DB_POOL', 'False') == 'True'
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', '2'))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '10'))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
         'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+if DB_POOL:
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {'min_size': DB_POOL_MIN_SIZE, 'max_size': DB_POOL_MAX_SIZE, 'timeout': DB_POOL_TIMEOUT},
     }
+
+# Read replicas for the list/detail GET views (see api.routing), as
+# comma-separated host[:port][/name] entries using the primary's
+# credentials; with DB_ENGINE=django.db.backends.sqlite3 each entry is a
+# database file. After a write a user reads from the primary for
+# REPLICA_PIN_SECONDS.
+DB_REPLICAS = [entry.strip() for entry in os.getenv('DB_REPLICAS', '').split(',') if entry.strip()]
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '10'))
+
+
+def _database(entry, **extra):
+    config = {**DATABASES['default'], **extra}
+    if config['ENGINE'] == 'django.db.backends.sqlite3':
+        config['NAME'] = entry
+        return config
+    address, _, name = entry.partition('/')
+    host, _, port = address.partition(':')
+    config.update(HOST=host, PORT=port or config['PORT'], NAME=name or config['NAME'])
+    return config
+
+
+DATABASE_REPLICAS = []
+for _number, _entry in enumerate(DB_REPLICAS, 1):
+    DATABASES[f'replica{_number}'] = _database(_entry, TEST={'MIRROR': 'default'})
+    DATABASE_REPLICAS.append(f'replica{_number}')
+
+# User shards (see api.sharding), as extra entries in the DB_REPLICAS
+# format. Users, tokens and the user-to-shard map live on the default
+# database, which is also the first shard; new users are spread over all
+# of them and `manage.py rebalance_shards` moves users between them.
+# Each shard needs `manage.py migrate --database shardN`.
+DB_SHARDS = [entry.strip() for entry in os.getenv('DB_SHARDS', '').split(',') if entry.strip()]
+SHARD_ID_SPAN = int(os.getenv('SHARD_ID_SPAN', str(10 ** 12)))
+SHARD_MAP_CACHE_SECONDS = int(os.getenv('SHARD_MAP_CACHE_SECONDS', '30'))
+
+DATABASE_SHARDS = ['default']
+for _number, _entry in enumerate(DB_SHARDS, 1):
+    DATABASES[f'shard{_number}'] = _database(_entry)
+    DATABASE_SHARDS.append(f'shard{_number}')
+
+DATABASE_ROUTERS = ['api.sharding.ShardRouter', 'api.routing.PrimaryReplicaRouter']
+
+# Cache backend: locmem (per process, the default), file or redis.
+# CACHE_LOCATION is the directory for file and the URL for redis.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+CACHE_LOCATION = os.getenv('CACHE_LOCATION', '')
+
+# Rendered list/detail responses; see api.response_cache. What happens
+# past RESPONSE_CACHE_MAX_ENTRIES (and AUTH_TOKEN_CACHE_MAX_ENTRIES)
+# depends on the backend: locmem evicts least recently used first, file
+# deletes a random third of its entries, hot or not, and redis ignores
+# the limit (configure maxmemory-policy allkeys-lru on the server instead).
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', '300'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', '10000'))
+
+# Resolved API tokens (api.authentication.CachedTokenAuthentication)
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', '60'))
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('AUTH_TOKEN_CACHE_MAX_ENTRIES', '10000'))
+
+_CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+
+def _cache(name, max_entries, timeout=300):
+    config = {
+        'BACKEND': _CACHE_BACKENDS[CACHE_BACKEND],
+        'TIMEOUT': timeout,
+        'KEY_PREFIX': name,
+    }
+    if CACHE_BACKEND == 'locmem':
+        config['LOCATION'] = name
+    elif CACHE_BACKEND == 'file':
+        config['LOCATION'] = os.path.join(CACHE_LOCATION or '/var/tmp/farm_management_cache', name)
+    else:
+        config['LOCATION'] = CACHE_LOCATION or 'redis://localhost:6379/1'
+    if CACHE_BACKEND != 'redis':
+        config['OPTIONS'] = {'MAX_ENTRIES': max_entries}
+    return config
+
+
+CACHES = {
+    'default': _cache('default', 1000),
+    'responses': _cache('responses', RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TIMEOUT),
+    'auth': _cache('auth', AUTH_TOKEN_CACHE_MAX_ENTRIES, AUTH_TOKEN_CACHE_TIMEOUT),
 }
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -97,9 +204,98 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [],  # Remove global IsAuthenticated
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.BoundedCursorPagination',
+    'PAGE_SIZE': int(os.getenv('API_PAGE_SIZE', '50')),
+}
+
+# Upper bound for the ?page_size= query parameter on list endpoints
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '500'))
+
+# Largest JSON array accepted by the bulk create/update/delete endpoints
+API_MAX_BULK_ITEMS = int(os.getenv('API_MAX_BULK_ITEMS', '1000'))
+
+# Seconds a user's /api/dashboard/ summary stays cached; writes invalidate it early
+DASHBOARD_CACHE_TIMEOUT = int(os.getenv('DASHBOARD_CACHE_TIMEOUT', '300'))
+
+# How many days ahead of a harvest or activity date an alert is raised
+NOTIFICATION_LEAD_DAYS = int(os.getenv('NOTIFICATION_LEAD_DAYS', '7'))
+
+# Crop status engine (see api.lifecycle): a crop moves from Planting to
+# Growing CROP_GROWING_AFTER_DAYS after its planting date and to Harvesting
+# CROP_HARVESTING_LEAD_DAYS before its harvest date. advance_crop_status
+# applies this to every crop; with CROP_STATUS_ON_READ the crop views and
+# dashboard also bring a user's crops up to date once a day before reading.
+CROP_GROWING_AFTER_DAYS = int(os.getenv('CROP_GROWING_AFTER_DAYS', '14'))
+CROP_HARVESTING_LEAD_DAYS = int(os.getenv('CROP_HARVESTING_LEAD_DAYS', '0'))
+CROP_STATUS_ON_READ = os.getenv('CROP_STATUS_ON_READ', 'True') == 'True'
+CROP_STATUS_BATCH_SIZE = int(os.getenv('CROP_STATUS_BATCH_SIZE', '2000'))
+
+# process_outbox worker: rows per chunk, worker threads and retries before giving up
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', '4'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '5'))
+# Processed outbox rows, and rows out of attempts, are deleted by
+# purge_notifications once they are this many days old
+OUTBOX_RETENTION_DAYS = int(os.getenv('OUTBOX_RETENTION_DAYS', '7'))
+
+# Retention: read and unread notifications are kept this many days, then
+# moved to the archive table (or deleted with NOTIFICATION_ARCHIVE=False)
+# by purge_notifications, NOTIFICATION_PURGE_BATCH_SIZE rows per transaction
+NOTIFICATION_RETENTION_READ_DAYS = int(os.getenv('NOTIFICATION_RETENTION_READ_DAYS', '90'))
+NOTIFICATION_RETENTION_UNREAD_DAYS = int(os.getenv('NOTIFICATION_RETENTION_UNREAD_DAYS', '365'))
+NOTIFICATION_ARCHIVE = os.getenv('NOTIFICATION_ARCHIVE', 'True') == 'True'
+NOTIFICATION_PURGE_BATCH_SIZE = int(os.getenv('NOTIFICATION_PURGE_BATCH_SIZE', '1000'))
+
+# Delta sync (/api/sync/): deletes are remembered as tombstones for
+# SYNC_TOMBSTONE_DAYS (purged by purge_notifications), so older sync tokens
+# are refused. Each new token overlaps the previous sync by
+# SYNC_OVERLAP_SECONDS to catch writes that committed while it ran.
+SYNC_TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', '30'))
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', '30'))
+
+# Live notification delivery (/api/notifications/stream/ and /poll/). The
+# in-process backend only wakes streams in the process that created the
+# notification; use api.pubsub.RedisBackend when running several workers.
+NOTIFICATION_PUBSUB_BACKEND = os.getenv('NOTIFICATION_PUBSUB_BACKEND', 'api.pubsub.InProcessBackend')
+NOTIFICATION_PUBSUB_REDIS_URL = os.getenv('NOTIFICATION_PUBSUB_REDIS_URL', 'redis://localhost:6379/0')
+NOTIFICATION_STREAM_HEARTBEAT = int(os.getenv('NOTIFICATION_STREAM_HEARTBEAT', '15'))
+NOTIFICATION_STREAM_SECONDS = int(os.getenv('NOTIFICATION_STREAM_SECONDS', '300'))
+NOTIFICATION_POLL_TIMEOUT = int(os.getenv('NOTIFICATION_POLL_TIMEOUT', '30'))
+
+# Under ASGI, serve GETs of the user, unread-count and crop/resource/activity/
+# notification list endpoints with the async views in api/async_views.py.
+# Their list queries run on ASYNC_DB_WORKERS threads, each holding its own
+# database connection; 0 runs them on the request's thread instead.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', 'False') == 'True'
+ASYNC_DB_WORKERS = int(os.getenv('ASYNC_DB_WORKERS', '8'))
+
+# Requests slower than this are logged with their slowest SQL statements
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', '500'))
+
+# LOG_LEVEL=DEBUG also logs register/login attempts; LOG_FORMAT is json or text
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'api.logs.JsonFormatter'},
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
 }
 
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS').split(',')
@@ -0,0 +1,24 @@
+import axios from 'axios';
+
+// List endpoints return cursor pages. Lists show the first page and ask
+// for `next` when the user wants more, so a long history is never loaded
+// up front.
+export const PAGE_SIZE = 50;
+
+export const fetchPage = async (url, config = {}) => {
+  const response = await axios.get(url, config);
+  return { results: response.data.results || [], next: response.data.next };
+};
+
+// Follows `next` until the last page. Only for on-demand exports such as
+// the PDF reports, which need every row.
+export const fetchAll = async (url, config = {}) => {
+  const items = [];
+  let response = await axios.get(url, { ...config, params: { page_size: 500, ...config.params } });
+  items.push(...(response.data.results || []));
+  while (response.data.next) {
+    response = await axios.get(response.data.next, { headers: config.headers });
+    items.push(...(response.data.results || []));
+  }
+  return items;
+};
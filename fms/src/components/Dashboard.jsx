@@ -6,24 +6,22 @@ const Dashboard = ({ token }) => {
   const [upcomingTasks, setUpcomingTasks] = useState([]);
 
   useEffect(() => {
-    const fetchCrops = async () => {
+    const fetchSummary = async () => {
       try {
-        const response = await axios.get('http://localhost:8000/api/crops/', {
+        // Counted and filtered by the server, so no crop list is needed
+        const response = await axios.get('http://localhost:8000/api/dashboard/', {
           headers: { Authorization: `Token ${token}` },
         });
-        setTotalCrops(response.data.length);
-        const tasks = response.data
-          .filter(crop => new Date(crop.harvest_date) > new Date())
-          .map(crop => ({
-            task: `Harvest ${crop.name} (${crop.variety})`,
-            date: crop.harvest_date,
-          }));
-        setUpcomingTasks(tasks);
+        setTotalCrops(response.data.crops.total);
+        setUpcomingTasks(response.data.upcoming_harvests.map(crop => ({
+          task: `Harvest ${crop.name} (${crop.variety})`,
+          date: crop.harvest_date,
+        })));
       } catch (error) {
-        console.error('Error fetching crops:', error);
+        console.error('Error fetching dashboard:', error);
       }
     };
-    fetchCrops();
+    fetchSummary();
   }, [token]);
 
   return (
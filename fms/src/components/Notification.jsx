@@ -16,9 +16,11 @@ const Notification = () => {
     setIsLoading(true);
     setError('');
     try {
-      const response = await axios.get('http://localhost:8000/api/notifications/');
+      const response = await axios.get('http://localhost:8000/api/notifications/', {
+        params: { page_size: 20 },
+      });
       console.log('Notifications response:', response.data); // Debug
-      setNotifications(response.data || []);
+      setNotifications(response.data.results || []);
     } catch (err) {
       console.error('Fetch error:', err.response?.status, err.response?.data, err.message); // Debug
       setError('Failed to fetch notifications');
@@ -29,8 +31,23 @@ const Notification = () => {
 
   useEffect(() => {
     fetchNotifications(); // Initial fetch
-    const interval = setInterval(fetchNotifications, 60000); // Poll every 60 seconds
-    return () => clearInterval(interval); // Cleanup on unmount
+  }, []);
+
+  // Receive new notifications as server-sent events instead of polling.
+  // EventSource reconnects on its own and resumes from the last event id.
+  useEffect(() => {
+    const token = localStorage.getItem('token');
+    if (!token) return undefined;
+    const source = new EventSource(
+      `http://localhost:8000/api/notifications/stream/?token=${encodeURIComponent(token)}`
+    );
+    source.addEventListener('notification', (event) => {
+      const incoming = JSON.parse(event.data);
+      setNotifications((current) =>
+        current.some((n) => n.id === incoming.id) ? current : [incoming, ...current]
+      );
+    });
+    return () => source.close();
   }, []);
 
   // Close dropdown on route change
@@ -1,9 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchPage, PAGE_SIZE } from '../api';
 
 const Activities = () => {
   const [activities, setActivities] = useState([]);
+  const [nextActivities, setNextActivities] = useState(null);
   const [crops, setCrops] = useState([]);
+  const [nextCrops, setNextCrops] = useState(null);
   const [form, setForm] = useState({
     id: null,
     description: '',
@@ -21,8 +24,22 @@ const Activities = () => {
 
   const fetchCrops = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/crops/');
-      setCrops(response.data);
+      const page = await fetchPage('http://localhost:8000/api/crops/', { params: { page_size: PAGE_SIZE } });
+      setCrops(page.results);
+      setNextCrops(page.next);
+    } catch (err) {
+      setError('Failed to fetch your crops');
+    }
+  };
+
+  const loadMoreCrops = async () => {
+    try {
+      const page = await fetchPage(nextCrops);
+      setCrops((current) => [
+        ...current,
+        ...page.results.filter((crop) => !current.some((known) => known.id === crop.id)),
+      ]);
+      setNextCrops(page.next);
     } catch (err) {
       setError('Failed to fetch your crops');
     }
@@ -31,8 +48,22 @@ const Activities = () => {
   const fetchActivities = async () => {
     setIsLoading(true);
     try {
-      const response = await axios.get('http://localhost:8000/api/activities/');
-      setActivities(response.data);
+      const page = await fetchPage('http://localhost:8000/api/activities/', { params: { page_size: PAGE_SIZE } });
+      setActivities(page.results);
+      setNextActivities(page.next);
+    } catch (err) {
+      setError('Failed to fetch your activities');
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  const loadMoreActivities = async () => {
+    setIsLoading(true);
+    try {
+      const page = await fetchPage(nextActivities);
+      setActivities((current) => [...current, ...page.results]);
+      setNextActivities(page.next);
     } catch (err) {
       setError('Failed to fetch your activities');
     } finally {
@@ -77,6 +108,10 @@ const Activities = () => {
   };
 
   const handleEdit = (activity) => {
+    // The activity's crop may be on a page of crops not loaded yet
+    setCrops((current) =>
+      current.some((crop) => crop.id === activity.crop.id) ? current : [...current, activity.crop]
+    );
     setForm({
       id: activity.id,
       description: activity.description,
@@ -170,6 +205,16 @@ const Activities = () => {
                 </option>
               ))}
             </select>
+            {nextCrops && (
+              <button
+                type="button"
+                onClick={loadMoreCrops}
+                disabled={isLoading}
+                className="mt-2 text-sm text-green-700 hover:underline font-sans disabled:opacity-50"
+              >
+                Load more crops
+              </button>
+            )}
           </div>
         </div>
         <button
@@ -248,6 +293,16 @@ const Activities = () => {
             </table>
           </div>
         )}
+        {nextActivities && (
+          <button
+            type="button"
+            onClick={loadMoreActivities}
+            disabled={isLoading}
+            className="mt-4 w-full p-3 border border-green-600 text-green-700 rounded-lg hover:bg-green-50 font-sans disabled:opacity-50"
+          >
+            Load more activities
+          </button>
+        )}
       </div>
     </div>
   );
@@ -1,8 +1,10 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchPage, PAGE_SIZE } from '../api';
 
 const Crops = () => {
   const [crops, setCrops] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [form, setForm] = useState({
     id: null,
     name: '',
@@ -22,8 +24,22 @@ const Crops = () => {
   const fetchCrops = async () => {
     setIsLoading(true);
     try {
-      const response = await axios.get('http://localhost:8000/api/crops/');
-      setCrops(response.data);
+      const page = await fetchPage('http://localhost:8000/api/crops/', { params: { page_size: PAGE_SIZE } });
+      setCrops(page.results);
+      setNextPage(page.next);
+    } catch (err) {
+      setError('Failed to fetch crops');
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  const loadMoreCrops = async () => {
+    setIsLoading(true);
+    try {
+      const page = await fetchPage(nextPage);
+      setCrops((current) => [...current, ...page.results]);
+      setNextPage(page.next);
     } catch (err) {
       setError('Failed to fetch crops');
     } finally {
@@ -264,6 +280,16 @@ const Crops = () => {
             </table>
           </div>
         )}
+        {nextPage && (
+          <button
+            type="button"
+            onClick={loadMoreCrops}
+            disabled={isLoading}
+            className="mt-4 w-full p-3 border border-green-600 text-green-700 rounded-lg hover:bg-green-50 font-sans disabled:opacity-50"
+          >
+            Load more crops
+          </button>
+        )}
       </div>
     </div>
   );
@@ -1,13 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchAll } from '../api';
 import { useNavigate } from 'react-router-dom';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
 
 const Dashboard = () => {
-  const [crops, setCrops] = useState([]);
-  const [resources, setResources] = useState([]);
-  const [activities, setActivities] = useState([]);
+  const [summary, setSummary] = useState(null);
   const [username, setUsername] = useState('');
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
@@ -26,24 +25,11 @@ const Dashboard = () => {
   const fetchData = async () => {
     setIsLoading(true);
     try {
-      const [userResponse, cropsResponse, resourcesResponse, activitiesResponse] = await Promise.all([
-        axios.get('http://localhost:8000/api/user/', {
-          headers: { Authorization: `Token ${localStorage.getItem('token')}` },
-        }),
-        axios.get('http://localhost:8000/api/crops/', {
-          headers: { Authorization: `Token ${localStorage.getItem('token')}` },
-        }),
-        axios.get('http://localhost:8000/api/resources/', {
-          headers: { Authorization: `Token ${localStorage.getItem('token')}` },
-        }),
-        axios.get('http://localhost:8000/api/activities/', {
-          headers: { Authorization: `Token ${localStorage.getItem('token')}` },
-        }),
-      ]);
-      setUsername(userResponse.data.username);
-      setCrops(cropsResponse.data);
-      setResources(resourcesResponse.data);
-      setActivities(activitiesResponse.data);
+      const response = await axios.get('http://localhost:8000/api/dashboard/', {
+        headers: { Authorization: `Token ${localStorage.getItem('token')}` },
+      });
+      setUsername(response.data.username);
+      setSummary(response.data);
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to fetch dashboard data');
     } finally {
@@ -51,8 +37,12 @@ const Dashboard = () => {
     }
   };
 
-  const generateReport = (reportType) => {
+  const generateReport = async (reportType) => {
     try {
+      // Reports need every row, so the list is only fetched on demand
+      const items = await fetchAll(`http://localhost:8000/api/${reportType}/`, {
+        headers: { Authorization: `Token ${localStorage.getItem('token')}` },
+      });
       const doc = new jsPDF();
       const today = new Date().toISOString().split('T')[0];
 
@@ -67,7 +57,7 @@ const Dashboard = () => {
       let columns, rows;
       if (reportType === 'crops') {
         columns = ['Name', 'Variety', 'Status', 'Planting Date', 'Harvest Date'];
-        rows = crops.map(crop => [
+        rows = items.map(crop => [
           crop.name || '',
           crop.variety || '',
           crop.status || '',
@@ -76,7 +66,7 @@ const Dashboard = () => {
         ]);
       } else if (reportType === 'resources') {
         columns = ['Name', 'Quantity', 'Unit', 'Type', 'Usage Status'];
-        rows = resources.map(res => [
+        rows = items.map(res => [
           res.name || '',
           res.quantity || 0,
           res.unit || 'units',
@@ -85,7 +75,7 @@ const Dashboard = () => {
         ]);
       } else if (reportType === 'activities') {
         columns = ['Description', 'Date', 'Crop'];
-        rows = activities.map(act => [
+        rows = items.map(act => [
           act.description || '',
           act.date || '',
           act.crop?.name || 'Unknown',
@@ -110,13 +100,11 @@ const Dashboard = () => {
     }
   };
 
-  const today = new Date();
-  const upcomingTasks = crops
-    .filter((crop) => crop && new Date(crop.harvest_date) > today)
-    .map((crop) => ({
-      task: `Harvest ${crop.name}`,
-      date: crop.harvest_date,
-    }));
+  const upcomingTasks = (summary?.upcoming_harvests || []).map((crop) => ({
+    task: `Harvest ${crop.name}`,
+    date: crop.harvest_date,
+  }));
+  const activities = summary?.recent_activities || [];
 
   return (
     <div className="w-full max-w-4xl p-6 bg-white rounded-xl shadow-lg mx-auto">
@@ -135,43 +123,43 @@ const Dashboard = () => {
       )}
       {isLoading ? (
         <p className="text-gray-600 font-sans">Loading...</p>
-      ) : (
+      ) : summary && (
         <>
           <div className="grid grid-cols-1 md:grid-cols-2 gap-6">
             <div className="bg-green-50 p-4 rounded-lg shadow-sm">
               <h3 className="text-xl font-medium text-gray-700 mb-4 font-sans">Crops Overview</h3>
               <p className="text-gray-900 font-sans">
-                <span className="font-bold">Total Crops:</span> {crops.length}
+                <span className="font-bold">Total Crops:</span> {summary.crops.total}
               </p>
               <p className="text-gray-900 font-sans">
                 <span className="font-bold">Crops in Planting:</span>{' '}
-                {crops.filter((c) => c.status === 'Planting').length}
+                {summary.crops.by_status.Planting}
               </p>
               <p className="text-gray-900 font-sans">
                 <span className="font-bold">Crops in Growing:</span>{' '}
-                {crops.filter((c) => c.status === 'Growing').length}
+                {summary.crops.by_status.Growing}
               </p>
               <p className="text-gray-900 font-sans">
                 <span className="font-bold">Crops in Harvesting:</span>{' '}
-                {crops.filter((c) => c.status === 'Harvesting').length}
+                {summary.crops.by_status.Harvesting}
               </p>
             </div>
             <div className="bg-green-50 p-4 rounded-lg shadow-sm">
               <h3 className="text-xl font-medium text-gray-700 mb-4 font-sans">Resources Overview</h3>
               <p className="text-gray-900 font-sans">
-                <span className="font-bold">Total Resources:</span> {resources.length}
+                <span className="font-bold">Total Resources:</span> {summary.resources.total}
               </p>
               <p className="text-gray-900 font-sans">
                 <span className="font-bold">Available Resources:</span>{' '}
-                {resources.filter((r) => r.usage_status === 'available').length}
+                {summary.resources.by_usage_status.available}
               </p>
               <p className="text-gray-900 font-sans">
                 <span className="font-bold">In Use:</span>{' '}
-                {resources.filter((r) => r.usage_status === 'in_use').length}
+                {summary.resources.by_usage_status.in_use}
               </p>
               <p className="text-gray-900 font-sans">
                 <span className="font-bold">Depleted:</span>{' '}
-                {resources.filter((r) => r.usage_status === 'depleted').length}
+                {summary.resources.by_usage_status.depleted}
               </p>
             </div>
             <div className="bg-green-50 p-4 rounded-lg shadow-sm">
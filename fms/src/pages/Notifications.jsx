@@ -1,9 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchPage, PAGE_SIZE } from '../api';
 
 const Notifications = () => {
   const [notifications, setNotifications] = useState([]);
+  const [nextPage, setNextPage] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [error, setError] = useState('');
 
   useEffect(() => {
@@ -14,8 +17,11 @@ const Notifications = () => {
     setIsLoading(true);
     setError('');
     try {
-      const response = await axios.get('http://localhost:8000/api/notifications/');
-      setNotifications(response.data || []);
+      const page = await fetchPage('http://localhost:8000/api/notifications/', {
+        params: { page_size: PAGE_SIZE },
+      });
+      setNotifications(page.results);
+      setNextPage(page.next);
     } catch (err) {
       console.error('Fetch error:', err.response?.status, err.response?.data);
       setError('Failed to fetch notifications');
@@ -24,10 +30,23 @@ const Notifications = () => {
     }
   };
 
+  const loadMoreNotifications = async () => {
+    setIsLoadingMore(true);
+    try {
+      const page = await fetchPage(nextPage);
+      setNotifications((current) => [...current, ...page.results]);
+      setNextPage(page.next);
+    } catch (err) {
+      setError('Failed to fetch notifications');
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const markAsRead = async (id) => {
     try {
       await axios.post(`http://localhost:8000/api/notifications/${id}/read/`);
-      setNotifications(notifications.map(n => n.id === id ? { ...n, is_read: true } : n));
+      setNotifications((current) => current.map(n => n.id === id ? { ...n, is_read: true } : n));
     } catch (err) {
       setError('Failed to mark notification as read');
     }
@@ -82,6 +101,16 @@ const Notifications = () => {
               ))}
             </tbody>
           </table>
+          {nextPage && (
+            <button
+              type="button"
+              onClick={loadMoreNotifications}
+              disabled={isLoadingMore}
+              className="mt-4 w-full p-3 border border-green-600 text-green-700 rounded-lg hover:bg-green-50 font-sans disabled:opacity-50"
+            >
+              Load more notifications
+            </button>
+          )}
         </div>
       )}
     </div>
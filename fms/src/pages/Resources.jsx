@@ -1,5 +1,6 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
+import { fetchPage, PAGE_SIZE } from '../api';
 import { useNavigate } from 'react-router-dom';
 
 const Resources = () => {
@@ -10,8 +11,8 @@ const Resources = () => {
     quantity: '',
     type: '',
     unit: 'units',
-    usage_status: 'available',
   });
+  const [nextPage, setNextPage] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
@@ -44,10 +45,27 @@ const Resources = () => {
   const fetchResources = async () => {
     setIsLoading(true);
     try {
-      const response = await axios.get('http://localhost:8000/api/resources/', {
+      const page = await fetchPage('http://localhost:8000/api/resources/', {
         headers: { Authorization: `Token ${localStorage.getItem('token')}` },
+        params: { page_size: PAGE_SIZE },
       });
-      setResources(response.data);
+      setResources(page.results);
+      setNextPage(page.next);
+    } catch (err) {
+      setError(err.response?.data?.detail || 'Failed to fetch resources');
+    } finally {
+      setIsLoading(false);
+    }
+  };
+
+  const loadMoreResources = async () => {
+    setIsLoading(true);
+    try {
+      const page = await fetchPage(nextPage, {
+        headers: { Authorization: `Token ${localStorage.getItem('token')}` },
+      });
+      setResources((current) => [...current, ...page.results]);
+      setNextPage(page.next);
     } catch (err) {
       setError(err.response?.data?.detail || 'Failed to fetch resources');
     } finally {
@@ -72,7 +90,6 @@ const Resources = () => {
         quantity: parseFloat(form.quantity),
         type: form.type,
         unit: form.unit,
-        usage_status: form.usage_status,
       };
 
       if (form.id) {
@@ -87,15 +104,14 @@ const Resources = () => {
         setSuccess('Resource added successfully!');
       }
       fetchResources();
-      setForm({ id: '', name: '', quantity: '', type: '', unit: 'units', usage_status: 'available' });
+      setForm({ id: '', name: '', quantity: '', type: '', unit: 'units' });
     } catch (err) {
       setError(
         err.response?.data?.detail ||
         err.response?.data?.unit?.[0] ||
-        err.response?.data?.usage_status?.[0] ||
         'Operation failed'
       );
-      setForm({ id: '', name: '', quantity: '', type: '', unit: 'units', usage_status: 'available' });
+      setForm({ id: '', name: '', quantity: '', type: '', unit: 'units' });
     } finally {
       setIsLoading(false);
     }
@@ -108,7 +124,6 @@ const Resources = () => {
       quantity: resource.quantity,
       type: resource.type,
       unit: resource.unit || 'units',
-      usage_status: resource.usage_status || 'available',
     });
   };
 
@@ -216,26 +231,6 @@ const Resources = () => {
                 disabled={isLoading}
               />
             </div>
-            <div>
-              <label className="block text-gray-700 mb-2 font-sans font-medium" htmlFor="usage_status">
-                Usage Status
-              </label>
-              <select
-                id="usage_status"
-                name="usage_status"
-                value={form.usage_status}
-                onChange={handleInputChange}
-                className="w-full p-3 border border-green-500 rounded-lg text-gray-900 bg-white focus:outline-none focus:ring-2 focus:ring-green-500 shadow-sm font-sans"
-                required
-                disabled={isLoading}
-              >
-                {usageStatusOptions.map((option) => (
-                  <option key={option.value} value={option.value}>
-                    {option.label}
-                  </option>
-                ))}
-              </select>
-            </div>
           </div>
           <button
             type="submit"
@@ -319,6 +314,16 @@ const Resources = () => {
             </table>
           </div>
         )}
+        {nextPage && (
+          <button
+            type="button"
+            onClick={loadMoreResources}
+            disabled={isLoading}
+            className="mt-4 w-full p-3 border border-green-600 text-green-700 rounded-lg hover:bg-green-50 font-sans disabled:opacity-50"
+          >
+            Load more resources
+          </button>
+        )}
       </div>
     </div>
   );